@@ -1,12 +1,18 @@
 import calendar
 import os
+import sys
 import time
 from datetime import datetime, timedelta
 
 import pandas as pd
-import requests
 from mecoda_minka import get_dfs, get_obs
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.client import MinkaSession
+from common.counts import count_job, counts_wide, get_counts
+from common.instrumentation import stage, write_report
+from common.storage import read_table, write_table
+
 try:
     directory = f"{os.environ['DASHBOARDS']}/arsinoe"
 except KeyError:
@@ -77,6 +83,14 @@ places = {
 
 main_project = 186
 
+# Días recientes que se vuelven a calcular en cada ejecución (la API puede
+# recibir observaciones con fecha de creación pasada) y tamaño del bloque
+# de días que se guarda en el checkpoint
+REVISION_DAYS = 30
+CHECKPOINT_DAYS = 30
+# Un checkpoint más antiguo es de una ejecución abandonada y no se continúa
+CHECKPOINT_MAX_AGE = 12 * 3600
+
 
 def get_month_dict(years: list) -> dict:
     current_year = datetime.now().year
@@ -93,108 +107,52 @@ def get_month_dict(years: list) -> dict:
 
 
 # acumulados mensuales
-def _get_totals(place_id, start_date, end_date, session=None):
-    if session is None:
-        session = requests.Session()
-    if place_id is not None:
-        url_obs = f"{API_PATH}/observations?project_id={place_id}&created_d1={start_date}&created_d2={end_date}"
-        url_spe = f"{API_PATH}/observations/species_counts?project_id={place_id}&created_d1={start_date}&created_d2={end_date}"
-        url_part = f"{API_PATH}/observations/observers?project_id={place_id}&created_d1={start_date}&created_d2={end_date}"
-        url_ident = f"{API_PATH}/observations/identifiers?project_id={place_id}&created_d1={start_date}&created_d2={end_date}"
-    else:
-        url_obs = f"{API_PATH}/observations?project_id={main_project}&created_d1={start_date}&created_d2={end_date}"
-        url_spe = f"{API_PATH}/observations/species_counts?project_id={main_project}&created_d1={start_date}&created_d2={end_date}"
-        url_part = f"{API_PATH}/observations/observers?project_id={main_project}&created_d1={start_date}&created_d2={end_date}"
-        url_ident = f"{API_PATH}/observations/identifiers?project_id={main_project}&created_d1={start_date}&created_d2={end_date}"
-    session = requests.Session()
-    total_obs = session.get(url_obs).json()["total_results"]
-    total_spe = session.get(url_spe).json()["total_results"]
-    total_part = session.get(url_part).json()["total_results"]
-    total_ident = session.get(url_ident).json()["total_results"]
-
-    return total_obs, total_spe, total_part, total_ident
-
-
-def get_monthly_metrics(places, meses, session=None):
-    if session is None:
-        session = requests.Session()
-    total_metrics = []
+def _get_totals_jobs(place_id, start_date, end_date, **keys):
+    if place_id is None:
+        place_id = main_project
+    params = {
+        "project_id": place_id,
+        "created_d1": start_date,
+        "created_d2": end_date,
+    }
+    return [
+        count_job(endpoint, params, **keys)
+        for endpoint in ["observations", "species", "observers", "identifiers"]
+    ]
+
+
+def _get_place_metrics(places, meses, cumulative, session=None):
+    jobs = []
     for place_k, place_v in places.items():
+        # Sin places se usa el proyecto principal; con varios se suman
+        place_ids = place_v if len(place_v) > 0 else [None]
         for key, value in meses.items():
-            total = {}
-            total_obs = 0
-            total_spe = 0
-            total_part = 0
-            total_ident = 0
-            if len(place_v) == 0:
-                total_obs, total_spe, total_part, total_ident = _get_totals(
-                    None, f"{key}-01", f"{key}-{value}", session
-                )
-            elif len(place_v) == 1:
-                total_obs, total_spe, total_part, total_ident = _get_totals(
-                    place_v[0], f"{key}-01", f"{key}-{value}", session
-                )
-            elif len(place_v) > 1:
-                for p in place_v:
-                    obs, spe, part, ident = _get_totals(
-                        p, f"{key}-01", f"{key}-{value}", session
+            start_date = "" if cumulative else f"{key}-01"
+            for p in place_ids:
+                jobs.extend(
+                    _get_totals_jobs(
+                        p, start_date, f"{key}-{value}", city=place_k, month=key
                     )
-                    total_obs += obs
-                    total_spe += spe
-                    total_part += part
-                    total_ident += ident
-
-            total["city"] = place_k
-            total["month"] = key
-            total["total_obs"] = total_obs
-            total["total_spe"] = total_spe
-            total["total_part"] = total_part
-            total["total_ident"] = total_ident
-            total_metrics.append(total)
+                )
 
-    df = pd.DataFrame(total_metrics)
-    return df
+    df = counts_wide(get_counts(jobs, session=session), index=["city", "month"])
+    df = df.rename(
+        columns={
+            "observations": "total_obs",
+            "species": "total_spe",
+            "observers": "total_part",
+            "identifiers": "total_ident",
+        }
+    )
+    return df[["city", "month", "total_obs", "total_spe", "total_part", "total_ident"]]
 
 
-def get_cumulative_monthly_metrics(places, meses, session=None):
-    if session is None:
-        session = requests.Session()
-    total_metrics = []
-    for place_k, place_v in places.items():
-        for key, value in meses.items():
-            total = {}
-            total_obs = 0
-            total_spe = 0
-            total_part = 0
-            total_id = 0
-            if len(place_v) == 0:
-                total_obs, total_spe, total_part, total_id = _get_totals(
-                    None, f"", f"{key}-{value}", session
-                )
-            elif len(place_v) == 1:
-                total_obs, total_spe, total_part, total_id = _get_totals(
-                    place_v[0], f"", f"{key}-{value}", session
-                )
-            elif len(place_v) > 1:
-                for p in place_v:
-                    obs, spe, part, iden = _get_totals(
-                        p, f"", f"{key}-{value}", session
-                    )
-                    total_obs += obs
-                    total_spe += spe
-                    total_part += part
-                    total_id += iden
+def get_monthly_metrics(places, meses, session=None):
+    return _get_place_metrics(places, meses, cumulative=False, session=session)
 
-            total["city"] = place_k
-            total["month"] = key
-            total["total_obs"] = total_obs
-            total["total_spe"] = total_spe
-            total["total_part"] = total_part
-            total["total_ident"] = total_id
-            total_metrics.append(total)
 
-    df = pd.DataFrame(total_metrics)
-    return df
+def get_cumulative_monthly_metrics(places, meses, session=None):
+    return _get_place_metrics(places, meses, cumulative=True, session=session)
 
 
 def get_obs_from_project_places(places):
@@ -208,7 +166,7 @@ def get_obs_from_project_places(places):
             total_obs.extend(obs)
         if len(total_obs) > 0:
             df1, __ = get_dfs(total_obs)
-            df1.to_csv(f"{directory}/data/obs_{v[i]}.csv", index=False)
+            write_table(df1, f"{directory}/data/obs_{v[i]}.csv")
             # df2.to_csv(f"{directory}/data/photos_{k}.csv")
         else:
             print(f"No hay observaciones para {v[i]}")
@@ -217,122 +175,124 @@ def get_obs_from_project_places(places):
 def get_obs_from_main_project(main_project):
     obs = get_obs(id_project=main_project)
     df_obs, df_photos = get_dfs(obs)
-    df_obs.to_csv(f"{directory}/data/{main_project}_obs.csv", index=False)
-    df_photos.to_csv(f"{directory}/data/{main_project}_photos.csv", index=False)
-
-
-def update_main_metrics(proj_id, df_main_metrics, session=None):
-    # Fecha de inicio del proyecto
-    fecha_inicio_proyecto = datetime(2023, 10, 16)
-
-    results = []
-
-    observations = f"{API_PATH}/observations?"
-    species = f"{API_PATH}/observations/species_counts?"
-    observers = f"{API_PATH}/observations/observers?"
-    identifiers = f"{API_PATH}/observations/identifiers?"
-
-    # Crear una sesión de requests si no se proporciona
-    if session is None:
-        session = requests.Session()
-
-    # Fecha inicial para la actualización
-    day = fecha_inicio_proyecto
-
-    # Calcular el rango de días desde la fecha de inicio hasta hoy
-    rango_temporal = (datetime.today().date() - day.date()).days
+    write_table(df_obs, f"{directory}/data/{main_project}_obs.csv")
+    write_table(df_photos, f"{directory}/data/{main_project}_photos.csv")
 
-    for i in range(rango_temporal + 1):
-        print(f"Procesando día {i}: {day.strftime('%Y-%m-%d')}")
-        st_day = day.strftime("%Y-%m-%d")
 
+def _get_daily_metrics(proj_id, days, session=None):
+    jobs = []
+    for st_day in days:
         params = {
             "project_id": proj_id,
             "created_d2": st_day,
             "order": "desc",
             "order_by": "created_at",
         }
+        for endpoint in ["observations", "species", "observers", "identifiers"]:
+            jobs.append(count_job(endpoint, params, date=st_day))
 
-        # Realizar las solicitudes a la API
-        total_obs = (
-            session.get(observations, params=params).json().get("total_results", 0)
-        )
-        total_species = (
-            session.get(species, params=params).json().get("total_results", 0)
-        )
-        total_participants = (
-            session.get(observers, params=params).json().get("total_results", 0)
-        )
-        total_identifiers = (
-            session.get(identifiers, params=params).json().get("total_results", 0)
-        )
+    result_df = counts_wide(get_counts(jobs, session=session), index="date")
+    return result_df[["date", "observations", "species", "observers", "identifiers"]]
 
-        result = {
-            "date": st_day,
-            "observations": total_obs,
-            "species": total_species,
-            "observers": total_participants,
-            "identifiers": total_identifiers,
-        }
 
-        results.append(result)
-        day += timedelta(days=1)
+def main_metrics_checkpoint(proj_id) -> str:
+    return f"{directory}/data/{proj_id}_main_metrics.partial.csv"
+
+
+def update_main_metrics(
+    proj_id, df_main_metrics, session=None, revision_days=REVISION_DAYS
+):
+    """
+    Actualiza las métricas acumuladas por día del proyecto.
+
+    Conserva los días de `df_main_metrics` anteriores a los últimos
+    `revision_days` días y sólo recalcula esa ventana y los días nuevos.
+    El progreso se guarda por bloques en el checkpoint del proyecto, de modo
+    que una ejecución interrumpida continúa donde se quedó (aunque sea al día
+    siguiente). El checkpoint lo borra quien guarda el resultado, después de
+    escribirlo.
+    """
+    # Fecha de inicio del proyecto
+    fecha_inicio_proyecto = datetime(2023, 10, 16)
+
+    # Calcular el rango de días desde la fecha de inicio hasta hoy
+    rango_temporal = (datetime.today().date() - fecha_inicio_proyecto.date()).days
+    days = [
+        (fecha_inicio_proyecto + timedelta(days=i)).strftime("%Y-%m-%d")
+        for i in range(rango_temporal + 1)
+    ]
+
+    # Días cerrados: fuera de la ventana de revisión
+    fecha_revision = (datetime.today() - timedelta(days=revision_days)).strftime(
+        "%Y-%m-%d"
+    )
+    if len(df_main_metrics) > 0:
+        df_main_metrics["date"] = pd.to_datetime(
+            df_main_metrics["date"], format="mixed"
+        ).dt.strftime("%Y-%m-%d")
+        antiguo = df_main_metrics[df_main_metrics["date"] < fecha_revision]
+    else:
+        antiguo = pd.DataFrame(columns=["date"])
+
+    # Checkpoint de la ejecución interrumpida, si es reciente
+    checkpoint = main_metrics_checkpoint(proj_id)
+    if (
+        os.path.exists(checkpoint)
+        and time.time() - os.path.getmtime(checkpoint) > CHECKPOINT_MAX_AGE
+    ):
+        os.remove(checkpoint)
+    if os.path.exists(checkpoint):
+        hecho = pd.read_csv(checkpoint)
+    else:
+        hecho = pd.DataFrame(columns=["date"])
+
+    calculados = set(antiguo["date"]) | set(hecho["date"])
+    days = [day for day in days if day not in calculados]
+    print(
+        f"Procesando {len(days)} días (conservados {len(antiguo)}, checkpoint {len(hecho)})"
+    )
 
-    result_df = pd.DataFrame(results)
+    for i in range(0, len(days), CHECKPOINT_DAYS):
+        bloque = _get_daily_metrics(proj_id, days[i : i + CHECKPOINT_DAYS], session)
+        bloque.to_csv(
+            checkpoint,
+            mode="a",
+            header=not os.path.exists(checkpoint),
+            index=False,
+        )
+        print(f"Checkpoint: {bloque['date'].iloc[-1]}")
+
+    if os.path.exists(checkpoint):
+        hecho = pd.read_csv(checkpoint)
+    result_df = (
+        pd.concat([antiguo, hecho], ignore_index=True)
+        .drop_duplicates(subset="date", keep="last")
+        .sort_values(by="date")
+        .reset_index(drop=True)
+    )
 
     print("Updated main metrics")
-    return result_df
+    return result_df[["date", "observations", "species", "observers", "identifiers"]]
 
 
 def get_metrics_cities(main_project, places, session=None):
-    result = []
     del places["ARSINOE"]
 
-    species = "https://api.minka-sdg.org/v1/observations/species_counts?"
-    observers = "https://api.minka-sdg.org/v1/observations/observers?"
-    observations = "https://api.minka-sdg.org/v1/observations?"
-    if session is None:
-        session = requests.Session()
-
+    jobs = []
     for k, v in places.items():
-        if len(v) == 1:
-            url1 = f"{species}&project_id={v[0]}"
-            total_species = session.get(url1).json()["total_results"]
+        # Las ciudades con varios proyectos suman sus totales
+        for place_v in v:
+            params = {"project_id": place_v}
+            for endpoint in ["species", "observers", "observations"]:
+                jobs.append(count_job(endpoint, params, city=k))
 
-            url2 = f"{observers}&project_id={v[0]}"
-            total_participants = session.get(url2).json()["total_results"]
-
-            url3 = f"{observations}&project_id={v[0]}"
-            total_obs = session.get(url3).json()["total_results"]
-
-        else:
-            total_species = 0
-            total_participants = 0
-            total_obs = 0
-
-            for place_v in v:
-                url1 = f"{species}&project_id={place_v}"
-                total_species += session.get(url1).json()["total_results"]
-
-                url2 = f"{observers}&project_id={place_v}"
-                total_participants += session.get(url2).json()["total_results"]
-
-                url3 = f"{observations}&project_id={place_v}"
-                total_obs += session.get(url3).json()["total_results"]
-        data = {
-            "city": k,
-            "species": total_species,
-            "observers": total_participants,
-            "observations": total_obs,
-        }
-        result.append(data)
-    main_metrics = pd.DataFrame(result)
-    return main_metrics
+    main_metrics = counts_wide(get_counts(jobs, session=session), index="city")
+    return main_metrics[["city", "species", "observers", "observations"]]
 
 
 def get_num_species(main_project, session=None):
     if session is None:
-        session = requests.Session()
+        session = MinkaSession()
     num_species = []
     base_url = "https://api.minka-sdg.org/v1/observations/species_counts?"
     start_date = datetime(2023, 10, 16)
@@ -356,26 +316,8 @@ def get_num_species(main_project, session=None):
     return df_introduced_by_month
 
 
-def _get_species(user_name, proj_id, session=None):
-    if session is None:
-        session = requests.Session()
-    species = f"{API_PATH}/observations/species_counts"
-    params = {"project_id": proj_id, "user_login": user_name}
-    return session.get(species, params=params).json()["total_results"]
-
-
-def _get_identifiers(user_name, proj_id, session=None):
-    if session is None:
-        session = requests.Session()
-    identifiers = f"{API_PATH}/observations/identifiers"
-    params = {"project_id": proj_id, "user_login": user_name}
-    return session.get(identifiers, params=params).json()["total_results"]
-
-
 def get_participation_df(main_project, session=None):
-    if session is None:
-        session = requests.Session()
-    df_obs = pd.read_csv(f"{directory}/data/{main_project}_obs.csv")
+    df_obs = read_table(f"{directory}/data/{main_project}_obs.csv")
     pt_users = (
         df_obs["user_login"]
         .value_counts()
@@ -383,81 +325,95 @@ def get_participation_df(main_project, session=None):
         .reset_index(drop=False)
         .rename(columns={"user_login": "participant", "count": "observacions"})
     )
-    pt_users["identificacions"] = pt_users["participant"].apply(
-        lambda x: _get_identifiers(x, main_project, session)
-    )
-    pt_users["espècies"] = pt_users["participant"].apply(
-        lambda x: _get_species(x, main_project, session)
+
+    jobs = []
+    for user_name in pt_users["participant"]:
+        params = {"project_id": main_project, "user_login": user_name}
+        jobs.append(count_job("identifiers", params, participant=user_name))
+        jobs.append(count_job("species", params, participant=user_name))
+    df_counts = counts_wide(get_counts(jobs, session=session), index="participant")
+
+    pt_users = pd.merge(pt_users, df_counts, on="participant", how="left").rename(
+        columns={"identifiers": "identificacions", "species": "espècies"}
     )
-    return pt_users
+    return pt_users[["participant", "observacions", "identificacions", "espècies"]]
 
 
 if __name__ == "__main__":
     start_time = time.time()
 
-    session = requests.Session()
+    session = MinkaSession()
 
-    print("Actualizando métricas acumulativas del proyecto principal")
-    try:
-        df_main_metrics = pd.read_csv(
-            f"{directory}/data/{main_project}_main_metrics.csv"
-        )
+    with stage("main_metrics"):
+        print("Actualizando métricas acumulativas del proyecto principal")
+        try:
+            df_main_metrics = pd.read_csv(
+                f"{directory}/data/{main_project}_main_metrics.csv"
+            )
+        except FileNotFoundError:
+            print("No se encontraron datos previos. Descargando métricas desde cero.")
+            df_main_metrics = pd.DataFrame()
         result_df = update_main_metrics(main_project, df_main_metrics, session)
         result_df.to_csv(
             f"{directory}/data/{main_project}_main_metrics.csv", index=False
         )
-    except FileNotFoundError:
-        print("No se encontraron datos previos. Descargando métricas desde cero.")
-        df_main_metrics = update_main_metrics(main_project, pd.DataFrame(), session)
-        df_main_metrics.to_csv(
-            f"{directory}/data/{main_project}_main_metrics.csv", index=False
-        )
-
-    print("Descargando métricas mensuales de los places del proyecto")
-    current_year = datetime.now().year
-    years = list(range(2023, current_year + 1))
-    meses = get_month_dict(years)
+        if os.path.exists(main_metrics_checkpoint(main_project)):
+            os.remove(main_metrics_checkpoint(main_project))
 
-    df = get_monthly_metrics(places, meses, session)
-    df.to_csv(f"{directory}/data/city_monthly_metrics.csv", index=False)
+    with stage("monthly_metrics"):
+        print("Descargando métricas mensuales de los places del proyecto")
+        current_year = datetime.now().year
+        years = list(range(2023, current_year + 1))
+        meses = get_month_dict(years)
 
-    print("Descargando métricas mensuales acumuladas de los places del proyecto")
-    df_cumulative = get_cumulative_monthly_metrics(
-        places=places, meses=meses, session=session
-    )
-    df_cumulative.to_csv(
-        f"{directory}/data/cumulative_city_monthly_metrics.csv", index=False
-    )
+        df = get_monthly_metrics(places, meses, session)
+        df.to_csv(f"{directory}/data/city_monthly_metrics.csv", index=False)
 
-    print("Descargando métricas de ciudades")
-    main_metrics_by_city = get_metrics_cities(main_project, places, session)
-    main_metrics_by_city.to_csv(f"{directory}/data/city_total_metrics.csv", index=False)
+        print("Descargando métricas mensuales acumuladas de los places del proyecto")
+        df_cumulative = get_cumulative_monthly_metrics(
+            places=places, meses=meses, session=session
+        )
+        df_cumulative.to_csv(
+            f"{directory}/data/cumulative_city_monthly_metrics.csv", index=False
+        )
 
-    print("Descargando observaciones de proyecto principal")
-    get_obs_from_main_project(main_project)
-    get_obs_from_project_places(places)
+    with stage("cities"):
+        print("Descargando métricas de ciudades")
+        main_metrics_by_city = get_metrics_cities(main_project, places, session)
+        main_metrics_by_city.to_csv(
+            f"{directory}/data/city_total_metrics.csv", index=False
+        )
 
-    print("Incluyendo school en datos del main project")
-    df_obs = pd.read_csv(f"{directory}/data/{main_project}_obs.csv")
-    for school, school_id in places.items():
-        try:
-            df_city = pd.read_csv(f"{directory}/data/obs_{school_id[0]}.csv")
-            df_obs.loc[df_obs["id"].isin(df_city["id"].to_list()), "address"] = (
-                school_id[0]
-            )
-        except FileNotFoundError:
-            print(f"No se encontraron datos para {school}")
-    df_obs.to_csv(f"{directory}/data/{main_project}_obs.csv", index=False)
+    with stage("observations"):
+        print("Descargando observaciones de proyecto principal")
+        get_obs_from_main_project(main_project)
+        get_obs_from_project_places(places)
+
+        print("Incluyendo school en datos del main project")
+        df_obs = read_table(f"{directory}/data/{main_project}_obs.csv")
+        for school, school_id in places.items():
+            try:
+                df_city = read_table(f"{directory}/data/obs_{school_id[0]}.csv")
+                df_obs.loc[df_obs["id"].isin(df_city["id"].to_list()), "address"] = (
+                    school_id[0]
+                )
+            except FileNotFoundError:
+                print(f"No se encontraron datos para {school}")
+        write_table(df_obs, f"{directory}/data/{main_project}_obs.csv")
+
+    with stage("species"):
+        print("Descargando especies introducidas")
+        df_introduced_by_month = get_num_species(main_project, session)
+        df_introduced_by_month.to_csv(
+            f"{directory}/data/introduced_by_month.csv", index=False
+        )
 
-    print("Descargando especies introducidas")
-    df_introduced_by_month = get_num_species(main_project, session)
-    df_introduced_by_month.to_csv(
-        f"{directory}/data/introduced_by_month.csv", index=False
-    )
+    with stage("participants"):
+        print("Descargando tabla de participantes")
+        pt_users = get_participation_df(main_project)
+        pt_users.to_csv(f"{directory}/data/{main_project}_observers.csv", index=False)
 
-    print("Descargando tabla de participantes")
-    pt_users = get_participation_df(main_project)
-    pt_users.to_csv(f"{directory}/data/{main_project}_observers.csv", index=False)
+    write_report(f"{directory}/data/run_report.json")
 
     end_time = time.time()
     execution_time = end_time - start_time
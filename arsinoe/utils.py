@@ -1,6 +1,7 @@
 import datetime
 import math
 import os
+import sys
 
 import folium
 import numpy as np
@@ -14,6 +15,15 @@ from geopy.geocoders import Nominatim
 from markdownlit import mdlit
 from mecoda_minka import get_dfs, get_obs
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.client import get_session
+from common.project_metrics import (
+    get_previous_totals,
+    get_project_totals,
+    get_projects_totals,
+)
+from common.storage import read_table
+
 try:
     directory = f"{os.environ['DASHBOARDS']}/arsinoe"
 except KeyError:
@@ -23,6 +33,8 @@ except KeyError:
 
 base_url = "https://minka-sdg.org"
 api_path = f"https://api.minka-sdg.org/v1"
+session = get_session()
+METRIC_ENDPOINTS = ["observations", "species", "observers", "identifiers"]
 colors = ["#119239", "#562579", "#f4c812", "#f07d12", "#e61b1f", "#1e388d"]
 
 
@@ -88,77 +100,29 @@ schools = {
 # Definición de funciones
 @st.cache_data(ttl=360)
 def get_main_metrics(proj_id):
-    session = requests.Session()
-    observations = "https://api.minka-sdg.org/v1/observations?"
-    url3 = f"{observations}&project_id={proj_id}"
-    total_obs = session.get(url3).json()["total_results"]
-
-    species = "https://api.minka-sdg.org/v1/observations/species_counts?"
-    url1 = f"{species}&project_id={proj_id}"
-    total_species = session.get(url1).json()["total_results"]
-
-    observers = "https://api.minka-sdg.org/v1/observations/observers?"
-    url2 = f"{observers}&project_id={proj_id}"
-    total_participants = session.get(url2).json()["total_results"]
-
-    identifiers = "https://api.minka-sdg.org/v1/observations/identifiers?"
-    url4 = f"{identifiers}&project_id={proj_id}"
-    total_identifiers = session.get(url4).json()["total_results"]
-
-    return total_obs, total_species, total_participants, total_identifiers
+    totals = get_project_totals(proj_id, METRIC_ENDPOINTS)
+    return (
+        totals["observations"],
+        totals["species"],
+        totals["observers"],
+        totals["identifiers"],
+    )
 
 
 @st.cache_data(ttl=360)
 def get_month_week_metrics(proj_id):
-    session = requests.Session()
-    last_week_date = (datetime.datetime.today() - datetime.timedelta(days=30)).strftime(
-        "%Y-%m-%d"
+    totals = get_previous_totals(proj_id, days=30, endpoints=METRIC_ENDPOINTS)
+    return (
+        totals["observations"],
+        totals["species"],
+        totals["observers"],
+        totals["identifiers"],
     )
 
-    species = "https://api.minka-sdg.org/v1/observations/species_counts?"
-    url1 = f"{species}&project_id={proj_id}&d2={last_week_date}&order=desc&order_by=created_at"
-    lw_spe = session.get(url1).json()["total_results"]
-
-    observers = "https://api.minka-sdg.org/v1/observations/observers?"
-    url2 = f"{observers}&project_id={proj_id}&d2={last_week_date}&order=desc&order_by=created_at"
-    lw_part = session.get(url2).json()["total_results"]
-
-    observations = "https://api.minka-sdg.org/v1/observations?"
-    url3 = f"{observations}&project_id={proj_id}&d2={last_week_date}&order=desc&order_by=created_at"
-    lw_obs = session.get(url3).json()["total_results"]
-
-    identifiers = f"https://api.minka-sdg.org/v1/observations/identifiers?"
-    url4 = f"{identifiers}project_id={proj_id}&d2={last_week_date}"
-    lw_ident = session.get(url4).json()["total_results"]
-
-    return lw_obs, lw_spe, lw_part, lw_ident
-
 
 @st.cache_data(ttl=360)
 def get_metrics_cities(codes):
-    result = []
-
-    for k, v in codes.items():
-        species = "https://api.minka-sdg.org/v1/observations/species_counts?"
-        url1 = f"{species}&project_id={k}"
-        total_species = requests.get(url1).json()["total_results"]
-
-        observers = "https://api.minka-sdg.org/v1/observations/observers?"
-        url2 = f"{observers}&project_id={k}"
-        total_participants = requests.get(url2).json()["total_results"]
-
-        observations = "https://api.minka-sdg.org/v1/observations?"
-        url3 = f"{observations}&project_id={k}"
-        total_obs = requests.get(url3).json()["total_results"]
-
-        data = {
-            "ciutat": v,
-            "espècies": total_species,
-            "participants": total_participants,
-            "observacions": total_obs,
-        }
-        result.append(data)
-    main_metrics = pd.DataFrame(result)
+    main_metrics = get_projects_totals(codes, key="ciutat")
     return main_metrics
 
 
@@ -367,7 +331,7 @@ def create_markercluster(df, center=None, zoom=9):
 
 @st.cache_data(ttl=360)
 def get_total_obs(main_project):
-    df_total = pd.read_csv(f"{directory}/data/{main_project}_obs.csv")
+    df_total = read_table(f"{directory}/data/{main_project}_obs.csv")
     return df_total
 
 
@@ -387,7 +351,7 @@ def convert_table(df, index):
 @st.cache_data(ttl=360)
 def get_table_count(url, parameter):
     if parameter == "identifiers":
-        results = requests.get(url).json()["results"]
+        results = session.get(url).json()["results"]
         total = []
         for result in results:
             identifiers_count = {
@@ -400,15 +364,15 @@ def get_table_count(url, parameter):
 
     elif parameter == "observers":
         results = []
-        total_results = requests.get(url).json()["total_results"]
+        total_results = session.get(url).json()["total_results"]
 
         if total_results > 500:
             num = math.ceil(total_results / 500)
             for i in range(1, num + 1):
                 page_url = f"{url}&page={i}"
-                results.extend(requests.get(page_url).json()["results"])
+                results.extend(session.get(page_url).json()["results"])
         else:
-            results = requests.get(url).json()["results"]
+            results = session.get(url).json()["results"]
 
         total = []
         for result in results:
@@ -422,15 +386,15 @@ def get_table_count(url, parameter):
 
     elif parameter == "species":
         results = []
-        total_results = requests.get(url).json()["total_results"]
+        total_results = session.get(url).json()["total_results"]
 
         if total_results > 500:
             num = math.ceil(total_results / 500)
             for i in range(1, num + 1):
                 page_url = f"{url}&page={i}"
-                results.extend(requests.get(page_url).json()["results"])
+                results.extend(session.get(page_url).json()["results"])
         else:
-            results = requests.get(url).json()["results"]
+            results = session.get(url).json()["results"]
 
         total = []
         for result in results:
@@ -604,12 +568,12 @@ def fig_area_evolution(df, field, title, color, start_date=None, end_date=None):
 
 # @st.cache_data(ttl=360)
 def get_last_species(city, main_project):
-    df = pd.read_csv(f"{directory}/data/obs_{city}.csv")
+    df = read_table(f"{directory}/data/obs_{city}.csv")
     df2 = df.drop_duplicates(subset=["taxon_id"], keep="first")
     result = df2.sort_values(by=["created_at"], ascending=False)[
         ["taxon_name", "created_at", "id"]
     ].head(5)
-    df_photos = pd.read_csv(f"{directory}/data/{main_project}_photos.csv")
+    df_photos = read_table(f"{directory}/data/{main_project}_photos.csv")
     result["image"] = result["id"].apply(
         lambda x: df_photos[df_photos["id"] == x]["photos_medium_url"].head(1).item()
     )
@@ -621,16 +585,16 @@ def get_last_species(city, main_project):
 
 @st.cache_data(ttl=360)
 def get_num_species_by_city(city):
-    df = pd.read_csv(f"{directory}/data/obs_{city}.csv")
+    df = read_table(f"{directory}/data/obs_{city}.csv")
     df_species = df.taxon_name.value_counts().to_frame().reset_index()
     return df_species
 
 
 @st.cache_data(ttl=360)
 def get_best_observers(city):
-    df = pd.read_csv(f"{directory}/data/obs_{city}.csv")
+    df = read_table(f"{directory}/data/obs_{city}.csv")
     df_observers = (
-        df.groupby("user_login")
+        df.groupby("user_login", observed=True)
         .agg("count")["id"]
         .sort_values(ascending=False)
         .to_frame()
@@ -642,20 +606,23 @@ def get_best_observers(city):
 
 @st.cache_data(ttl=360)
 def get_obs_by_rank(i_rank, main_project):
-    df = pd.read_csv(f"{directory}/data/{main_project}_obs.csv")
+    df = read_table(f"{directory}/data/{main_project}_obs.csv")
     df2 = df[df.quality_grade == "research"]
     ranks = ["kingdom", "phylum", "class", "order", "family", "genus"]
     result_df = (
-        df2.groupby(by=ranks[: i_rank + 1]).count()["id"].to_frame().reset_index()
+        df2.groupby(by=ranks[: i_rank + 1], observed=True)
+        .count()["id"]
+        .to_frame()
+        .reset_index()
     )
     return result_df
 
 
 @st.cache_data(ttl=360)
 def get_rank_names(rank_level, main_project):
-    df = pd.read_csv(f"{directory}/data/{main_project}_obs.csv")
+    df = read_table(f"{directory}/data/{main_project}_obs.csv")
     df2 = df[df.quality_grade == "research"]
-    list_names = df2[rank_level].unique()
+    list_names = df2[rank_level].astype(object).unique()
     return list_names
 
 
@@ -689,7 +656,7 @@ def get_num_species(main_project):
         date_str = current_date.strftime("%Y-%m-%d")
         url = f"{base_url}project_id={main_project}&introduced=true&d2={date_str}"
         try:
-            total_species = requests.get(url).json()["total_results"]
+            total_species = session.get(url).json()["total_results"]
             datos = {"date": date_str, "introduced_species": total_species}
             num_species.append(datos)
         except Exception as e:
@@ -708,7 +675,7 @@ def get_introduced_species(project_id, date=None):
         url = f"{species}project_id={project_id}&introduced=true"
     else:
         url = f"{species}project_id={project_id}&introduced=true&d2={date}"
-    total_species = requests.get(url).json()["total_results"]
+    total_species = session.get(url).json()["total_results"]
     return total_species
 
 
@@ -842,7 +809,9 @@ def get_number_species(df):
         parent_name = cols[i - 1] if i > 0 else None
         rank_name = group_name.capitalize()
 
-        group_data = df.groupby(group_cols).size().reset_index(name="number")
+        group_data = (
+            df.groupby(group_cols, observed=True).size().reset_index(name="number")
+        )
         group_data.columns = group_cols + ["number"]
         group_data["name"] = group_data[group_name]
         group_data["parent"] = group_data[parent_name] if parent_name else "Life"
@@ -0,0 +1,279 @@
+"""
+Benchmark de los updaters contra la API simulada (`common.fake_api`).
+
+Para cada updater y cada escala de datos arranca la API simulada, prepara un
+`DASHBOARDS` temporal con los ficheros de entrada que el updater espera
+encontrar y lo ejecuta en un subproceso con la API redirigida. Mide:
+
+- tiempo de ejecución (wall time);
+- pico de memoria residente (RSS) del subproceso;
+- número de peticiones HTTP recibidas por la API simulada, por endpoint.
+
+Los resultados se comparan con `benchmarks/baselines.json` y se marcan como
+regresión las métricas que superan la baseline más la tolerancia. Con
+`--save-baseline` los resultados pasan a ser la nueva baseline.
+
+Uso:
+
+    python benchmarks/run_updaters.py
+    python benchmarks/run_updaters.py --updaters biomarato_25 arsinoe --scales small
+    python benchmarks/run_updaters.py --latency 0.05 --save-baseline
+
+Sale con código 1 si hay alguna regresión o algún updater falla.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+from common.fake_api import serve
+
+BASELINES = os.path.join(ROOT, "benchmarks", "baselines.json")
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+# Número de observaciones sintéticas de cada escala
+SCALES = {"small": 2000, "medium": 20000, "large": 100000}
+
+# Regresión si la métrica supera la baseline en más de esta fracción
+TOLERANCE = {"wall_s": 0.25, "peak_rss_mb": 0.20, "http_requests": 0.05}
+
+# Script y ficheros de entrada (ruta relativa a DASHBOARDS: contenido) de cada
+# updater, los que leen sin comprobar si existen
+UPDATERS = {
+    "biomarato_25": {
+        "script": "biomarato_25/update.py",
+        "files": {
+            **{f"biomarato_25/data/{p}_df_obs.csv": "id\n" for p in range(417, 421)},
+            **{f"biomarato_25/data/{p}_species.csv": "id\n" for p in range(417, 421)},
+            "biomarato_25/data/place_biomarato_species.csv": "id\n",
+        },
+    },
+    "arsinoe": {"script": "arsinoe/update.py", "files": {}},
+    "bioplatgesmet": {
+        "script": "bioplatgesmet/update.py",
+        "files": {
+            "bioplatgesmet/data/264_main_metrics.csv": (
+                "date,observations,species,participants,identifiers\n"
+            ),
+            "bioplatgesmet/data/parcelas.csv": "place_id\n"
+            + "".join(f"{1000 + i}\n" for i in range(20)),
+        },
+    },
+    "biodiverciutat_25": {"script": "biodiverciutat_25/update.py", "files": {}},
+    "download_observations": {
+        "script": "internal-analytics/download_observations.py",
+        "files": {"internal-analytics/data/minka_obs_imported.csv": "id\n"},
+    },
+    "download_identifications": {
+        "script": "internal-analytics/download_identifications.py",
+        "files": {},
+    },
+}
+
+# Ejecuta el updater como __main__ y guarda su pico de RSS al salir
+RUNNER = """
+import atexit, json, resource, runpy, sys
+
+script, rss_file = sys.argv[1:3]
+
+def _dump():
+    with open(rss_file, "w") as f:
+        json.dump({"maxrss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}, f)
+
+atexit.register(_dump)
+sys.argv = [script]
+runpy.run_path(sys.argv[0], run_name="__main__")
+"""
+
+
+def prepare_dashboards(dashboards: str, files: dict):
+    """
+    Crea la carpeta `data` de cada proyecto y los ficheros de entrada.
+    """
+    for updater in UPDATERS.values():
+        project = updater["script"].split("/")[0]
+        os.makedirs(os.path.join(dashboards, project, "data"), exist_ok=True)
+    for path, content in files.items():
+        with open(os.path.join(dashboards, path), "w") as f:
+            f.write(content)
+
+
+def run_updater(name: str, server, base_url: str, args) -> dict:
+    """
+    Ejecuta un updater contra `server` y devuelve sus métricas.
+    """
+    updater = UPDATERS[name]
+    with tempfile.TemporaryDirectory() as dashboards:
+        prepare_dashboards(dashboards, updater["files"])
+        rss_file = os.path.join(dashboards, "rss.json")
+        env = {
+            **os.environ,
+            "DASHBOARDS": dashboards,
+            "MINKA_API_PATH": f"{base_url}/v1",
+            "MINKA_BASE_URL": base_url,
+            "MINKA_CACHE_DIR": os.path.join(dashboards, ".cache"),
+            "MINKA_RATE": str(args.rate),
+            "MINKA_BURST": str(int(args.rate)),
+        }
+
+        before = server.api.request_counts()
+        start = time.perf_counter()
+        try:
+            process = subprocess.run(
+                [
+                    sys.executable,
+                    "-c",
+                    RUNNER,
+                    os.path.join(ROOT, updater["script"]),
+                    rss_file,
+                ],
+                cwd=ROOT,
+                env=env,
+                capture_output=True,
+                text=True,
+                timeout=args.timeout,
+            )
+            returncode, stderr = process.returncode, process.stderr
+        except subprocess.TimeoutExpired:
+            returncode, stderr = None, f"Timeout tras {args.timeout} s"
+        wall = time.perf_counter() - start
+        requests_by_endpoint = server.api.request_counts() - before
+
+        try:
+            with open(rss_file) as f:
+                peak_rss_mb = json.load(f)["maxrss_kb"] / 1024
+        except (FileNotFoundError, ValueError):
+            peak_rss_mb = None
+
+    result = {
+        "wall_s": round(wall, 2),
+        "peak_rss_mb": round(peak_rss_mb, 1) if peak_rss_mb is not None else None,
+        "http_requests": sum(requests_by_endpoint.values()),
+        "requests_by_endpoint": dict(requests_by_endpoint.most_common()),
+        "returncode": returncode,
+    }
+    if returncode != 0:
+        # Últimas líneas del error para ver por qué ha fallado
+        result["error"] = "\n".join(stderr.strip().splitlines()[-5:])
+    return result
+
+
+def find_regressions(results: dict, baselines: dict) -> list:
+    """
+    Lista de (updater, escala, métrica, baseline, valor) que superan la
+    baseline más la tolerancia.
+    """
+    regressions = []
+    for name, by_scale in results.items():
+        for scale, result in by_scale.items():
+            baseline = baselines.get(name, {}).get(scale)
+            if baseline is None:
+                continue
+            for metric, tolerance in TOLERANCE.items():
+                value, reference = result.get(metric), baseline.get(metric)
+                if value is None or not reference:
+                    continue
+                if value > reference * (1 + tolerance):
+                    regressions.append((name, scale, metric, reference, value))
+    return regressions
+
+
+def print_table(results: dict, baselines: dict):
+    print(
+        f"{'updater':<26}{'escala':<8}{'tiempo (s)':>12}{'RSS (MB)':>10}"
+        f"{'peticiones':>12}  baseline"
+    )
+    for name, by_scale in results.items():
+        for scale, result in by_scale.items():
+            baseline = baselines.get(name, {}).get(scale)
+            reference = (
+                f"{baseline['wall_s']} s / {baseline['peak_rss_mb']} MB / "
+                f"{baseline['http_requests']}"
+                if baseline
+                else "-"
+            )
+            status = "" if result["returncode"] == 0 else "  FALLO"
+            print(
+                f"{name:<26}{scale:<8}{result['wall_s']:>12}"
+                f"{str(result['peak_rss_mb']):>10}{result['http_requests']:>12}"
+                f"  {reference}{status}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de los updaters")
+    parser.add_argument("--updaters", nargs="+", default=list(UPDATERS))
+    parser.add_argument("--scales", nargs="+", default=list(SCALES))
+    parser.add_argument("--latency", type=float, default=0.0, help="segundos")
+    parser.add_argument(
+        "--rate", type=float, default=1000, help="peticiones por segundo"
+    )
+    parser.add_argument("--timeout", type=int, default=3600, help="segundos")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args()
+
+    try:
+        with open(BASELINES) as f:
+            baselines = json.load(f)
+    except FileNotFoundError:
+        baselines = {}
+
+    results = {}
+    for scale in args.scales:
+        server, base_url = serve(
+            observations=SCALES[scale], seed=args.seed, latency=args.latency
+        )
+        try:
+            for name in args.updaters:
+                print(f"{name} ({scale})...")
+                result = run_updater(name, server, base_url, args)
+                results.setdefault(name, {})[scale] = result
+                if "error" in result:
+                    print(result["error"])
+        finally:
+            server.shutdown()
+
+    print_table(results, baselines)
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    output = os.path.join(
+        RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    with open(output, "w") as f:
+        json.dump({"args": vars(args), "results": results}, f, indent=2)
+    print(f"Resultados guardados en {output}")
+
+    failed = [
+        (name, scale)
+        for name, by_scale in results.items()
+        for scale, result in by_scale.items()
+        if result["returncode"] != 0
+    ]
+    regressions = find_regressions(results, baselines)
+    for name, scale, metric, reference, value in regressions:
+        print(f"REGRESIÓN {name} ({scale}): {metric} {reference} -> {value}")
+
+    if args.save_baseline:
+        for name, by_scale in results.items():
+            for scale, result in by_scale.items():
+                if result["returncode"] == 0:
+                    baselines.setdefault(name, {})[scale] = {
+                        metric: result[metric] for metric in TOLERANCE
+                    }
+        with open(BASELINES, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print(f"Baselines actualizadas en {BASELINES}")
+
+    sys.exit(1 if failed or regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
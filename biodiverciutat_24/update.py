@@ -1,12 +1,19 @@
 import datetime
 import math
 import os
+import sys
 
 import pandas as pd
 import requests
 from mecoda_minka import get_dfs, get_obs
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.client import MinkaSession
+
 API_PATH = "https://api.minka-sdg.org/v1"
+session = MinkaSession()
+# WoRMS no es la API de MINKA: sin su limitador ni sus reintentos
+worms_session = requests.Session()
 
 
 main_project = 401
@@ -83,7 +90,7 @@ def get_marine(taxon_name: str) -> bool:
     Devuelve True/False en base a un taxon_name
     """
     name_clean = taxon_name.replace(" ", "+")
-    status = requests.get(
+    status = worms_session.get(
         f"https://www.marinespecies.org/rest/AphiaIDByName/{name_clean}?marine_only=true"
     ).status_code
     if (status == 200) or (status == 206):
@@ -103,7 +110,7 @@ def main_metrics_by_day(proj_id: int) -> pd.DataFrame:
     observers = f"{API_PATH}/observations/observers?"
 
     # Crear una sesión de requests
-    session = requests.Session()
+    session = MinkaSession()
 
     # Fecha de inicio de BioDiverCiutat
     day = datetime.date(year=2024, month=4, day=26)
@@ -168,7 +175,7 @@ def _get_metrics_proj(proj_id: int, proj_city: str) -> dict:
         "order_by": "created_at",
     }
     # Crear una sesión de requests
-    session = requests.Session()
+    session = MinkaSession()
     total_species = session.get(species, params=params).json()["total_results"]
     total_participants = session.get(observers, params=params).json()["total_results"]
     total_obs = session.get(observations, params=params).json()["total_results"]
@@ -198,7 +205,7 @@ def create_df_projs(projects: dict) -> pd.DataFrame:
 def get_missing_taxon(taxon_id: int, rank: str):
     url = f"https://api.minka-sdg.org/v1/taxa/{taxon_id}"
     try:
-        ancestors = requests.get(url).json()["results"][0]["ancestors"]
+        ancestors = session.get(url).json()["results"][0]["ancestors"]
         for anc in ancestors:
             if anc["rank"] == rank:
                 return anc["name"]
@@ -209,12 +216,12 @@ def get_missing_taxon(taxon_id: int, rank: str):
 def _get_species(user_name: str, proj_id: int) -> int:
     species = f"{API_PATH}/observations/species_counts"
     params = {"project_id": proj_id, "user_login": user_name}
-    return requests.get(species, params=params).json()["total_results"]
+    return session.get(species, params=params).json()["total_results"]
 
 
 def _get_identifiers(proj_id: int) -> pd.DataFrame:
     url = "https://api.minka-sdg.org/v1/observations/identifiers?project_id=233"
-    results = requests.get(url).json()["results"]
+    results = session.get(url).json()["results"]
     identifiers = []
     for result in results:
         identifier = {}
@@ -281,15 +288,15 @@ def get_marine_count(df_obs: pd.DataFrame) -> pd.DataFrame:
 def get_main_metrics(proj_id):
     species = f"{API_PATH}/observations/species_counts?"
     url1 = f"{species}&project_id={proj_id}"
-    total_species = requests.get(url1).json()["total_results"]
+    total_species = session.get(url1).json()["total_results"]
 
     observers = f"{API_PATH}/observations/observers?"
     url2 = f"{observers}&project_id={proj_id}"
-    total_participants = requests.get(url2).json()["total_results"]
+    total_participants = session.get(url2).json()["total_results"]
 
     observations = f"{API_PATH}/observations?"
     url3 = f"{observations}&project_id={proj_id}"
-    total_obs = requests.get(url3).json()["total_results"]
+    total_obs = session.get(url3).json()["total_results"]
 
     return total_species, total_participants, total_obs
 
@@ -300,7 +307,7 @@ def get_marine_species(proj_id):
     species = f"{API_PATH}/observations/species_counts?"
     url1 = f"{species}&project_id={proj_id}"
 
-    total_num = requests.get(url1).json()["total_results"]
+    total_num = session.get(url1).json()["total_results"]
 
     pages = math.ceil(total_num / 500)
 
@@ -308,7 +315,7 @@ def get_marine_species(proj_id):
         especie = {}
         page = i + 1
         url = f"{species}&project_id={proj_id}&page={page}"
-        results = requests.get(url).json()["results"]
+        results = session.get(url).json()["results"]
         for result in results:
             especie = {}
             especie["taxon_id"] = result["taxon"]["id"]
@@ -1,9 +1,15 @@
 import os
+import sys
 
 import pandas as pd
 import streamlit as st
 from utils import fig_cols, get_count_by_hour, get_count_per_day
 
+sys.path.append(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+)
+from common.storage import read_table
+
 # variables
 colors = ["#4aae79", "#00a3b4", "#265769"]
 
@@ -89,13 +95,11 @@ exclude_users = []
 
 # Columna izquierda
 st.sidebar.markdown("# Com s’hi pot participar?")
-st.sidebar.markdown(
-    """
+st.sidebar.markdown("""
 Qualsevol persona amb interès en la natura pot unir-se al repte. A través de la plataforma MINKA es poden pujar les observacions de flora i fauna, de qualsevol ecosistema urbà, en aquest cas de Barcelona i de tots els municipis metropolitans (boscos de Collserola, parcs, jardins, rius, aiguamolls, dunes, platges i mar).
 
 Totes les observacions del perímetre dels municipis metropolitans que entrin a MINKA, del 26 d’abril a les 00:01 h al 29 d’abril a les 23:59 h formaran part de l’esdeveniment.
-"""
-)
+""")
 
 # Ranking de participantes por obs, identificaciones y especies
 
@@ -144,7 +148,7 @@ st.divider()
 st.header("Distribució de participants per hora i dia")
 
 try:
-    df_obs = pd.read_csv(f"{directory}/data/{main_project}_obs.csv")
+    df_obs = read_table(f"{directory}/data/{main_project}_obs.csv")
     counts_per_day = get_count_per_day(df_obs, mode="users")
     counts_per_hour = get_count_by_hour(df_obs, mode="users")
 
@@ -1,4 +1,5 @@
 import os
+import sys
 
 import pandas as pd
 import plotly.express as px
@@ -13,6 +14,11 @@ from utils import (
     get_photo_from_ob,
 )
 
+sys.path.append(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+)
+from common.storage import read_table
+
 # variables
 colors = ["#009DE0", "#0081B8", "#00567A"]
 
@@ -74,11 +80,9 @@ projects = {
 
 # Columna izquierda
 st.sidebar.markdown("# Quines espècies busca el BioDiverCiutat?")
-st.sidebar.markdown(
-    """
+st.sidebar.markdown("""
 La idea del CNC és que totes les ciutats que se sumin al repte identifiquin qualsevol taxó d’ésser viu del seu entorn metropolità. En el cas de Barcelona, l’objectiu és registrar observacions d’espècies tant marines, costaneres com terrestres, ja que Barcelona inclou diverses àrees amb biodiversitat (platges, zones verdes, parcs i jardins, boscos de Collserola).
-"""
-)
+""")
 # Cabecera
 with st.container():
     col1, col2 = st.columns([1, 10])
@@ -91,8 +95,8 @@ with st.container():
 # Cargamos observaciones del proyecto principal
 st.markdown("### Observacions per rang taxonòmic amb grau investigació")
 try:
-    df_obs = pd.read_csv(f"{directory}/data/{main_project}_obs.csv")
-    df_photos = pd.read_csv(f"{directory}/data/{main_project}_photos.csv")
+    df_obs = read_table(f"{directory}/data/{main_project}_obs.csv")
+    df_photos = read_table(f"{directory}/data/{main_project}_photos.csv")
 except:
     df_obs = pd.DataFrame()
 
@@ -1,12 +1,22 @@
 import datetime
 import math
 import os
+import sys
 
 import pandas as pd
 import requests
 from mecoda_minka import get_dfs, get_obs
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.client import MinkaSession
+from common.counts import count_job, counts_wide, get_counts
+from common.instrumentation import stage, write_report
+from common.storage import read_table, write_table
+
 API_PATH = "https://api.minka-sdg.org/v1"
+session = MinkaSession()
+# WoRMS no es la API de MINKA: sin su limitador ni sus reintentos
+worms_session = requests.Session()
 
 
 main_project = 233
@@ -83,7 +93,7 @@ def get_marine(taxon_name: str) -> bool:
     Devuelve True/False en base a un taxon_name
     """
     name_clean = taxon_name.replace(" ", "+")
-    status = requests.get(
+    status = worms_session.get(
         f"https://www.marinespecies.org/rest/AphiaIDByName/{name_clean}?marine_only=true"
     ).status_code
     if (status == 200) or (status == 206):
@@ -97,23 +107,16 @@ def main_metrics_by_day(proj_id: int) -> pd.DataFrame:
     """
     Saca métricas del proyecto para cada día
     """
-    results = []
-    observations = f"{API_PATH}/observations?"
-    species = f"{API_PATH}/observations/species_counts?"
-    observers = f"{API_PATH}/observations/observers?"
-
-    # Crear una sesión de requests
-    session = requests.Session()
-
     # Fecha de inicio de BioDiverCiutat
-    day = datetime.date(year=2025, month=4, day=25)
-    rango_temporal = (datetime.date(year=2025, month=4, day=29) - day).days
+    first_day = datetime.date(year=2025, month=4, day=25)
+    rango_temporal = (datetime.date(year=2025, month=4, day=29) - first_day).days
+    days = [first_day + datetime.timedelta(days=i) for i in range(rango_temporal)]
 
-    for i in range(rango_temporal):
-        st_day = day.strftime("%Y-%m-%d")
-        print(i)
-        # Saca los datos de los días hasta el actual
+    # Saca los datos de los días hasta el actual
+    jobs = []
+    for day in days:
         if datetime.datetime.today().date() >= day:
+            st_day = day.strftime("%Y-%m-%d")
             params = {
                 "project_id": proj_id,
                 "d1": st_day,
@@ -121,83 +124,47 @@ def main_metrics_by_day(proj_id: int) -> pd.DataFrame:
                 "order": "desc",
                 "order_by": "created_at",
             }
+            for endpoint in ["observations", "species", "observers"]:
+                jobs.append(count_job(endpoint, params, date=st_day))
 
-            # Utilizar la sesión para realizar las solicitudes
-            total_species = session.get(species, params=params).json()["total_results"]
-            total_participants = session.get(observers, params=params).json()[
-                "total_results"
-            ]
-            total_obs = session.get(observations, params=params).json()["total_results"]
-
-            result = {
-                "date": st_day,
-                "observations": total_obs,
-                "species": total_species,
-                "participants": total_participants,
-            }
-
-            results.append(result)
-
-            day = day + datetime.timedelta(days=1)
-
-        # Para el resto devuelve 0
-        else:
-            result = {
-                "date": st_day,
-                "observations": 0,
-                "species": 0,
-                "participants": 0,
-            }
-            results.append(result)
-            day = day + datetime.timedelta(days=1)
+    result_df = pd.DataFrame({"date": [day.strftime("%Y-%m-%d") for day in days]})
+    if len(jobs) > 0:
+        df_counts = counts_wide(get_counts(jobs), index="date")
+        result_df = pd.merge(result_df, df_counts, on="date", how="left")
+    else:
+        result_df[["observations", "species", "observers"]] = 0
 
-    result_df = pd.DataFrame(results)
+    # Para el resto devuelve 0
+    result_df = result_df.rename(columns={"observers": "participants"})
+    result_df = result_df[["date", "observations", "species", "participants"]]
+    result_df = result_df.fillna(0).astype(
+        {"observations": int, "species": int, "participants": int}
+    )
     print("Updated main metrics")
     return result_df
 
 
-def _get_metrics_proj(proj_id: int, proj_city: str) -> dict:
-    observations = f"{API_PATH}/observations?"
-    species = f"{API_PATH}/observations/species_counts?"
-    observers = f"{API_PATH}/observations/observers?"
-
-    params = {
-        "project_id": proj_id,
-        "order": "desc",
-        "order_by": "created_at",
-    }
-    # Crear una sesión de requests
-    session = requests.Session()
-    total_species = session.get(species, params=params).json()["total_results"]
-    total_participants = session.get(observers, params=params).json()["total_results"]
-    total_obs = session.get(observations, params=params).json()["total_results"]
-
-    result = {
-        "project": proj_id,
-        "city": proj_city,
-        "observations": total_obs,
-        "species": total_species,
-        "participants": total_participants,
-    }
-    return result
-
-
 def create_df_projs(projects: dict) -> pd.DataFrame:
-    proj_metrics = []
-
+    jobs = []
     for k, v in projects.items():
-        results = _get_metrics_proj(k, v)
-        proj_metrics.append(results)
+        params = {
+            "project_id": k,
+            "order": "desc",
+            "order_by": "created_at",
+        }
+        for endpoint in ["observations", "species", "observers"]:
+            jobs.append(count_job(endpoint, params, project=k, city=v))
 
-    df_projs = pd.DataFrame(proj_metrics)
+    df_projs = counts_wide(get_counts(jobs), index=["project", "city"])
+    df_projs = df_projs.rename(columns={"observers": "participants"})
 
-    return df_projs
+    return df_projs[["project", "city", "observations", "species", "participants"]]
 
 
 def get_missing_taxon(taxon_id: int, rank: str):
     url = f"https://api.minka-sdg.org/v1/taxa/{taxon_id}"
     try:
-        ancestors = requests.get(url).json()["results"][0]["ancestors"]
+        ancestors = session.get(url).json()["results"][0]["ancestors"]
         for anc in ancestors:
             if anc["rank"] == rank:
                 return anc["name"]
@@ -208,12 +175,12 @@ def get_missing_taxon(taxon_id: int, rank: str):
 def _get_species(user_name: str, proj_id: int) -> int:
     species = f"{API_PATH}/observations/species_counts"
     params = {"project_id": proj_id, "user_login": user_name}
-    return requests.get(species, params=params).json()["total_results"]
+    return session.get(species, params=params).json()["total_results"]
 
 
 def _get_identifiers(proj_id: int) -> pd.DataFrame:
     url = "https://api.minka-sdg.org/v1/observations/identifiers?project_id=233"
-    results = requests.get(url).json()["results"]
+    results = session.get(url).json()["results"]
     identifiers = []
     for result in results:
         identifier = {}
@@ -235,7 +202,7 @@ def get_number_identifications(user_name, df_identifiers):
 
 
 def get_participation_df(main_project: int) -> pd.DataFrame:
-    df_obs = pd.read_csv(f"{directory}/data/{main_project}_obs.csv")
+    df_obs = read_table(f"{directory}/data/{main_project}_obs.csv")
     pt_users = (
         df_obs["user_login"]
         .value_counts()
@@ -280,15 +247,15 @@ def get_marine_count(df_obs: pd.DataFrame) -> pd.DataFrame:
 def get_main_metrics(proj_id):
     species = f"{API_PATH}/observations/species_counts?"
     url1 = f"{species}&project_id={proj_id}"
-    total_species = requests.get(url1).json()["total_results"]
+    total_species = session.get(url1).json()["total_results"]
 
     observers = f"{API_PATH}/observations/observers?"
     url2 = f"{observers}&project_id={proj_id}"
-    total_participants = requests.get(url2).json()["total_results"]
+    total_participants = session.get(url2).json()["total_results"]
 
     observations = f"{API_PATH}/observations?"
     url3 = f"{observations}&project_id={proj_id}"
-    total_obs = requests.get(url3).json()["total_results"]
+    total_obs = session.get(url3).json()["total_results"]
 
     return total_species, total_participants, total_obs
 
@@ -299,7 +266,7 @@ def get_marine_species(proj_id):
     species = f"{API_PATH}/observations/species_counts?"
     url1 = f"{species}&project_id={proj_id}"
 
-    total_num = requests.get(url1).json()["total_results"]
+    total_num = session.get(url1).json()["total_results"]
 
     pages = math.ceil(total_num / 500)
 
@@ -307,7 +274,7 @@ def get_marine_species(proj_id):
         especie = {}
         page = i + 1
         url = f"{species}&project_id={proj_id}&page={page}"
-        results = requests.get(url).json()["results"]
+        results = session.get(url).json()["results"]
         for result in results:
             especie = {}
             especie["taxon_id"] = result["taxon"]["id"]
@@ -332,69 +299,79 @@ def get_marine_species(proj_id):
 if __name__ == "__main__":
 
     # Actualiza main metrics
-    main_metrics_df = main_metrics_by_day(main_project)
-    main_metrics_df.to_csv(
-        f"{directory}/data/{main_project}_main_metrics.csv", index=False
-    )
-    print("Main metrics actualizada por día")
+    with stage("main_metrics"):
+        main_metrics_df = main_metrics_by_day(main_project)
+        main_metrics_df.to_csv(
+            f"{directory}/data/{main_project}_main_metrics.csv", index=False
+        )
+        print("Main metrics actualizada por día")
 
     # Actualiza métricas de los proyectos
-    df_projs = create_df_projs(projects)
-    df_projs.to_csv(
-        f"{directory}/data/{main_project}_main_metrics_projects.csv", index=False
-    )
-    print("Main metrics of city projects actualizado")
-
-    # Actualiza df_obs y df_photos totales
-    obs = get_obs(id_project=main_project)
-    if len(obs) > 0:
-        df_obs, df_photos = get_dfs(obs)
-        # Completar campos de taxonomías
-        cols = ["class", "order", "family", "genus"]
-
-        df_obs.to_csv(f"{directory}/data/{main_project}_obs.csv", index=False)
-        df_photos.to_csv(f"{directory}/data/{main_project}_photos.csv", index=False)
-
-        print("Sacando columna marine")
-        df_obs["taxon_id"] = df_obs["taxon_id"].replace("nan", None)
-        df_filtered = df_obs[df_obs["taxon_id"].notnull()].copy()
-        df_filtered["taxon_id"] = df_filtered["taxon_id"].astype(int)
-
-        # sacamos listado de especies incluidas en el proyecto con col marina
-        print("Aplicando get_marine_species")
-        df_species = get_marine_species(main_project)
-
-        # Sacar columna marino
-        df_filtered = pd.merge(
-            df_filtered,
-            df_species[["taxon_id", "marine"]],
-            on="taxon_id",
-            how="left",
+    with stage("projects"):
+        df_projs = create_df_projs(projects)
+        df_projs.to_csv(
+            f"{directory}/data/{main_project}_main_metrics_projects.csv", index=False
         )
+        print("Main metrics of city projects actualizado")
 
-        # Dataframe de participantes
-        print("Dataframe de participantes")
-        df_users = get_participation_df(main_project)
-        df_users.to_csv(f"{directory}/data/{main_project}_users.csv", index=False)
-
-        # Cuenta de marino/terrestre
-        print("Cuenta de marinos/terrestres")
-        try:
-            df_marine = get_marine_count(df_filtered)
-            df_marine.to_csv(
-                f"{directory}/data/{main_project}_marines.csv", index=False
+    # Actualiza df_obs y df_photos totales
+    with stage("observations"):
+        obs = get_obs(id_project=main_project)
+        if len(obs) > 0:
+            df_obs, df_photos = get_dfs(obs)
+            # Completar campos de taxonomías
+            cols = ["class", "order", "family", "genus"]
+
+            write_table(df_obs, f"{directory}/data/{main_project}_obs.csv")
+            write_table(df_photos, f"{directory}/data/{main_project}_photos.csv")
+
+            print("Sacando columna marine")
+            df_obs["taxon_id"] = df_obs["taxon_id"].replace("nan", None)
+            df_filtered = df_obs[df_obs["taxon_id"].notnull()].copy()
+            df_filtered["taxon_id"] = df_filtered["taxon_id"].astype(int)
+
+            # sacamos listado de especies incluidas en el proyecto con col marina
+            print("Aplicando get_marine_species")
+            df_species = get_marine_species(main_project)
+
+            # Sacar columna marino
+            df_filtered = pd.merge(
+                df_filtered,
+                df_species[["taxon_id", "marine"]],
+                on="taxon_id",
+                how="left",
             )
-        except:
-            df_obs["marine"] = None
-            df_obs.to_csv(f"{directory}/data/{main_project}_marines.csv", index=False)
+
+            # Dataframe de participantes
+            print("Dataframe de participantes")
+            df_users = get_participation_df(main_project)
+            df_users.to_csv(f"{directory}/data/{main_project}_users.csv", index=False)
+
+            # Cuenta de marino/terrestre
+            print("Cuenta de marinos/terrestres")
+            try:
+                df_marine = get_marine_count(df_filtered)
+                df_marine.to_csv(
+                    f"{directory}/data/{main_project}_marines.csv", index=False
+                )
+            except:
+                df_obs["marine"] = None
+                df_obs.to_csv(
+                    f"{directory}/data/{main_project}_marines.csv", index=False
+                )
 
     # Dataframe métricas totales
-    print("Dataframe métricas tiempo real")
-    total_species, total_participants, total_obs = get_main_metrics(main_project)
-    df = pd.DataFrame(
-        {
-            "metrics": ["observacions", "espècies", "participants"],
-            "values": [total_obs, total_species, total_participants],
-        }
-    )
-    df.to_csv(f"{directory}/data/{main_project}_metrics_tiempo_real.csv", index=False)
+    with stage("realtime_metrics"):
+        print("Dataframe métricas tiempo real")
+        total_species, total_participants, total_obs = get_main_metrics(main_project)
+        df = pd.DataFrame(
+            {
+                "metrics": ["observacions", "espècies", "participants"],
+                "values": [total_obs, total_species, total_participants],
+            }
+        )
+        df.to_csv(
+            f"{directory}/data/{main_project}_metrics_tiempo_real.csv", index=False
+        )
+
+    write_report(f"{directory}/data/run_report.json")
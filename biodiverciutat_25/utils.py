@@ -1,5 +1,5 @@
-import datetime
 import os
+import sys
 
 import folium
 import geopandas as gpd
@@ -12,6 +12,14 @@ from folium.plugins import HeatMap, MarkerCluster
 from markdownlit import mdlit
 from mecoda_minka import get_dfs, get_obs
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.client import get_session
+from common.project_metrics import (
+    get_previous_totals,
+    get_project_totals,
+    get_projects_totals,
+)
+
 try:
     directory = f"{os.environ['DASHBOARDS']}/biodiverciutat_25"
 except KeyError:
@@ -46,6 +54,7 @@ exclude_users = [
 ]
 
 API_PATH = "https://api.minka-sdg.org/v1"
+session = get_session()
 
 colors = ["#4aae79", "#007d8a", "#00a3b4"]
 
@@ -92,39 +101,14 @@ projects = {
 
 @st.cache_data(ttl=60)
 def get_main_metrics(proj_id):
-    species = f"{API_PATH}/observations/species_counts?"
-    url1 = f"{species}&project_id={proj_id}"
-    total_species = requests.get(url1).json()["total_results"]
-
-    observers = f"{API_PATH}/observations/observers?"
-    url2 = f"{observers}&project_id={proj_id}"
-    total_participants = requests.get(url2).json()["total_results"]
-
-    observations = f"{API_PATH}/observations?"
-    url3 = f"{observations}&project_id={proj_id}"
-    total_obs = requests.get(url3).json()["total_results"]
-
-    return total_species, total_participants, total_obs
+    totals = get_project_totals(proj_id)
+    return totals["species"], totals["observers"], totals["observations"]
 
 
 @st.cache_data(ttl=60)
 def get_last_week_metrics(proj_id):
-    last_week_date = (datetime.datetime.today() - datetime.timedelta(days=7)).strftime(
-        "%Y-%m-%d"
-    )
-
-    species = f"{API_PATH}/observations/species_counts?"
-    url1 = f"{species}&project_id={proj_id}&created_d1={last_week_date}&order=desc&order_by=created_at"
-    lw_spe = requests.get(url1).json()["total_results"]
-
-    observers = f"{API_PATH}/observations/observers?"
-    url2 = f"{observers}&project_id={proj_id}&created_d1={last_week_date}&order=desc&order_by=created_at"
-    lw_part = requests.get(url2).json()["total_results"]
-
-    observations = f"{API_PATH}/observations?"
-    url3 = f"{observations}&project_id={proj_id}&created_d1={last_week_date}&order=desc&order_by=created_at"
-    lw_obs = requests.get(url3).json()["total_results"]
-    return lw_obs, lw_spe, lw_part
+    totals = get_previous_totals(proj_id, days=7, created=True)
+    return totals["observations"], totals["species"], totals["observers"]
 
 
 @st.cache_resource(ttl=60)
@@ -178,33 +162,7 @@ def fig_area_evolution(df, field, title, color):
 
 @st.cache_data(ttl=60)
 def get_metrics_cities(projects):
-
-    result = []
-
-    session = requests.Session()
-
-    with requests.Session() as session:
-        for k, v in projects.items():
-            species = f"{API_PATH}/observations/species_counts?"
-            url1 = f"{species}&project_id={k}"
-            total_species = session.get(url1).json().get("total_results")
-
-            observers = f"{API_PATH}/observations/observers?"
-            url2 = f"{observers}&project_id={k}"
-            total_participants = session.get(url2).json().get("total_results")
-
-            observations = f"{API_PATH}/observations?"
-            url3 = f"{observations}&project_id={k}"
-            total_obs = session.get(url3).json().get("total_results")
-
-            data = {
-                "city": v,
-                "espècies": total_species,
-                "participants": total_participants,
-                "observacions": total_obs,
-            }
-            result.append(data)
-    main_metrics_cities = pd.DataFrame(result)
+    main_metrics_cities = get_projects_totals(projects, key="city")
     return main_metrics_cities
 
 
@@ -387,14 +345,14 @@ def get_marine_terrestrial(df_obs):
 def _get_species(user_name, proj_id):
     species = f"{API_PATH}/observations/species_counts"
     params = {"project_id": proj_id, "user_login": user_name}
-    return requests.get(species, params=params).json()["total_results"]
+    return session.get(species, params=params).json()["total_results"]
 
 
 @st.cache_data(ttl=60)
 def _get_identifiers(user_name, proj_id):
     identifiers = f"{API_PATH}/observations/identifiers"
     params = {"project_id": proj_id, "user_login": user_name}
-    return requests.get(identifiers, params=params).json()["total_results"]
+    return session.get(identifiers, params=params).json()["total_results"]
 
 
 @st.cache_data(ttl=60)
@@ -549,7 +507,7 @@ def get_introduced_species(project_id, date=None):
         url = f"{species}project_id={project_id}&introduced=true"
     else:
         url = f"{species}project_id={project_id}&introduced=true&d2={date}"
-    total_species = requests.get(url).json()["total_results"]
+    total_species = session.get(url).json()["total_results"]
     return total_species
 
 
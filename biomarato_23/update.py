@@ -3,13 +3,17 @@
 import datetime
 import math
 import os
+import sys
 
 import pandas as pd
-import requests
 from mecoda_minka import get_dfs, get_obs
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.client import MinkaSession
+
 BASE_URL = "https://minka-sdg.org"
 API_PATH = f"https://api.minka-sdg.org/v1"
+session = MinkaSession()
 
 try:
     directory = f"{os.environ['DASHBOARDS']}/biomarato_23"
@@ -49,7 +53,7 @@ def update_main_metrics(proj_id):
     observers = f"{API_PATH}/observations/observers?"
 
     # Crear una sesión de requests
-    session = requests.Session()
+    session = MinkaSession()
 
     # Fecha de inicio de la Biomarato
     day = datetime.date(year=2023, month=4, day=28)
@@ -108,11 +112,11 @@ def update_main_metrics_original():
             "order": "desc",
             "order_by": "created_at",
         }
-        total_species = requests.get(species, params=params).json()["total_results"]
-        total_participants = requests.get(observers, params=params).json()[
+        total_species = session.get(species, params=params).json()["total_results"]
+        total_participants = session.get(observers, params=params).json()[
             "total_results"
         ]
-        total_obs = requests.get(observations, params=params).json()["total_results"]
+        total_obs = session.get(observations, params=params).json()["total_results"]
 
         result = {
             "date": st_day,
@@ -133,7 +137,7 @@ def update_main_metrics_original():
 def _get_species(user_name, proj_id):
     species = f"{API_PATH}/observations/species_counts"
     params = {"project_id": proj_id, "user_login": user_name}
-    return requests.get(species, params=params).json()["total_results"]
+    return session.get(species, params=params).json()["total_results"]
 
 
 def get_ranking_users(proj_id, max_id=300000, batch_size=10000):
@@ -174,14 +178,14 @@ def get_list_species(proj_id):
     results = []
 
     # Extrae todas las páginas de los resultados, si hay más de una
-    total_results = requests.get(url, params=params).json()["total_results"]
+    total_results = session.get(url, params=params).json()["total_results"]
     if total_results > 500:
         num = math.ceil(total_results / 500)
         for i in range(1, num + 1):
             params["page"] = i
-            results.extend(requests.get(url, params=params).json()["results"])
+            results.extend(session.get(url, params=params).json()["results"])
     else:
-        results = requests.get(url, params=params).json()["results"]
+        results = session.get(url, params=params).json()["results"]
 
     # Crea la tabla name-count de especies
     total = []
@@ -3,13 +3,18 @@
 import datetime
 import math
 import os
+import sys
 import time
 from typing import List, Optional
 
 import pandas as pd
-import requests
 from mecoda_minka import get_dfs, get_obs
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.client import MinkaSession
+from common.counts import count_job, get_counts
+from common.obs_store import ObsStore
+
 BASE_URL = "https://minka-sdg.org"
 API_PATH = f"https://api.minka-sdg.org/v1"
 
@@ -81,7 +86,7 @@ def update_main_metrics(proj_id: int) -> pd.DataFrame:
     observers = f"{API_PATH}/observations/observers?"
 
     # Crear una sesión de requests
-    session = requests.Session()
+    session = MinkaSession()
 
     # Fecha de inicio de la Biomarato: 2024/05/06 - 2024/10/15
     day = datetime.date(year=2024, month=5, day=6)
@@ -131,7 +136,7 @@ def update_main_metrics(proj_id: int) -> pd.DataFrame:
 
 def get_list_users(id_project):
     users = []
-    session = requests.Session()
+    session = MinkaSession()
 
     url1 = f"https://api.minka-sdg.org/v1/observations/observers?project_id={id_project}&quality_grade=research"
     results = session.get(url1).json()["results"]
@@ -161,85 +166,85 @@ def get_list_users(id_project):
 
 
 # update obs for projects
-def get_new_data(project, grade=None):
-    df_obs = pd.read_csv(f"{directory}/data/{project}_df_obs.csv")
-    df_photos = pd.read_csv(f"{directory}/data/{project}_df_photos.csv")
-    max_id = df_obs["id"].max()
+def open_store(project) -> ObsStore:
+    return ObsStore(
+        f"{directory}/data/{project}_df_obs.csv",
+        f"{directory}/data/{project}_df_photos.csv",
+    )
 
+
+def get_new_data(store: ObsStore, project, grade=None):
     # Comprueba si hay observaciones nuevas
-    obs = get_obs(id_project=project, id_above=max_id, grade=grade)
+    obs = get_obs(id_project=project, id_above=store.max_id(), grade=grade)
     if len(obs) > 0:
         print(f"Add {len(obs)} obs in project {project}")
-        df_obs2, df_photos2 = get_dfs(obs)
-        df_obs = pd.concat([df_obs, df_obs2], ignore_index=True)
-        df_obs.to_csv(f"{directory}/data/{project}_df_obs.csv", index=False)
-        df_photos = pd.concat([df_photos, df_photos2], ignore_index=True)
-        df_photos.to_csv(f"{directory}/data/{project}_df_photos.csv", index=False)
+        store.upsert(*get_dfs(obs))
 
 
-def update_dfs_projects(
-    project,
-    day=(datetime.date.today() - datetime.timedelta(days=1)).strftime("%Y-%m-%d"),
-    grade=None,
-):
+def update_dfs_projects(store: ObsStore, project, day=None, grade=None):
+    """
+    Aplica las observaciones modificadas desde `day` (por defecto, desde la
+    última sincronización o desde ayer). Con `grade`, las que ya no tienen ese
+    grado (p. ej. han pasado a casual) se eliminan.
+    """
+    if day is None:
+        yesterday = datetime.date.today() - datetime.timedelta(days=1)
+        day = store.watermark or yesterday.strftime("%Y-%m-%d")
 
-    # updated today
-    obs_nuevas = get_obs(id_project=project, updated_since=day, grade=grade)
+    obs_nuevas = get_obs(id_project=project, updated_since=day)
     if len(obs_nuevas) > 0:
         df_obs_new, df_photos_new = get_dfs(obs_nuevas)
-        df_photos_new["photos_id"] = df_photos_new["photos_id"].astype(int)
-
-        # get downloaded
-        df_obs = pd.read_csv(f"{directory}/data/{project}_df_obs.csv")
-        df_photos = pd.read_csv(f"{directory}/data/{project}_df_photos.csv")
-        old_obs = df_obs[-df_obs["id"].isin(df_obs_new["id"].to_list())]
-        old_photos = df_photos[
-            -df_photos["photos_id"].isin(df_photos_new["photos_id"].to_list())
-        ]
-
-        # join old and updated
-        df_obs_updated = pd.concat(
-            [old_obs, df_obs_new], ignore_index=True
-        ).sort_values(by="id", ascending=False)
-        df_photo_updated = pd.concat(
-            [old_photos, df_photos_new], ignore_index=True
-        ).sort_values(by="photos_id", ascending=False)
-    else:
-        df_obs_updated = None
-        df_photo_updated = None
-    # remove casuals
-    obs_casual = get_obs(grade="casual", updated_since=day)
-    if len(obs_casual) > 0:
-        casual_ids = [ob_casual.id for ob_casual in obs_casual]
-        df_obs_updated = df_obs_updated[-df_obs_updated["id"].isin(casual_ids)]
-        df_photo_updated = df_photo_updated[-df_photo_updated["id"].isin(casual_ids)]
+        if grade is not None:
+            lost = df_obs_new["quality_grade"] != grade
+            store.remove(df_obs_new.loc[lost, "id"])
+            df_obs_new = df_obs_new[~lost]
+            df_photos_new = df_photos_new[df_photos_new["id"].isin(df_obs_new["id"])]
+        store.upsert(df_obs_new, df_photos_new)
 
-    print(f"Updated obs and photos for project {project}: {len(df_obs_updated)}")
-    return df_obs_updated, df_photo_updated
+    print(f"Updated obs and photos for project {project}: {len(store)}")
 
 
-def get_ranking_users(proj_id, grade=None):
-    get_new_data(proj_id, grade)
-    update_dfs_projects(proj_id, grade=grade)
-    df_obs = pd.read_csv(f"{directory}/data/{proj_id}_df_obs.csv")
-    df_photos = pd.read_csv(f"{directory}/data/{proj_id}_df_photos.csv")
+def sync_obs(project, grade=None) -> tuple:
+    """
+    Sincroniza las observaciones y fotos del proyecto: añade las nuevas y
+    aplica las modificadas. Si el total no cuadra con la API (observaciones
+    borradas, o no hay nada descargado) hace una descarga completa.
 
-    if len(df_obs) == 0:
-        df_obs = None
-        df_photos = None
+    Devuelve el store y si la tabla ha cambiado.
+    """
+    store = open_store(project)
+    started = datetime.datetime.now(datetime.timezone.utc)
+    if len(store) > 0:
+        get_new_data(store, project, grade)
+        update_dfs_projects(store, project, grade=grade)
+
+    params = {"project_id": project}
+    if grade is not None:
+        params["quality_grade"] = grade
+    jobs = [count_job("observations", params)]
+    total = get_counts(jobs, cache=False)["total_results"].iloc[0]
+    if len(store) != total:
+        print(f"Descarga completa del proyecto {project}")
+        obs = get_obs(id_project=project, grade=grade)
+        if len(obs) > 0:
+            store.replace(*get_dfs(obs))
+
+    updated = store.save(watermark=started.strftime("%Y-%m-%dT%H:%M:%SZ"))
+    return store, updated
 
-    # Sacamos pt_users
-    if df_obs is not None:
-        pt_users = get_list_users(proj_id)
 
-    else:
-        pt_users = None
+def get_ranking_users(proj_id, grade=None):
+    store, __ = sync_obs(proj_id, grade)
+    if len(store) == 0:
+        return None, None, None
 
-    return df_obs, df_photos, pt_users
+    # Sacamos pt_users
+    pt_users = get_list_users(proj_id)
+    return store.df_obs, store.df_photos, pt_users
 
 
 def get_list_species(proj_id: int) -> Optional[pd.DataFrame]:
-    session = requests.Session()
+    session = MinkaSession()
     params = {"project_id": proj_id, "quality_grade": "research"}
     url = f"{API_PATH}/observations/species_counts"
     results = []
@@ -274,7 +279,7 @@ def get_list_species(proj_id: int) -> Optional[pd.DataFrame]:
 
 def get_first_obs_taxon(taxon_id, proj_id, session=None):
     if session is None:
-        session = requests.Session()
+        session = MinkaSession()
 
     url = f"{API_PATH}/observations"
     params = {"project_id": proj_id, "quality_grade": "research", "taxon_id": taxon_id}
@@ -301,7 +306,7 @@ def get_first_obs_taxon(taxon_id, proj_id, session=None):
 
 def get_first_obs_taxon_original(taxon_id, proj_id):
 
-    session = requests.Session()
+    session = MinkaSession()
 
     url = f"{API_PATH}/observations"
 
@@ -363,7 +368,7 @@ if __name__ == "__main__":
         print(f"Get species for project {proj_id}")
         species = get_list_species(proj_id)
         if species is not None:
-            with requests.Session() as session:
+            with MinkaSession() as session:
                 species[["first_date", "author", "obs_id", "photo_url"]] = (
                     species.apply(
                         lambda x: get_first_obs_taxon(x["id"], proj_id, session), axis=1
@@ -1,17 +1,24 @@
-import datetime
 import os
+import sys
 
 import folium
 import numpy as np
 import pandas as pd
 import plotly.express as px
-import requests
 import streamlit as st
 from folium.plugins import HeatMap, MarkerCluster
 from markdownlit import mdlit
 from streamlit_extras.metric_cards import style_metric_cards
 from streamlit_folium import folium_static
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.client import get_session
+from common.project_metrics import (
+    get_previous_totals,
+    get_project_totals,
+    get_projects_totals,
+)
+
 try:
     directory = f"{os.environ['DASHBOARDS']}/biomarato_24"
 except KeyError:
@@ -22,6 +29,7 @@ except KeyError:
 
 base_url = "https://minka-sdg.org"
 api_path = f"https://api.minka-sdg.org/v1"
+session = get_session()
 
 
 projects = [
@@ -34,73 +42,20 @@ projects = [
 
 @st.cache_data(ttl=3600)
 def get_main_metrics(proj_id):
-    species = f"{api_path}/observations/species_counts?"
-    url1 = f"{species}&project_id={proj_id}"
-    total_species = requests.get(url1).json()["total_results"]
-
-    observers = f"{api_path}/observations/observers?"
-    url2 = f"{observers}&project_id={proj_id}"
-    total_participants = requests.get(url2).json()["total_results"]
-
-    observations = f"{api_path}/observations?"
-    url3 = f"{observations}&project_id={proj_id}"
-    total_obs = requests.get(url3).json()["total_results"]
-
-    return total_species, total_participants, total_obs
+    totals = get_project_totals(proj_id)
+    return totals["species"], totals["observers"], totals["observations"]
 
 
 @st.cache_data(ttl=3600)
 def get_last_week_metrics(proj_id):
-    last_week_date = (datetime.datetime.today() - datetime.timedelta(days=7)).strftime(
-        "%Y-%m-%d"
-    )
-
-    species = f"{api_path}/observations/species_counts?"
-    url1 = f"{species}&project_id={proj_id}&d2={last_week_date}&order=desc&order_by=created_at"
-    lw_spe = requests.get(url1).json()["total_results"]
-
-    observers = f"{api_path}/observations/observers?"
-    url2 = f"{observers}&project_id={proj_id}&d2={last_week_date}&order=desc&order_by=created_at"
-    lw_part = requests.get(url2).json()["total_results"]
-
-    observations = f"{api_path}/observations?"
-    url3 = f"{observations}&project_id={proj_id}&d2={last_week_date}&order=desc&order_by=created_at"
-    lw_obs = requests.get(url3).json()["total_results"]
-    return lw_obs, lw_spe, lw_part
+    totals = get_previous_totals(proj_id, days=7)
+    return totals["observations"], totals["species"], totals["observers"]
 
 
 @st.cache_data(ttl=3600)
 def get_metrics_province():
-    prov = {
-        projects[0]["name"]: projects[0]["id"],
-        projects[1]["name"]: projects[1]["id"],
-        projects[2]["name"]: projects[2]["id"],
-    }
-
-    result = []
-
-    with requests.Session() as session:
-        for k, v in prov.items():
-            species = f"{api_path}/observations/species_counts?"
-            url1 = f"{species}&project_id={v}"
-            total_species = session.get(url1).json().get("total_results")
-
-            observers = f"{api_path}/observations/observers?"
-            url2 = f"{observers}&project_id={v}"
-            total_participants = session.get(url2).json().get("total_results")
-
-            observations = f"{api_path}/observations?"
-            url3 = f"{observations}&project_id={v}"
-            total_obs = session.get(url3).json().get("total_results")
-
-            data = {
-                "provincia": k,
-                "espècies": total_species,
-                "participants": total_participants,
-                "observacions": total_obs,
-            }
-            result.append(data)
-    main_metrics = pd.DataFrame(result)
+    prov = {project["id"]: project["name"] for project in projects[:3]}
+    main_metrics = get_projects_totals(prov, key="provincia")
     return main_metrics
 
 
@@ -339,8 +294,6 @@ def reindex(df):
 @st.cache_data(ttl=3600)
 def get_grouped_monthly(project_id: int) -> pd.DataFrame:
 
-    session = requests.Session()
-
     project_id = 283
 
     meses = {
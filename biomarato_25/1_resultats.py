@@ -1,11 +1,15 @@
 # Run as streamlit run app_biomarato.py --server.port 9003
 
 import os
+import sys
 from datetime import datetime, timedelta
 
 import pandas as pd
 import streamlit as st
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.storage import read_table
+
 # Variable de entorno para el directorio
 try:
     directory = f"{os.environ['DASHBOARDS']}/biomarato_25"
@@ -24,6 +28,8 @@ st.set_page_config(
 import streamlit.components.v1 as components
 from streamlit_extras.metric_cards import style_metric_cards
 from utils import (
+    data_file,
+    data_version,
     fig_area_evolution,
     fig_bars_months,
     fig_multi_year_comparison,
@@ -33,6 +39,9 @@ from utils import (
     get_previous_years,
 )
 
+# Snapshot de datos publicado: clave de las cachés de la página
+version = data_version()
+
 # configuración de ModeBar
 config_modebar = {
     "displayModeBar": True,  # Mostrar u ocultar la ModeBar
@@ -193,7 +202,7 @@ with st.container():
 
 with st.container():
     # Evolution lines
-    main_metrics = pd.read_csv(f"{directory}/data/main_metrics.csv")
+    main_metrics = pd.read_csv(data_file("main_metrics.csv", version))
     main_metrics.rename(
         columns={
             "date": "data",
@@ -345,7 +354,7 @@ with st.container():
         st.header(":orange[Rànquing de participants]")
     st.markdown("Nombre d'observacions amb grau de recerca.")
     try:
-        pd.read_csv(f"{directory}/data/{main_project}_pt_users.csv")
+        pd.read_csv(data_file(f"{main_project}_pt_users.csv", version))
         col0, col1, col2, col3 = st.columns([4, 1, 4, 1])
 
         # Ranking general
@@ -354,7 +363,7 @@ with st.container():
             # Tabla
             if "pt_users0" not in st.session_state:
                 st.session_state.pt_users0 = pd.read_csv(
-                    f"{directory}/data/{main_project}_pt_users.csv"
+                    data_file(f"{main_project}_pt_users.csv", version)
                 )
                 st.session_state.pt_users0 = st.session_state.pt_users0[
                     -st.session_state.pt_users0.participant.isin(exclude_users)
@@ -402,9 +411,8 @@ with st.container():
         st.header(":orange[Agraïments]")
     st.markdown("A la Biomarató 2025 de Catalunya han participat:")
     try:
-        df_total = pd.read_csv(f"{directory}/data/{main_project}_df_obs.csv")
-        list_participants = df_total.user_login.unique()
-        list_participants.sort()
+        df_total = read_table(data_file(f"{main_project}_df_obs.csv", version))
+        list_participants = sorted(df_total.user_login.dropna().astype(str).unique())
         linked_list = []
         for p in list_participants:
             linked_list.append(f"[{p}](https://minka-sdg.org/users/{p})")
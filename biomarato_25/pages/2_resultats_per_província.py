@@ -5,7 +5,7 @@ import os
 import pandas as pd
 import requests
 import streamlit as st
-from utils import fig_provinces, get_metrics_province
+from utils import data_file, data_version, fig_provinces, get_metrics_province
 
 # Variable de entorno para el directorio
 try:
@@ -22,6 +22,9 @@ st.set_page_config(
     page_title="Dashboard BioMARató 2025",
 )
 
+# Snapshot de datos publicado: clave de las cachés de la página
+version = data_version()
+
 # configuración de ModeBar
 config_modebar = {
     "displayModeBar": True,  # Mostrar u ocultar la ModeBar
@@ -223,7 +226,7 @@ with st.container():
                 # Dataframe
                 if "pt_users1" not in st.session_state:
                     st.session_state.pt_users1 = pd.read_csv(
-                        f"{directory}/data/{project_id_gir}_pt_users.csv"
+                        data_file(f"{project_id_gir}_pt_users.csv", version)
                     )
                     st.session_state.pt_users1 = st.session_state.pt_users1[
                         -st.session_state.pt_users1.participant.isin(exclude_users)
@@ -276,7 +279,7 @@ with st.container():
                 # Dataframe
                 if "pt_users2" not in st.session_state:
                     st.session_state.pt_users2 = pd.read_csv(
-                        f"{directory}/data/{project_id_tarr}_pt_users.csv"
+                        data_file(f"{project_id_tarr}_pt_users.csv", version)
                     )
                     st.session_state.pt_users2 = st.session_state.pt_users2[
                         -st.session_state.pt_users2.participant.isin(exclude_users)
@@ -328,7 +331,7 @@ with st.container():
                 # Dataframe
                 if "pt_users3" not in st.session_state:
                     st.session_state.pt_users3 = pd.read_csv(
-                        f"{directory}/data/{project_id_bcn}_pt_users.csv"
+                        data_file(f"{project_id_bcn}_pt_users.csv", version)
                     )
                     st.session_state.pt_users3 = st.session_state.pt_users3[
                         -st.session_state.pt_users3.participant.isin(exclude_users)
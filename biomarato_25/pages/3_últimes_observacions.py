@@ -5,7 +5,7 @@ import pandas as pd
 import requests
 import streamlit as st
 from markdownlit import mdlit
-from utils import get_last_obs, reindex
+from utils import data_file, data_version, get_last_obs, get_last_species, reindex
 
 # Variable de entorno para el directorio
 try:
@@ -22,6 +22,9 @@ st.set_page_config(
     page_title="Dashboard BioMARató 2025",
 )
 
+# Snapshot de datos publicado: clave de las cachés de la página
+version = data_version()
+
 # configuración de ModeBar
 config_modebar = {
     "displayModeBar": True,  # Mostrar u ocultar la ModeBar
@@ -130,23 +133,6 @@ st.markdown(
 )
 
 
-def get_last_species_from_obs(df_obs, df_photos):
-    df_obs2 = df_obs[df_obs["taxon_rank"] == "species"].reset_index(drop=True)
-    df_obs3 = df_obs2.sort_values(by=["observed_on", "observed_on_time"]).reset_index(
-        drop=True
-    )
-    df_obs4 = df_obs3.drop_duplicates(subset=["taxon_id"], keep="first")
-    df_obs5 = df_obs4.sort_values(
-        by=["observed_on", "observed_on_time"], ascending=False
-    ).reset_index(drop=True)
-
-    df_unique_photos = df_photos.drop_duplicates(subset=["id"], keep="first")
-    df_result = pd.merge(
-        df_obs5, df_unique_photos[["id", "photos_medium_url", "attribution"]], on="id"
-    )
-    return df_result
-
-
 def show_last_species(df, provincia_name):
     """
     Show the last species added to the list.
@@ -212,17 +198,10 @@ with st.container():
     # Visor de imágenes: 15 imágenes, máximo 3 por usuario
     # Excluye a Xavi y a mediambient_ajelprat en la función
 
-    last_total = get_last_obs(main_project)
+    last_total = get_last_obs(main_project, version)
 
-    # convertimos el df para que sólo aparezcan 5 obs de cada usuario como máximo
-    results = pd.DataFrame()
-    for user in last_total.user_login.unique():
-        last_five = last_total[last_total.user_login == user][:3]
-        results = pd.concat([results, last_five], axis=0)
-    # results = results.reset_index(drop=True)
-    results = (
-        results.sort_values(by="id", ascending=False).reset_index(drop=True).head(15)
-    )
+    # La vista ya viene ordenada: como máximo 3 obs de cada usuario
+    results = last_total[last_total.user_rank < 3].reset_index(drop=True).head(15)
 
     c1, c2, c3, c4, c5 = st.columns(5)
     col = 0
@@ -280,27 +259,21 @@ with st.container():
     # Dataframes de observaciones de cada provincia
     try:
         province_id = project_id_gir
-        df_obs1 = pd.read_csv(f"{directory}/data/{province_id}_df_obs.csv")
-        df_photos1 = pd.read_csv(f"{directory}/data/{province_id}_df_photos.csv")
-        sp_girona = get_last_species_from_obs(df_obs1, df_photos1)
+        sp_girona = get_last_species(province_id, version)
         sp_girona = sp_girona[-sp_girona.user_login.isin(excluded)]
 
     except:
         sp_girona = None
     try:
         province_id = project_id_tarr
-        df_obs1 = pd.read_csv(f"{directory}/data/{province_id}_df_obs.csv")
-        df_photos1 = pd.read_csv(f"{directory}/data/{province_id}_df_photos.csv")
-        sp_tarragona = get_last_species_from_obs(df_obs1, df_photos1)
+        sp_tarragona = get_last_species(province_id, version)
         sp_tarragona = sp_tarragona[-sp_tarragona.user_login.isin(excluded)]
     except FileNotFoundError:
         sp_tarragona = None
 
     try:
         province_id = project_id_bcn
-        df_obs1 = pd.read_csv(f"{directory}/data/{province_id}_df_obs.csv")
-        df_photos1 = pd.read_csv(f"{directory}/data/{province_id}_df_photos.csv")
-        sp_barcelona = get_last_species_from_obs(df_obs1, df_photos1)
+        sp_barcelona = get_last_species(province_id, version)
         sp_barcelona = sp_barcelona[-sp_barcelona.user_login.isin(excluded)]
 
     except FileNotFoundError:
@@ -329,7 +302,7 @@ with st.container():
     st.divider()
 
 # Nuevas especies en place BioMARató
-df_species = pd.read_csv(f"{directory}/data/place_biomarato_species.csv")
+df_species = pd.read_csv(data_file("place_biomarato_species.csv", version))
 
 with st.container():
     st.header("Noves espècies a l'àrea Biomarató en els darrers 30 dies")
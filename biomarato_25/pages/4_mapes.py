@@ -1,9 +1,14 @@
 import os
+import sys
 
-import pandas as pd
 import streamlit as st
 import streamlit.components.v1 as components
-from utils import create_heatmap, create_markercluster
+from utils import create_heatmap, create_markercluster, data_file, data_version
+
+sys.path.append(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+)
+from common.storage import read_table
 
 # Variable de entorno para el directorio
 try:
@@ -19,6 +24,9 @@ st.set_page_config(
     page_title="Dashboard BioMARató 2025",
 )
 
+# Snapshot de datos publicado: clave de las cachés de la página
+version = data_version()
+
 # configuración de ModeBar
 config_modebar = {
     "displayModeBar": True,  # Mostrar u ocultar la ModeBar
@@ -151,7 +159,7 @@ map_key = f"maps_{proj_id}"
 # Only load maps if they don't exist in session_state or if project changed
 if map_key not in st.session_state:
     try:
-        df_map = pd.read_csv(f"{directory}/data/{proj_id}_df_obs.csv")
+        df_map = read_table(data_file(f"{proj_id}_df_obs.csv", version))
         # Store both maps in a dictionary with this project's key
         st.session_state[map_key] = {
             "heatmap": create_heatmap(df_map),
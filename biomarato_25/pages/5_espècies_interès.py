@@ -6,6 +6,7 @@ import pandas as pd
 import requests
 import streamlit as st
 from streamlit_extras.metric_cards import style_metric_cards
+from utils import data_file, data_version
 
 base_url = "https://minka-sdg.org"
 api_path = "https://api.minka-sdg.org/v1"
@@ -25,6 +26,9 @@ st.set_page_config(
     page_title="Dashboard BioMARató 2025",
 )
 
+# Snapshot de datos publicado: clave de las cachés de la página
+version = data_version()
+
 st.markdown(
     f"""
     <style>
@@ -84,7 +88,7 @@ def convert_df(df):
 
 
 def get_obs_by_species_group(df_obs, grupo):
-    df_grupo = load_csv(f"{directory}/data/species/{grupo}.csv")
+    df_grupo = load_csv(data_file(f"species/{grupo}.csv", version))
     species_ids = df_grupo.taxon_id.to_list()
     last_obs = df_obs[df_obs.taxon_id.isin(species_ids)].sort_values(
         by="observed_on", ascending=False
@@ -178,8 +182,8 @@ for tab in st.tabs(
 
     with tab:
         # Cálculos generales
-        df_especies = load_csv(f"{directory}/data/species/{grupos_especies[i]}.csv")
-        df_main_project = load_csv(f"{directory}/data/{main_project}_df_obs.csv")
+        df_especies = load_csv(data_file(f"species/{grupos_especies[i]}.csv", version))
+        df_main_project = load_csv(data_file(f"{main_project}_df_obs.csv", version))
         try:
             table_species, last_month_species = get_species_table(
                 df_main_project, df_especies
@@ -247,7 +251,7 @@ for tab in st.tabs(
             proj_id = next((k for k, v in projects.items() if v == project_name), None)
 
             try:
-                df_obs = load_csv(f"{directory}/data/{proj_id}_df_obs.csv")
+                df_obs = load_csv(data_file(f"{proj_id}_df_obs.csv", version))
                 last_obs = get_obs_by_species_group(df_obs, grupos_especies[i])
             except:
                 last_obs = pd.DataFrame()
@@ -3,18 +3,37 @@
 import datetime
 import math
 import os
+import sys
 import time
 from typing import List, Optional
 
+import numpy as np
 import pandas as pd
-import requests
 from mecoda_minka import get_dfs, get_obs
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.client import MinkaSession
+from common.counts import count_job, counts_wide, get_counts
+from common.first_obs import FIELDS, get_first_obs
+from common.instrumentation import stage, write_report
+from common.latest_obs import build_last_obs, build_last_species
+from common.membership import get_observation_ids, split_by_membership
+from common.obs_store import ObsStore
+from common.snapshots import publish
+from common.storage import read_table, typed, write_table
+
 BASE_URL = "https://minka-sdg.org"
 API_PATH = f"https://api.minka-sdg.org/v1"
 
 main_project = 417
 all_projects = [417, 418, 419, 420]
+# Las provincias (418-420) están contenidas en el proyecto paraguas 417: se
+# descarga sólo el 417 y las tablas de provincia se derivan de él
+derive_provinces = True
+# Place donde se busca la primera observación de las especies de los proyectos
+first_obs_place = 244
+# Usuarios que no aparecen en el visor de últimas observaciones
+last_obs_excluded = ["xasalva", "mediambient_ajelprat"]
 
 try:
     directory = f"{os.environ['DASHBOARDS']}/biomarato_25"
@@ -72,62 +91,45 @@ def update_main_metrics(proj_id: int) -> pd.DataFrame:
     Actualiza el df de las 3 métricas para cada día de la competición.
     Devuelve 0 para los días que no han llegado.
     """
-    results = []
-    observations = f"{API_PATH}/observations?"
-    species = f"{API_PATH}/observations/species_counts?"
-    observers = f"{API_PATH}/observations/observers?"
-
-    # Crear una sesión de requests
-    session = requests.Session()
-
-    # Fecha de inicio de la Biomarato: 2024/05/03 - 2024/10/15
-    day = datetime.date(year=2025, month=5, day=3)
-    rango_temporal = (datetime.date(year=2025, month=10, day=16) - day).days
-
-    for i in range(rango_temporal):
+    # Fecha de inicio de la Biomarato: 2025/05/03 - 2025/10/15
+    first_day = datetime.date(year=2025, month=5, day=3)
+    rango_temporal = (datetime.date(year=2025, month=10, day=16) - first_day).days
+    days = [first_day + datetime.timedelta(days=i) for i in range(rango_temporal)]
+
+    # Un job por día y métrica, sólo para los días que ya han llegado
+    jobs = []
+    for day in days:
         if datetime.datetime.today().date() >= day:
             st_day = day.strftime("%Y-%m-%d")
-
             params = {
                 "project_id": proj_id,
                 "d2": st_day,
                 "order": "desc",
                 "order_by": "created_at",
             }
+            for endpoint in ["observations", "species", "observers"]:
+                jobs.append(count_job(endpoint, params, date=st_day))
 
-            # Utilizar la sesión para realizar las solicitudes
-            total_species = session.get(species, params=params).json()["total_results"]
-            total_participants = session.get(observers, params=params).json()[
-                "total_results"
-            ]
-            total_obs = session.get(observations, params=params).json()["total_results"]
-
-            result = {
-                "date": st_day,
-                "observations": total_obs,
-                "species": total_species,
-                "participants": total_participants,
-            }
-        # Para el resto devuelve 0
-        else:
-            result = {
-                "date": day.strftime("%Y-%m-%d"),
-                "observations": 0,
-                "species": 0,
-                "participants": 0,
-            }
-
-        results.append(result)
-        day = day + datetime.timedelta(days=1)
+    result_df = pd.DataFrame({"date": [day.strftime("%Y-%m-%d") for day in days]})
+    if len(jobs) > 0:
+        df_counts = counts_wide(get_counts(jobs), index="date")
+        result_df = pd.merge(result_df, df_counts, on="date", how="left")
+    else:
+        result_df[["observations", "species", "observers"]] = 0
 
-    result_df = pd.DataFrame(results)
+    # Para el resto devuelve 0
+    result_df = result_df.rename(columns={"observers": "participants"})
+    result_df = result_df[["date", "observations", "species", "participants"]]
+    result_df = result_df.fillna(0).astype(
+        {"observations": int, "species": int, "participants": int}
+    )
     print("Updated main metrics")
     return result_df
 
 
 def get_list_users(id_project):
     users = []
-    session = requests.Session()
+    session = MinkaSession()
 
     url1 = f"https://api.minka-sdg.org/v1/observations/observers?project_id={id_project}&quality_grade=research"
     results = session.get(url1).json()["results"]
@@ -157,85 +159,158 @@ def get_list_users(id_project):
 
 
 # update obs for projects
-def get_new_data(project, grade=None):
-    df_obs = pd.read_csv(f"{directory}/data/{project}_df_obs.csv")
-    df_photos = pd.read_csv(f"{directory}/data/{project}_df_photos.csv")
-    max_id = df_obs["id"].max()
+def open_store(project) -> ObsStore:
+    return ObsStore(
+        f"{directory}/data/{project}_df_obs.csv",
+        f"{directory}/data/{project}_df_photos.csv",
+    )
+
 
+def get_new_data(store: ObsStore, project, grade=None):
     # Comprueba si hay observaciones nuevas
-    obs = get_obs(id_project=project, id_above=max_id, grade=grade)
+    obs = get_obs(id_project=project, id_above=store.max_id(), grade=grade)
     if len(obs) > 0:
         print(f"Add {len(obs)} obs in project {project}")
-        df_obs2, df_photos2 = get_dfs(obs)
-        df_obs = pd.concat([df_obs, df_obs2], ignore_index=True)
-        df_obs.to_csv(f"{directory}/data/{project}_df_obs.csv", index=False)
-        df_photos = pd.concat([df_photos, df_photos2], ignore_index=True)
-        df_photos.to_csv(f"{directory}/data/{project}_df_photos.csv", index=False)
+        store.upsert(*get_dfs(obs))
 
 
-def update_dfs_projects(
-    project,
-    day=(datetime.date.today() - datetime.timedelta(days=1)).strftime("%Y-%m-%d"),
-    grade=None,
-):
+def update_dfs_projects(store: ObsStore, project, day=None, grade=None):
+    """
+    Aplica las observaciones modificadas desde `day` (por defecto, desde la
+    última sincronización o desde ayer). Con `grade`, las que ya no tienen ese
+    grado (p. ej. han pasado a casual) se eliminan.
+    """
+    if day is None:
+        yesterday = datetime.date.today() - datetime.timedelta(days=1)
+        day = store.watermark or yesterday.strftime("%Y-%m-%d")
 
-    # updated today
-    obs_nuevas = get_obs(id_project=project, updated_since=day, grade=grade)
+    obs_nuevas = get_obs(id_project=project, updated_since=day)
     if len(obs_nuevas) > 0:
         df_obs_new, df_photos_new = get_dfs(obs_nuevas)
-        df_photos_new["photos_id"] = df_photos_new["photos_id"].astype(int)
-
-        # get downloaded
-        df_obs = pd.read_csv(f"{directory}/data/{project}_df_obs.csv")
-        df_photos = pd.read_csv(f"{directory}/data/{project}_df_photos.csv")
-        old_obs = df_obs[-df_obs["id"].isin(df_obs_new["id"].to_list())]
-        old_photos = df_photos[
-            -df_photos["photos_id"].isin(df_photos_new["photos_id"].to_list())
-        ]
-
-        # join old and updated
-        df_obs_updated = pd.concat(
-            [old_obs, df_obs_new], ignore_index=True
-        ).sort_values(by="id", ascending=False)
-        df_photo_updated = pd.concat(
-            [old_photos, df_photos_new], ignore_index=True
-        ).sort_values(by="photos_id", ascending=False)
-    else:
-        df_obs_updated = None
-        df_photo_updated = None
-    # remove casuals
-    obs_casual = get_obs(grade="casual", updated_since=day)
-    if len(obs_casual) > 0:
-        casual_ids = [ob_casual.id for ob_casual in obs_casual]
-        df_obs_updated = df_obs_updated[-df_obs_updated["id"].isin(casual_ids)]
-        df_photo_updated = df_photo_updated[-df_photo_updated["id"].isin(casual_ids)]
+        if grade is not None:
+            lost = df_obs_new["quality_grade"] != grade
+            store.remove(df_obs_new.loc[lost, "id"])
+            df_obs_new = df_obs_new[~lost]
+            df_photos_new = df_photos_new[df_photos_new["id"].isin(df_obs_new["id"])]
+        store.upsert(df_obs_new, df_photos_new)
 
-    print(f"Updated obs and photos for project {project}: {len(df_obs_updated)}")
-    return df_obs_updated, df_photo_updated
+    print(f"Updated obs and photos for project {project}: {len(store)}")
 
 
-def get_ranking_users(proj_id, grade=None):
-    get_new_data(proj_id, grade)
-    update_dfs_projects(proj_id, grade=grade)
-    df_obs = pd.read_csv(f"{directory}/data/{proj_id}_df_obs.csv")
-    df_photos = pd.read_csv(f"{directory}/data/{proj_id}_df_photos.csv")
+def sync_obs(project, grade=None) -> tuple:
+    """
+    Sincroniza las observaciones y fotos del proyecto: añade las nuevas y
+    aplica las modificadas. Si el total no cuadra con la API (observaciones
+    borradas, o no hay nada descargado) hace una descarga completa.
+
+    Devuelve el store y si la tabla ha cambiado.
+    """
+    store = open_store(project)
+    started = datetime.datetime.now(datetime.timezone.utc)
+    if len(store) > 0:
+        get_new_data(store, project, grade)
+        update_dfs_projects(store, project, grade=grade)
+
+    params = {"project_id": project}
+    if grade is not None:
+        params["quality_grade"] = grade
+    jobs = [count_job("observations", params)]
+    total = get_counts(jobs, cache=False)["total_results"].iloc[0]
+    if len(store) != total:
+        print(f"Descarga completa del proyecto {project}")
+        obs = get_obs(id_project=project, grade=grade)
+        if len(obs) > 0:
+            store.replace(*get_dfs(obs))
+
+    updated = store.save(watermark=started.strftime("%Y-%m-%dT%H:%M:%SZ"))
+    return store, updated
+
 
-    if len(df_obs) == 0:
-        df_obs = None
-        df_photos = None
+def get_ranking_users(proj_id, grade=None):
+    store, __ = sync_obs(proj_id, grade)
+    if len(store) == 0:
+        return None, None, None
 
     # Sacamos pt_users
-    if df_obs is not None:
-        pt_users = get_list_users(proj_id)
+    pt_users = get_list_users(proj_id)
+    return store.df_obs, store.df_photos, pt_users
 
-    else:
-        pt_users = None
 
-    return df_obs, df_photos, pt_users
+def _same_csv(df: pd.DataFrame, path: str, sort_by: str) -> bool:
+    """
+    Si guardar `df` (ordenada como en ObsStore.save) dejaría igual el CSV de
+    `path`.
+    """
+    try:
+        with open(path) as f:
+            current = f.read()
+    except FileNotFoundError:
+        return False
+    return df.sort_values(by=sort_by, ascending=False).to_csv(index=False) == current
+
+
+def derive_province_tables(umbrella: ObsStore, umbrella_updated: bool, grade=None):
+    """
+    Crea las tablas de observaciones y fotos de cada provincia a partir de las
+    del proyecto paraguas, con la pertenencia de cada observación obtenida por
+    ids (`only_id`). Sólo se reescriben las que han cambiado. Devuelve
+    proj_id -> si su tabla ha cambiado.
+    """
+    params = {"quality_grade": grade} if grade is not None else {}
+    umbrella_ids = umbrella.df_obs["id"].to_numpy(dtype="int64")
+    changed = {}
+    for proj_id in all_projects:
+        if proj_id == main_project:
+            continue
+        ids = get_observation_ids(project_id=proj_id, **params)
+        # Las que faltan en el paraguas no pueden estar en la tabla derivada
+        present = np.intersect1d(ids, umbrella_ids)
+        missing = len(ids) - len(present)
+        if missing > 0:
+            print(f"{missing} obs del proyecto {proj_id} no están en {main_project}")
+
+        store = open_store(proj_id)
+        stored_ids = np.sort(store.df_obs["id"].to_numpy(dtype="int64"))
+        if umbrella_updated or not np.array_equal(stored_ids, present):
+            df_obs, df_photos = split_by_membership(
+                umbrella.df_obs, umbrella.df_photos, present
+            )
+            df_obs = typed(df_obs)
+            # Con el paraguas actualizado, la provincia puede no haber cambiado
+            if not (
+                _same_csv(df_obs, store.obs_path, "id")
+                and _same_csv(df_photos, store.photos_path, "photos_id")
+            ):
+                store.replace(df_obs, df_photos)
+        changed[proj_id] = store.save()
+    return changed
+
+
+def update_last_views(proj_id, force=False):
+    """
+    Materializa las vistas de últimas observaciones y últimas especies del
+    proyecto que leen las apps, si sus tablas han cambiado o aún no existen.
+    """
+    last_obs_path = f"{directory}/data/{proj_id}_last_obs.csv"
+    last_species_path = f"{directory}/data/{proj_id}_last_species.csv"
+    if (
+        not force
+        and os.path.exists(last_obs_path)
+        and os.path.exists(last_species_path)
+    ):
+        return
+    df_obs = read_table(f"{directory}/data/{proj_id}_df_obs.csv")
+    df_photos = read_table(f"{directory}/data/{proj_id}_df_photos.csv")
+    write_table(
+        build_last_obs(df_obs, df_photos, exclude_logins=last_obs_excluded),
+        last_obs_path,
+    )
+    write_table(build_last_species(df_obs, df_photos), last_species_path)
+    print(f"Últimas observaciones actualizadas para {proj_id}")
 
 
 def get_list_species(proj_id: int, type="project") -> Optional[pd.DataFrame]:
-    session = requests.Session()
+    session = MinkaSession()
     if type == "project":
         params = {"project_id": proj_id, "quality_grade": "research"}
     elif type == "place":
@@ -271,127 +346,90 @@ def get_list_species(proj_id: int, type="project") -> Optional[pd.DataFrame]:
     return species_count
 
 
-def get_first_obs_taxon(taxon_id, proj_id, type="project", session=None):
-    if session is None:
-        session = requests.Session()
-
-    url = f"{API_PATH}/observations"
-    if type == "place":
-        params = {
-            "place_id": proj_id,
-            "quality_grade": "research",
-            "taxon_id": taxon_id,
-            "order_by": "observed_on",
-            "order": "asc",
-        }
-    else:
-        params = {
-            "place_id": 244,
-            "quality_grade": "research",
-            "taxon_id": taxon_id,
-            "order_by": "observed_on",
-            "order": "asc",
-        }
-
-    results = session.get(url, params=params).json()["results"]
-
-    if not results:
-        return [None, None, None, None]
-
-    primera_observacion = results[0]
-
-    date = primera_observacion["observed_on"]
-    author = primera_observacion["user"]["login"]
-    obs_id = primera_observacion["id"]
-
-    results_photos = session.get(url, params={"id": obs_id}).json()["results"]
-    try:
-        photo_url = results_photos[0]["photos"][0]["url"].replace("/square", "/large")
-    except:
-        photo_url = None
-
-    return [date, author, obs_id, photo_url]
-
-
 if __name__ == "__main__":
-    # Get main_metrics.csv
     start_time = time.time()
 
-    main_metrics_df = update_main_metrics(main_project)
-    main_metrics_df.to_csv(f"{directory}/data/main_metrics.csv", index=False)
-    print("Main metrics actualizada")
-
     # Update df de cada proyecto
-    for proj_id in all_projects:
-        print("Update df:", proj_id)
-        downloaded_obs = pd.read_csv(f"{directory}/data/{proj_id}_df_obs.csv")
-        obs = get_obs(id_project=proj_id, grade="research")
-        # Comprueba si hay observaciones y si hay más que en el archivo descargado
-        if len(obs) > 0 and len(obs) != len(downloaded_obs):
-            df_obs, df_photos = get_dfs(obs)
-            pt_users = get_list_users(proj_id)
-            # df_obs, df_photos, pt_users = get_ranking_users(proj_id, grade="research")
-            try:
-                df_obs.to_csv(f"{directory}/data/{proj_id}_df_obs.csv", index=False)
+    with stage("observations"):
+        if derive_provinces:
+            print("Update df:", main_project)
+            umbrella, updated = sync_obs(main_project, grade="research")
+            changed = {main_project: updated}
+            changed.update(derive_province_tables(umbrella, updated, grade="research"))
+        else:
+            changed = {}
+            for proj_id in all_projects:
+                print("Update df:", proj_id)
+                changed[proj_id] = sync_obs(proj_id, grade="research")[1]
+
+        for proj_id, updated in changed.items():
+            if updated:
                 print(f"df_obs_{proj_id}.csv updated")
-            except:
-                print("No se ha actualizado los df_obs")
-                pass
+                pt_users = get_list_users(proj_id)
+                try:
+                    pt_users.to_csv(
+                        f"{directory}/data/{proj_id}_pt_users.csv", index=False
+                    )
+                    print(f"pt_users_{proj_id}.csv updated")
+                except:
+                    print("No se han actualizado los pt_users")
+                    pass
+
+    # Vistas de últimas observaciones, una vez por ejecución
+    with stage("last_obs"):
+        for proj_id, updated in changed.items():
             try:
-                df_photos.to_csv(
-                    f"{directory}/data/{proj_id}_df_photos.csv", index=False
-                )
-                print(f"df_photos_{proj_id}.csv updated")
-            except:
-                print("No se han actualizado los df_photos")
-                pass
-            try:
-                pt_users.to_csv(f"{directory}/data/{proj_id}_pt_users.csv", index=False)
-                print(f"pt_users_{proj_id}.csv updated")
-            except:
-                print("No se han actualizado los pt_users")
-                pass
+                update_last_views(proj_id, force=updated)
+            except FileNotFoundError:
+                print(f"No hay observaciones descargadas de {proj_id}")
+
+    # Main metrics (totales de la API por día)
+    with stage("main_metrics"):
+        main_metrics_df = update_main_metrics(main_project)
+        main_metrics_df.to_csv(f"{directory}/data/main_metrics.csv", index=False)
+        print("Main metrics actualizada")
+
+    # Índice de primeras observaciones, compartido por las listas de especies
+    first_obs_index = f"{directory}/data/first_obs_index.csv"
 
     # Get listado de species
-    for proj_id in all_projects:
-        print(f"Get species for project {proj_id}")
-        species = get_list_species(proj_id)
-        downloaded_species = pd.read_csv(f"{directory}/data/{proj_id}_species.csv")
-        if species is not None and len(species) != len(downloaded_species):
-            with requests.Session() as session:
-                species[["first_date", "author", "obs_id", "photo_url"]] = (
-                    species.apply(
-                        lambda x: get_first_obs_taxon(x["id"], proj_id, session), axis=1
-                    ).to_list()
-                )
-            # species = species[species.author != "xasalva"]
-            species = species.sort_values(
-                by=["first_date", "obs_id"], ascending=False
-            ).reset_index(drop=True)
-            species.to_csv(f"{directory}/data/{proj_id}_species.csv", index=False)
-            print(f"Species updated for {proj_id}")
+    with stage("species"):
+        for proj_id in all_projects:
+            print(f"Get species for project {proj_id}")
+            species = get_list_species(proj_id)
+            downloaded_species = pd.read_csv(f"{directory}/data/{proj_id}_species.csv")
+            if species is not None and len(species) != len(downloaded_species):
+                species[FIELDS] = get_first_obs(
+                    species["id"], first_obs_place, first_obs_index
+                ).to_numpy()
+                # species = species[species.author != "xasalva"]
+                species = species.sort_values(
+                    by=["first_date", "obs_id"], ascending=False
+                ).reset_index(drop=True)
+                species.to_csv(f"{directory}/data/{proj_id}_species.csv", index=False)
+                print(f"Species updated for {proj_id}")
 
     # Get listado de species por lugar
-    print(f"Get species for biomarato")
-    place_biomarato = 244
-    species_biomarato = get_list_species(place_biomarato, type="place")
-    downloaded_species_biomarato = pd.read_csv(
-        f"{directory}/data/place_biomarato_species.csv"
-    )
-    if len(species_biomarato) != len(downloaded_species_biomarato):
-        with requests.Session() as session:
-            species_biomarato[["first_date", "author", "obs_id", "photo_url"]] = (
-                species_biomarato.apply(
-                    lambda x: get_first_obs_taxon(
-                        x["id"], place_biomarato, type="place", session=session
-                    ),
-                    axis=1,
-                ).to_list()
-            )
-        species_biomarato.to_csv(
-            f"{directory}/data/place_biomarato_species.csv", index=False
+    with stage("place_species"):
+        print(f"Get species for biomarato")
+        place_biomarato = 244
+        species_biomarato = get_list_species(place_biomarato, type="place")
+        downloaded_species_biomarato = pd.read_csv(
+            f"{directory}/data/place_biomarato_species.csv"
         )
-        print(f"Species updated for biomarato")
+        if len(species_biomarato) != len(downloaded_species_biomarato):
+            species_biomarato[FIELDS] = get_first_obs(
+                species_biomarato["id"], place_biomarato, first_obs_index
+            ).to_numpy()
+            species_biomarato.to_csv(
+                f"{directory}/data/place_biomarato_species.csv", index=False
+            )
+            print(f"Species updated for biomarato")
+
+    # Publica los datos de esta ejecución para las apps, todos a la vez
+    publish(f"{directory}/data")
+
+    write_report(f"{directory}/data/run_report.json")
 
     end_time = time.time()
     execution_time = end_time - start_time
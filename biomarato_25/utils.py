@@ -1,15 +1,24 @@
-import datetime
 import os
+import sys
 
 import folium
 import numpy as np
 import pandas as pd
 import plotly.express as px
-import requests
 import streamlit as st
 import streamlit.components.v1 as components
 from folium.plugins import HeatMap, MarkerCluster
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.counts import count_job, counts_wide, get_counts
+from common.project_metrics import (
+    get_previous_totals,
+    get_project_totals,
+    get_projects_totals,
+)
+from common.snapshots import current_version, data_path
+from common.storage import read_table
+
 try:
     directory = f"{os.environ['DASHBOARDS']}/biomarato_25"
 except KeyError:
@@ -17,6 +26,29 @@ except KeyError:
         "Configura la variable de entorno DASHBOARDS en .bashrc apuntando al directorio de los dashboards."
     )
 
+# Tablas que las páginas guardan en la sesión y que dependen de los datos
+SESSION_TABLES = ("pt_users", "maps_")
+
+
+def data_version():
+    """
+    Versión del snapshot de datos publicado por update.py. Si ha cambiado
+    desde la última ejecución de la sesión, descarta las tablas guardadas.
+    """
+    version = current_version(f"{directory}/data")
+    if st.session_state.get("data_version") != version:
+        for key in [k for k in st.session_state if k.startswith(SESSION_TABLES)]:
+            del st.session_state[key]
+        st.session_state.data_version = version
+    return version
+
+
+def data_file(name: str, version: str = None) -> str:
+    """
+    Ruta de `name` en el snapshot de datos `version` (por defecto, el publicado).
+    """
+    return data_path(f"{directory}/data", name, version)
+
 
 base_url = "https://minka-sdg.org"
 api_path = f"https://api.minka-sdg.org/v1"
@@ -56,7 +88,7 @@ def load_maps():
     # Only load maps if they don't exist in session_state or if project changed
     if map_key not in st.session_state:
         try:
-            df_map = pd.read_csv(f"{directory}/data/{proj_id}_df_obs.csv")
+            df_map = read_table(data_file(f"{proj_id}_df_obs.csv"))
             # Store both maps in a dictionary with this project's key
             st.session_state[map_key] = {
                 "heatmap": create_heatmap(df_map),
@@ -80,77 +112,21 @@ def load_maps():
 
 
 @st.cache_data(ttl=300)
-def get_main_metrics(proj_id, session=None):
-    species = f"{api_path}/observations/species_counts?"
-    url1 = f"{species}&project_id={proj_id}"
-    if session is None:
-        session = requests.Session()
-    total_species = session.get(url1).json()["total_results"]
-
-    observers = f"{api_path}/observations/observers?"
-    url2 = f"{observers}&project_id={proj_id}"
-    total_participants = session.get(url2).json()["total_results"]
-
-    observations = f"{api_path}/observations?"
-    url3 = f"{observations}&project_id={proj_id}"
-    total_obs = session.get(url3).json()["total_results"]
-
-    return total_species, total_participants, total_obs
+def get_main_metrics(proj_id):
+    totals = get_project_totals(proj_id)
+    return totals["species"], totals["observers"], totals["observations"]
 
 
 @st.cache_data(ttl=300)
-def get_last_week_metrics(proj_id, session=None):
-    last_week_date = (datetime.datetime.today() - datetime.timedelta(days=7)).strftime(
-        "%Y-%m-%d"
-    )
-    if session is None:
-        session = requests.Session()
-    species = f"{api_path}/observations/species_counts?"
-    url1 = f"{species}&project_id={proj_id}&d2={last_week_date}&order=desc&order_by=created_at"
-    lw_spe = session.get(url1).json()["total_results"]
-
-    observers = f"{api_path}/observations/observers?"
-    url2 = f"{observers}&project_id={proj_id}&d2={last_week_date}&order=desc&order_by=created_at"
-    lw_part = session.get(url2).json()["total_results"]
-
-    observations = f"{api_path}/observations?"
-    url3 = f"{observations}&project_id={proj_id}&d2={last_week_date}&order=desc&order_by=created_at"
-    lw_obs = session.get(url3).json()["total_results"]
-    return lw_obs, lw_spe, lw_part
+def get_last_week_metrics(proj_id):
+    totals = get_previous_totals(proj_id, days=7)
+    return totals["observations"], totals["species"], totals["observers"]
 
 
 @st.cache_data(ttl=3600)
 def get_metrics_province():
-    prov = {
-        projects[0]["name"]: projects[0]["id"],
-        projects[1]["name"]: projects[1]["id"],
-        projects[2]["name"]: projects[2]["id"],
-    }
-
-    result = []
-
-    with requests.Session() as session:
-        for k, v in prov.items():
-            species = f"{api_path}/observations/species_counts?"
-            url1 = f"{species}&project_id={v}"
-            total_species = session.get(url1).json().get("total_results")
-
-            observers = f"{api_path}/observations/observers?"
-            url2 = f"{observers}&project_id={v}"
-            total_participants = session.get(url2).json().get("total_results")
-
-            observations = f"{api_path}/observations?"
-            url3 = f"{observations}&project_id={v}"
-            total_obs = session.get(url3).json().get("total_results")
-
-            data = {
-                "provincia": k,
-                "espècies": total_species,
-                "participants": total_participants,
-                "observacions": total_obs,
-            }
-            result.append(data)
-    main_metrics = pd.DataFrame(result)
+    prov = {project["id"]: project["name"] for project in projects[:3]}
+    main_metrics = get_projects_totals(prov, key="provincia")
     return main_metrics
 
 
@@ -290,39 +266,21 @@ def fig_provinces(main_metrics: pd.DataFrame, field: str, title: str) -> px.bar:
 
 
 @st.cache_data(ttl=3600)
-def get_last_obs(proj_id):
-    last_obs = pd.read_csv(f"{directory}/data/{proj_id}_df_obs.csv")
-    last_photos = pd.read_csv(f"{directory}/data/{proj_id}_df_photos.csv")
-    total = pd.merge(
-        last_photos,
-        last_obs[
-            [
-                "id",
-                "observed_on",
-                "quality_grade",
-                "kingdom",
-                "phylum",
-                "class",
-                "order",
-                "family",
-                "genus",
-            ]
-        ],
-        on="id",
-        how="left",
-    )
+def get_last_obs(proj_id, version=None):
+    """
+    Últimas observaciones research con foto, materializadas por update.py.
+    """
+    return read_table(data_file(f"{proj_id}_last_obs.csv", version))
 
-    excluded_logins = ["xasalva", "mediambient_ajelprat"]
-    last_total = total[
-        (~total.user_login.isin(excluded_logins)) & (total.quality_grade == "research")
-    ].reset_index(drop=True)
-    last_total.drop_duplicates(subset="id", inplace=True)
-    last_total = last_total.sort_values(by="id", ascending=False).reset_index(drop=True)
 
-    return last_total
+@st.cache_data(ttl=3600)
+def get_last_species(proj_id, version=None):
+    """
+    Últimas especies registradas, materializadas por update.py.
+    """
+    return read_table(data_file(f"{proj_id}_last_species.csv", version))
 
 
-@st.cache_resource(ttl=3600)
 def create_heatmap(df):
     df.dropna(subset=["latitude", "longitude"], inplace=True)
     locations = [(lat, lon) for lat, lon in zip(df["latitude"], df["longitude"])]
@@ -389,9 +347,6 @@ def reindex(df):
 
 @st.cache_data(ttl=3600)
 def get_grouped_monthly(project_id: int, year) -> pd.DataFrame:
-
-    session = requests.Session()
-
     meses = {
         f"{year}-05": ["01", "31"],
         f"{year}-06": ["01", "30"],
@@ -401,38 +356,30 @@ def get_grouped_monthly(project_id: int, year) -> pd.DataFrame:
         f"{year}-10": ["01", "15"],
     }
 
-    results_by_month = []
-
+    jobs = []
     for mes, limits in meses.items():
-        month = {}
-
-        url_obs = f"{api_path}/observations"
-        url_spe = f"{api_path}/observations/species_counts"
-        url_observers = f"{api_path}/observations/observers"
-
         params = {
             "project_id": project_id,
             "d1": f"{mes}-{limits[0]}",
             "d2": f"{mes}-{limits[1]}",
         }
+        for endpoint in ["observations", "species", "observers"]:
+            jobs.append(count_job(endpoint, params, data=mes))
 
-        month["data"] = mes
-        month["observacions"] = session.get(url_obs, params=params).json()[
-            "total_results"
-        ]
-        month["espècies"] = session.get(url_spe, params=params).json()["total_results"]
-        month["participants"] = session.get(url_observers, params=params).json()[
-            "total_results"
-        ]
-
-        results_by_month.append(month)
-
-    return pd.DataFrame(results_by_month)
+    results_by_month = counts_wide(get_counts(jobs, cache=True), index="data")
+    results_by_month = results_by_month.rename(
+        columns={
+            "observations": "observacions",
+            "species": "espècies",
+            "observers": "participants",
+        }
+    )
+    return results_by_month[["data", "observacions", "espècies", "participants"]]
 
 
 # Toma dataframe de main_metrics hasta día actual
 def get_previous_years(main_metrics_filtered):
-    df_2022 = pd.read_csv(f"{directory}/data/2022_main_metrics.csv")
+    df_2022 = pd.read_csv(data_file("2022_main_metrics.csv"))
     df_2022_filtered = df_2022.loc[: len(main_metrics_filtered) - 1, :].copy()
     df_2022_filtered.rename(
         columns={
@@ -444,7 +391,7 @@ def get_previous_years(main_metrics_filtered):
     )
 
     # Datos de 2023
-    df_2023 = pd.read_csv(f"{directory}/data/2023_main_metrics.csv")
+    df_2023 = pd.read_csv(data_file("2023_main_metrics.csv"))
     df_2023_filtered = df_2023.loc[: len(main_metrics_filtered) - 1, :].copy()
     df_2023_filtered.rename(
         columns={
@@ -456,7 +403,7 @@ def get_previous_years(main_metrics_filtered):
     )
 
     # Datos de 2023
-    df_2024 = pd.read_csv(f"{directory}/data/2024_main_metrics.csv")
+    df_2024 = pd.read_csv(data_file("2024_main_metrics.csv"))
     df_2024_filtered = df_2024.loc[: len(main_metrics_filtered) - 1, :].copy()
     df_2024_filtered.rename(
         columns={
@@ -1,11 +1,15 @@
 # Run as streamlit run app_biomarato.py --server.port 9003
 
 import os
+import sys
 from datetime import datetime, timedelta
 
 import pandas as pd
 import streamlit as st
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.storage import read_table
+
 # Variable de entorno para el directorio
 try:
     directory = f"{os.environ['DASHBOARDS']}/biomaratona_25"
@@ -380,9 +384,8 @@ with st.container():
         st.header(":orange[Agradecimentos]")
     st.markdown("Participaram da Biomaratona 2025:")
     try:
-        df_total = pd.read_csv(f"{directory}/data/{main_project}_df_obs.csv")
-        list_participants = df_total.user_login.unique()
-        list_participants.sort()
+        df_total = read_table(f"{directory}/data/{main_project}_df_obs.csv")
+        list_participants = sorted(df_total.user_login.dropna().astype(str).unique())
         linked_list = []
         for p in list_participants:
             linked_list.append(f"[{p}](https://minka-sdg.org/users/{p})")
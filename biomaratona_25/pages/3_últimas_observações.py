@@ -152,15 +152,8 @@ with st.container():
 
     last_total = get_last_obs(main_project)
 
-    # convertimos el df para que sólo aparezcan 5 obs de cada usuario como máximo
-    results = pd.DataFrame()
-    for user in last_total.user_login.unique():
-        last_five = last_total[last_total.user_login == user][:3]
-        results = pd.concat([results, last_five], axis=0)
-    # results = results.reset_index(drop=True)
-    results = (
-        results.sort_values(by="id", ascending=False).reset_index(drop=True).head(15)
-    )
+    # La vista ya viene ordenada: como máximo 3 obs de cada usuario
+    results = last_total[last_total.user_rank < 3].reset_index(drop=True).head(15)
 
     c1, c2, c3, c4, c5 = st.columns(5)
     col = 0
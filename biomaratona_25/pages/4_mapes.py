@@ -1,10 +1,15 @@
 import os
+import sys
 
-import pandas as pd
 import streamlit as st
 import streamlit.components.v1 as components
 from utils import create_heatmap, create_markercluster
 
+sys.path.append(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+)
+from common.storage import read_table
+
 # Variable de entorno para el directorio
 try:
     directory = f"{os.environ['DASHBOARDS']}/biomaratona_25"
@@ -89,7 +94,7 @@ map_key = f"maps_{proj_id}"
 # Only load maps if they don't exist in session_state or if project changed
 if map_key not in st.session_state:
     try:
-        df_map = pd.read_csv(f"{directory}/data/{proj_id}_df_obs.csv")
+        df_map = read_table(f"{directory}/data/{proj_id}_df_obs.csv")
         # Store both maps in a dictionary with this project's key
         st.session_state[map_key] = {
             "heatmap": create_heatmap(df_map),
@@ -3,19 +3,32 @@
 import datetime
 import math
 import os
+import sys
 import time
 from typing import List, Optional
 
 import pandas as pd
-import requests
 from mecoda_minka import get_dfs, get_obs
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.client import MinkaSession
+from common.counts import count_job, counts_wide, get_counts
+from common.first_obs import FIELDS, get_first_obs
+from common.instrumentation import stage, write_report
+from common.latest_obs import build_last_obs
+from common.obs_store import ObsStore
+from common.storage import read_table, write_table
+
 BASE_URL = "https://minka-sdg.org"
 API_PATH = f"https://api.minka-sdg.org/v1"
 
 main_project = 424
 place_biomaratona = 701
 all_projects = [424, 452]
+# Place donde se busca la primera observación de las especies de los proyectos
+first_obs_place = 398
+# Usuarios que no aparecen en el visor de últimas observaciones
+last_obs_excluded = ["xasalva", "mediambient_ajelprat"]
 # all_projects = [417, 418, 419, 420]
 
 try:
@@ -75,62 +88,45 @@ def update_main_metrics(proj_id: int) -> pd.DataFrame:
     Actualiza el df de las 3 métricas para cada día de la competición.
     Devuelve 0 para los días que no han llegado.
     """
-    results = []
-    observations = f"{API_PATH}/observations?"
-    species = f"{API_PATH}/observations/species_counts?"
-    observers = f"{API_PATH}/observations/observers?"
-
-    # Crear una sesión de requests
-    session = requests.Session()
-
-    # Fecha de inicio de la Biomarato: 2024/05/03 - 2024/10/15
-    day = datetime.date(year=2025, month=5, day=3)
-    rango_temporal = (datetime.date(year=2025, month=10, day=16) - day).days
-
-    for i in range(rango_temporal):
+    # Fecha de inicio de la Biomarato: 2025/05/03 - 2025/10/15
+    first_day = datetime.date(year=2025, month=5, day=3)
+    rango_temporal = (datetime.date(year=2025, month=10, day=16) - first_day).days
+    days = [first_day + datetime.timedelta(days=i) for i in range(rango_temporal)]
+
+    # Un job por día y métrica, sólo para los días que ya han llegado
+    jobs = []
+    for day in days:
         if datetime.datetime.today().date() >= day:
             st_day = day.strftime("%Y-%m-%d")
-
             params = {
                 "project_id": proj_id,
                 "d2": st_day,
                 "order": "desc",
                 "order_by": "created_at",
             }
+            for endpoint in ["observations", "species", "observers"]:
+                jobs.append(count_job(endpoint, params, date=st_day))
 
-            # Utilizar la sesión para realizar las solicitudes
-            total_species = session.get(species, params=params).json()["total_results"]
-            total_participants = session.get(observers, params=params).json()[
-                "total_results"
-            ]
-            total_obs = session.get(observations, params=params).json()["total_results"]
-
-            result = {
-                "date": st_day,
-                "observations": total_obs,
-                "species": total_species,
-                "participants": total_participants,
-            }
-        # Para el resto devuelve 0
-        else:
-            result = {
-                "date": day.strftime("%Y-%m-%d"),
-                "observations": 0,
-                "species": 0,
-                "participants": 0,
-            }
-
-        results.append(result)
-        day = day + datetime.timedelta(days=1)
+    result_df = pd.DataFrame({"date": [day.strftime("%Y-%m-%d") for day in days]})
+    if len(jobs) > 0:
+        df_counts = counts_wide(get_counts(jobs), index="date")
+        result_df = pd.merge(result_df, df_counts, on="date", how="left")
+    else:
+        result_df[["observations", "species", "observers"]] = 0
 
-    result_df = pd.DataFrame(results)
+    # Para el resto devuelve 0
+    result_df = result_df.rename(columns={"observers": "participants"})
+    result_df = result_df[["date", "observations", "species", "participants"]]
+    result_df = result_df.fillna(0).astype(
+        {"observations": int, "species": int, "participants": int}
+    )
     print("Updated main metrics")
     return result_df
 
 
 def get_list_users(id_project):
     users = []
-    session = requests.Session()
+    session = MinkaSession()
 
     url1 = f"https://api.minka-sdg.org/v1/observations/observers?project_id={id_project}&quality_grade=research"
     results = session.get(url1).json()["results"]
@@ -160,90 +156,102 @@ def get_list_users(id_project):
 
 
 # update obs for projects
-def get_new_data(project, grade=None):
-    try:
-        df_obs = pd.read_csv(f"{directory}/data/{project}_df_obs.csv")
-        df_photos = pd.read_csv(f"{directory}/data/{project}_df_photos.csv")
-        max_id = df_obs["id"].max()
-    except:
-        df_obs = pd.DataFrame()
-        df_photos = pd.DataFrame()
-        max_id = 0
+def open_store(project) -> ObsStore:
+    return ObsStore(
+        f"{directory}/data/{project}_df_obs.csv",
+        f"{directory}/data/{project}_df_photos.csv",
+    )
 
+
+def get_new_data(store: ObsStore, project, grade=None):
     # Comprueba si hay observaciones nuevas
-    obs = get_obs(id_project=project, id_above=max_id, grade=grade)
+    obs = get_obs(id_project=project, id_above=store.max_id(), grade=grade)
     if len(obs) > 0:
         print(f"Add {len(obs)} obs in project {project}")
-        df_obs2, df_photos2 = get_dfs(obs)
-        df_obs = pd.concat([df_obs, df_obs2], ignore_index=True)
-        df_obs.to_csv(f"{directory}/data/{project}_df_obs.csv", index=False)
-        df_photos = pd.concat([df_photos, df_photos2], ignore_index=True)
-        df_photos.to_csv(f"{directory}/data/{project}_df_photos.csv", index=False)
+        store.upsert(*get_dfs(obs))
 
 
-def update_dfs_projects(
-    project,
-    day=(datetime.date.today() - datetime.timedelta(days=1)).strftime("%Y-%m-%d"),
-    grade=None,
-):
+def update_dfs_projects(store: ObsStore, project, day=None, grade=None):
+    """
+    Aplica las observaciones modificadas desde `day` (por defecto, desde la
+    última sincronización o desde ayer). Con `grade`, las que ya no tienen ese
+    grado (p. ej. han pasado a casual) se eliminan.
+    """
+    if day is None:
+        yesterday = datetime.date.today() - datetime.timedelta(days=1)
+        day = store.watermark or yesterday.strftime("%Y-%m-%d")
 
-    # updated today
-    obs_nuevas = get_obs(id_project=project, updated_since=day, grade=grade)
+    obs_nuevas = get_obs(id_project=project, updated_since=day)
     if len(obs_nuevas) > 0:
         df_obs_new, df_photos_new = get_dfs(obs_nuevas)
-        df_photos_new["photos_id"] = df_photos_new["photos_id"].astype(int)
-
-        # get downloaded
-        df_obs = pd.read_csv(f"{directory}/data/{project}_df_obs.csv")
-        df_photos = pd.read_csv(f"{directory}/data/{project}_df_photos.csv")
-        old_obs = df_obs[-df_obs["id"].isin(df_obs_new["id"].to_list())]
-        old_photos = df_photos[
-            -df_photos["photos_id"].isin(df_photos_new["photos_id"].to_list())
-        ]
-
-        # join old and updated
-        df_obs_updated = pd.concat(
-            [old_obs, df_obs_new], ignore_index=True
-        ).sort_values(by="id", ascending=False)
-        df_photo_updated = pd.concat(
-            [old_photos, df_photos_new], ignore_index=True
-        ).sort_values(by="photos_id", ascending=False)
-    else:
-        df_obs_updated = None
-        df_photo_updated = None
-    # remove casuals
-    obs_casual = get_obs(grade="casual", updated_since=day)
-    if len(obs_casual) > 0:
-        casual_ids = [ob_casual.id for ob_casual in obs_casual]
-        df_obs_updated = df_obs_updated[-df_obs_updated["id"].isin(casual_ids)]
-        df_photo_updated = df_photo_updated[-df_photo_updated["id"].isin(casual_ids)]
+        if grade is not None:
+            lost = df_obs_new["quality_grade"] != grade
+            store.remove(df_obs_new.loc[lost, "id"])
+            df_obs_new = df_obs_new[~lost]
+            df_photos_new = df_photos_new[df_photos_new["id"].isin(df_obs_new["id"])]
+        store.upsert(df_obs_new, df_photos_new)
 
-    print(f"Updated obs and photos for project {project}: {len(df_obs_updated)}")
-    return df_obs_updated, df_photo_updated
+    print(f"Updated obs and photos for project {project}: {len(store)}")
 
 
-def get_ranking_users(proj_id, grade=None):
-    get_new_data(proj_id, grade)
-    update_dfs_projects(proj_id, grade=grade)
-    df_obs = pd.read_csv(f"{directory}/data/{proj_id}_df_obs.csv")
-    df_photos = pd.read_csv(f"{directory}/data/{proj_id}_df_photos.csv")
+def sync_obs(project, grade=None) -> tuple:
+    """
+    Sincroniza las observaciones y fotos del proyecto: añade las nuevas y
+    aplica las modificadas. Si el total no cuadra con la API (observaciones
+    borradas, o no hay nada descargado) hace una descarga completa.
 
-    if len(df_obs) == 0:
-        df_obs = None
-        df_photos = None
+    Devuelve el store y si la tabla ha cambiado.
+    """
+    store = open_store(project)
+    started = datetime.datetime.now(datetime.timezone.utc)
+    if len(store) > 0:
+        get_new_data(store, project, grade)
+        update_dfs_projects(store, project, grade=grade)
+
+    params = {"project_id": project}
+    if grade is not None:
+        params["quality_grade"] = grade
+    jobs = [count_job("observations", params)]
+    total = get_counts(jobs, cache=False)["total_results"].iloc[0]
+    if len(store) != total:
+        print(f"Descarga completa del proyecto {project}")
+        obs = get_obs(id_project=project, grade=grade)
+        if len(obs) > 0:
+            store.replace(*get_dfs(obs))
+
+    updated = store.save(watermark=started.strftime("%Y-%m-%dT%H:%M:%SZ"))
+    return store, updated
+
+
+def get_ranking_users(proj_id, grade=None):
+    store, __ = sync_obs(proj_id, grade)
+    if len(store) == 0:
+        return None, None, None
 
     # Sacamos pt_users
-    if df_obs is not None:
-        pt_users = get_list_users(proj_id)
+    pt_users = get_list_users(proj_id)
+    return store.df_obs, store.df_photos, pt_users
 
-    else:
-        pt_users = None
 
-    return df_obs, df_photos, pt_users
+def update_last_obs(proj_id, force=False):
+    """
+    Materializa la vista de últimas observaciones del proyecto que lee la app,
+    si sus tablas han cambiado o aún no existe.
+    """
+    last_obs_path = f"{directory}/data/{proj_id}_last_obs.csv"
+    if not force and os.path.exists(last_obs_path):
+        return
+    df_obs = read_table(f"{directory}/data/{proj_id}_df_obs.csv")
+    df_photos = read_table(f"{directory}/data/{proj_id}_df_photos.csv")
+    write_table(
+        build_last_obs(df_obs, df_photos, exclude_logins=last_obs_excluded),
+        last_obs_path,
+    )
+    print(f"Últimas observaciones actualizadas para {proj_id}")
 
 
 def get_list_species(proj_id: int, type="project") -> Optional[pd.DataFrame]:
-    session = requests.Session()
+    session = MinkaSession()
     if type == "project":
         params = {"project_id": proj_id, "quality_grade": "research"}
     elif type == "place":
@@ -279,143 +287,84 @@ def get_list_species(proj_id: int, type="project") -> Optional[pd.DataFrame]:
     return species_count
 
 
-def get_first_obs_taxon(taxon_id, proj_id, type="project", session=None):
-    if session is None:
-        session = requests.Session()
-
-    url = f"{API_PATH}/observations"
-    if type == "place":
-        params = {
-            "place_id": proj_id,
-            "quality_grade": "research",
-            "taxon_id": taxon_id,
-            "order_by": "observed_on",
-            "order": "asc",
-        }
-    else:
-        params = {
-            "place_id": 398,
-            "quality_grade": "research",
-            "taxon_id": taxon_id,
-            "order_by": "observed_on",
-            "order": "asc",
-        }
-
-    results = session.get(url, params=params).json()["results"]
-
-    if not results:
-        return [None, None, None, None]
-
-    primera_observacion = results[0]
-
-    date = primera_observacion["observed_on"]
-    author = primera_observacion["user"]["login"]
-    obs_id = primera_observacion["id"]
-
-    results_photos = session.get(url, params={"id": obs_id}).json()["results"]
-    try:
-        photo_url = results_photos[0]["photos"][0]["url"].replace("/square", "/large")
-    except:
-        photo_url = None
-
-    return [date, author, obs_id, photo_url]
-
-
 if __name__ == "__main__":
     # Get main_metrics.csv
     start_time = time.time()
-    main_metrics_df = update_main_metrics(main_project)
-    main_metrics_df.to_csv(f"{directory}/data/main_metrics.csv", index=False)
-    print("Main metrics actualizada")
+    with stage("main_metrics"):
+        main_metrics_df = update_main_metrics(main_project)
+        main_metrics_df.to_csv(f"{directory}/data/main_metrics.csv", index=False)
+        print("Main metrics actualizada")
 
     # Update df de cada proyecto
-    if len(all_projects) > 0:
-        for proj_id in all_projects:
-            print("Update df:", proj_id)
-            try:
-                downloaded_obs = pd.read_csv(f"{directory}/data/{proj_id}_df_obs.csv")
-            except:
-                downloaded_obs = pd.DataFrame()
-            obs = get_obs(id_project=proj_id)
-            # Comprueba si hay observaciones y si hay más que en el archivo descargado
-            if len(obs) > 0 and len(obs) != len(downloaded_obs):
-                df_obs, df_photos = get_dfs(obs)
-                pt_users = get_list_users(proj_id)
-                # df_obs, df_photos, pt_users = get_ranking_users(proj_id, grade="research")
-                try:
-                    df_obs.to_csv(f"{directory}/data/{proj_id}_df_obs.csv", index=False)
-                    print(f"df_obs_{proj_id}.csv updated", f"{len(df_obs)}")
-                except:
-                    print("No se ha actualizado los df_obs")
-                    pass
-                try:
-                    df_photos.to_csv(
-                        f"{directory}/data/{proj_id}_df_photos.csv", index=False
-                    )
-                    print(f"df_photos_{proj_id}.csv updated")
-                except:
-                    print("No se han actualizado los df_photos")
-                    pass
+    with stage("observations"):
+        if len(all_projects) > 0:
+            for proj_id in all_projects:
+                print("Update df:", proj_id)
+                store, updated = sync_obs(proj_id)
+                if len(store) > 0:
+                    update_last_obs(proj_id, force=updated)
+                if updated and len(store) > 0:
+                    print(f"df_obs_{proj_id}.csv updated", f"{len(store)}")
+                    pt_users = get_list_users(proj_id)
+                    try:
+                        pt_users.to_csv(
+                            f"{directory}/data/{proj_id}_pt_users.csv", index=False
+                        )
+                        print(f"pt_users_{proj_id}.csv updated")
+                    except:
+                        print("No se han actualizado los pt_users")
+                        pass
+
+    # Índice de primeras observaciones, compartido por las listas de especies
+    first_obs_index = f"{directory}/data/first_obs_index.csv"
+
+    # Get listado de species
+    with stage("species"):
+        if len(all_projects) > 0:
+            for proj_id in all_projects:
+                print(f"Get species for project {proj_id}")
+                species = get_list_species(proj_id)
                 try:
-                    pt_users.to_csv(
-                        f"{directory}/data/{proj_id}_pt_users.csv", index=False
+                    downloaded_species = pd.read_csv(
+                        f"{directory}/data/{proj_id}_species.csv"
                     )
-                    print(f"pt_users_{proj_id}.csv updated")
                 except:
-                    print("No se han actualizado los pt_users")
-                    pass
-
-    # Get listado de species
-    if len(all_projects) > 0:
-        for proj_id in all_projects:
-            print(f"Get species for project {proj_id}")
-            species = get_list_species(proj_id)
-            try:
-                downloaded_species = pd.read_csv(
-                    f"{directory}/data/{proj_id}_species.csv"
-                )
-            except:
-                downloaded_species = pd.DataFrame()
-            if species is not None and len(species) != len(downloaded_species):
-                with requests.Session() as session:
-                    species[["first_date", "author", "obs_id", "photo_url"]] = (
-                        species.apply(
-                            lambda x: get_first_obs_taxon(x["id"], proj_id, session),
-                            axis=1,
-                        ).to_list()
+                    downloaded_species = pd.DataFrame()
+                if species is not None and len(species) != len(downloaded_species):
+                    species[FIELDS] = get_first_obs(
+                        species["id"], first_obs_place, first_obs_index
+                    ).to_numpy()
+                    # species = species[species.author != "xasalva"]
+                    species = species.sort_values(
+                        by=["first_date", "obs_id"], ascending=False
+                    ).reset_index(drop=True)
+                    species.to_csv(
+                        f"{directory}/data/{proj_id}_species.csv", index=False
                     )
-                # species = species[species.author != "xasalva"]
-                species = species.sort_values(
-                    by=["first_date", "obs_id"], ascending=False
-                ).reset_index(drop=True)
-                species.to_csv(f"{directory}/data/{proj_id}_species.csv", index=False)
-                print(f"Species updated for {proj_id}")
+                    print(f"Species updated for {proj_id}")
 
     # Get listado de species por lugar
-    print(f"Get species for biomarato")
-
-    species_biomarato = get_list_species(place_biomaratona, type="place")
-    try:
-        downloaded_species_biomarato = pd.read_csv(
-            f"{directory}/data/place_biomaratona_species.csv"
-        )
-    except:
-        downloaded_species_biomarato = pd.DataFrame()
-
-    if len(species_biomarato) != len(downloaded_species_biomarato):
-        with requests.Session() as session:
-            species_biomarato[["first_date", "author", "obs_id", "photo_url"]] = (
-                species_biomarato.apply(
-                    lambda x: get_first_obs_taxon(
-                        x["id"], place_biomaratona, type="place", session=session
-                    ),
-                    axis=1,
-                ).to_list()
+    with stage("place_species"):
+        print(f"Get species for biomarato")
+
+        species_biomarato = get_list_species(place_biomaratona, type="place")
+        try:
+            downloaded_species_biomarato = pd.read_csv(
+                f"{directory}/data/place_biomaratona_species.csv"
+            )
+        except:
+            downloaded_species_biomarato = pd.DataFrame()
+
+        if len(species_biomarato) != len(downloaded_species_biomarato):
+            species_biomarato[FIELDS] = get_first_obs(
+                species_biomarato["id"], place_biomaratona, first_obs_index
+            ).to_numpy()
+            species_biomarato.to_csv(
+                f"{directory}/data/place_biomaratona_species.csv", index=False
             )
-        species_biomarato.to_csv(
-            f"{directory}/data/place_biomaratona_species.csv", index=False
-        )
-        print(f"Species updated for biomarato")
+            print(f"Species updated for biomarato")
+
+    write_report(f"{directory}/data/run_report.json")
 
     end_time = time.time()
     execution_time = end_time - start_time
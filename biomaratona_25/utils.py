@@ -1,15 +1,23 @@
-import datetime
 import os
+import sys
 
 import folium
 import numpy as np
 import pandas as pd
 import plotly.express as px
-import requests
 import streamlit as st
 import streamlit.components.v1 as components
 from folium.plugins import HeatMap, MarkerCluster
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.client import get_session
+from common.project_metrics import (
+    get_previous_totals,
+    get_project_totals,
+    get_projects_totals,
+)
+from common.storage import read_table
+
 try:
     directory = f"{os.environ['DASHBOARDS']}/biomaratona_25"
 except KeyError:
@@ -20,6 +28,7 @@ except KeyError:
 
 base_url = "https://minka-sdg.org"
 api_path = f"https://api.minka-sdg.org/v1"
+session = get_session()
 
 
 projects = [
@@ -56,7 +65,7 @@ def load_maps():
     # Only load maps if they don't exist in session_state or if project changed
     if map_key not in st.session_state:
         try:
-            df_map = pd.read_csv(f"{directory}/data/{proj_id}_df_obs.csv")
+            df_map = read_table(f"{directory}/data/{proj_id}_df_obs.csv")
             # Store both maps in a dictionary with this project's key
             st.session_state[map_key] = {
                 "heatmap": create_heatmap(df_map),
@@ -80,77 +89,21 @@ def load_maps():
 
 
 @st.cache_data(ttl=300)
-def get_main_metrics(proj_id, session=None):
-    species = f"{api_path}/observations/species_counts?"
-    url1 = f"{species}&project_id={proj_id}"
-    if session is None:
-        session = requests.Session()
-    total_species = session.get(url1).json()["total_results"]
-
-    observers = f"{api_path}/observations/observers?"
-    url2 = f"{observers}&project_id={proj_id}"
-    total_participants = session.get(url2).json()["total_results"]
-
-    observations = f"{api_path}/observations?"
-    url3 = f"{observations}&project_id={proj_id}"
-    total_obs = session.get(url3).json()["total_results"]
-
-    return total_species, total_participants, total_obs
+def get_main_metrics(proj_id):
+    totals = get_project_totals(proj_id)
+    return totals["species"], totals["observers"], totals["observations"]
 
 
 @st.cache_data(ttl=300)
-def get_last_week_metrics(proj_id, session=None):
-    last_week_date = (datetime.datetime.today() - datetime.timedelta(days=7)).strftime(
-        "%Y-%m-%d"
-    )
-    if session is None:
-        session = requests.Session()
-    species = f"{api_path}/observations/species_counts?"
-    url1 = f"{species}&project_id={proj_id}&d2={last_week_date}&order=desc&order_by=created_at"
-    lw_spe = session.get(url1).json()["total_results"]
-
-    observers = f"{api_path}/observations/observers?"
-    url2 = f"{observers}&project_id={proj_id}&d2={last_week_date}&order=desc&order_by=created_at"
-    lw_part = session.get(url2).json()["total_results"]
-
-    observations = f"{api_path}/observations?"
-    url3 = f"{observations}&project_id={proj_id}&d2={last_week_date}&order=desc&order_by=created_at"
-    lw_obs = session.get(url3).json()["total_results"]
-    return lw_obs, lw_spe, lw_part
+def get_last_week_metrics(proj_id):
+    totals = get_previous_totals(proj_id, days=7)
+    return totals["observations"], totals["species"], totals["observers"]
 
 
 @st.cache_data(ttl=3600)
 def get_metrics_province():
-    prov = {
-        projects[0]["name"]: projects[0]["id"],
-        projects[1]["name"]: projects[1]["id"],
-        projects[2]["name"]: projects[2]["id"],
-    }
-
-    result = []
-
-    with requests.Session() as session:
-        for k, v in prov.items():
-            species = f"{api_path}/observations/species_counts?"
-            url1 = f"{species}&project_id={v}"
-            total_species = session.get(url1).json().get("total_results")
-
-            observers = f"{api_path}/observations/observers?"
-            url2 = f"{observers}&project_id={v}"
-            total_participants = session.get(url2).json().get("total_results")
-
-            observations = f"{api_path}/observations?"
-            url3 = f"{observations}&project_id={v}"
-            total_obs = session.get(url3).json().get("total_results")
-
-            data = {
-                "provincia": k,
-                "espècies": total_species,
-                "participants": total_participants,
-                "observacions": total_obs,
-            }
-            result.append(data)
-    main_metrics = pd.DataFrame(result)
+    prov = {project["id"]: project["name"] for project in projects[:3]}
+    main_metrics = get_projects_totals(prov, key="provincia")
     return main_metrics
 
 
@@ -291,35 +244,10 @@ def fig_provinces(main_metrics: pd.DataFrame, field: str, title: str) -> px.bar:
 
 @st.cache_data(ttl=3600)
 def get_last_obs(proj_id):
-    last_obs = pd.read_csv(f"{directory}/data/{proj_id}_df_obs.csv")
-    last_photos = pd.read_csv(f"{directory}/data/{proj_id}_df_photos.csv")
-    total = pd.merge(
-        last_photos,
-        last_obs[
-            [
-                "id",
-                "observed_on",
-                "quality_grade",
-                "kingdom",
-                "phylum",
-                "class",
-                "order",
-                "family",
-                "genus",
-            ]
-        ],
-        on="id",
-        how="left",
-    )
-
-    excluded_logins = ["xasalva", "mediambient_ajelprat"]
-    last_total = total[
-        (~total.user_login.isin(excluded_logins)) & (total.quality_grade == "research")
-    ].reset_index(drop=True)
-    last_total.drop_duplicates(subset="id", inplace=True)
-    last_total = last_total.sort_values(by="id", ascending=False).reset_index(drop=True)
-
-    return last_total
+    """
+    Últimas observaciones research con foto, materializadas por update.py.
+    """
+    return read_table(f"{directory}/data/{proj_id}_last_obs.csv")
 
 
 @st.cache_resource(ttl=3600)
@@ -390,8 +318,6 @@ def reindex(df):
 @st.cache_data(ttl=3600)
 def get_grouped_monthly(project_id: int, year) -> pd.DataFrame:
 
-    session = requests.Session()
-
     meses = {
         f"{year}-05": ["01", "31"],
         f"{year}-06": ["01", "30"],
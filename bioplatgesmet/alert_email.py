@@ -1,11 +1,15 @@
 import os
 import smtplib
+import sys
 from datetime import date, datetime, timedelta
 from email.mime.text import MIMEText
 
 import pandas as pd
 from dotenv import load_dotenv
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.storage import read_table
+
 try:
     directory = f"{os.environ['DASHBOARDS']}/bioplatgesmet"
 except KeyError:
@@ -257,7 +261,7 @@ if __name__ == "__main__":
 
     main_project = 264
     days = 1
-    df_obs = pd.read_csv(f"{directory}/data/{main_project}_obs.csv")
+    df_obs = read_table(f"{directory}/data/{main_project}_obs.csv")
 
     load_dotenv()
     email_password = os.getenv("EMAIL_PASSWORD")
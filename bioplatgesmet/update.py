@@ -1,12 +1,18 @@
 import calendar
 import os
+import sys
 import time
 from datetime import datetime, timedelta
 
 import pandas as pd
-import requests
 from mecoda_minka import get_dfs, get_obs
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.client import MinkaSession
+from common.counts import count_job, counts_wide, get_counts
+from common.instrumentation import stage, write_report
+from common.storage import read_table, write_table
+
 try:
     directory = f"{os.environ['DASHBOARDS']}/bioplatgesmet"
 except KeyError:
@@ -45,108 +51,52 @@ def get_month_dict(years: list) -> dict:
 
 
 # acumulados mensuales
-def _get_totals(place_id, start_date, end_date, session=None):
-    if session is None:
-        session = requests.Session()
+def _get_totals_jobs(place_id, start_date, end_date, **keys):
+    params = {
+        "project_id": main_project,
+        "created_d1": start_date,
+        "created_d2": end_date,
+    }
     if place_id is not None:
-        url_obs = f"{API_PATH}/observations?project_id={main_project}&place_id={place_id}&created_d1={start_date}&created_d2={end_date}"
-        url_spe = f"{API_PATH}/observations/species_counts?project_id={main_project}&place_id={place_id}&created_d1={start_date}&created_d2={end_date}"
-        url_part = f"{API_PATH}/observations/observers?project_id={main_project}&place_id={place_id}&created_d1={start_date}&created_d2={end_date}"
-        url_ident = f"{API_PATH}/observations/identifiers?project_id={main_project}&place_id={place_id}&created_d1={start_date}&created_d2={end_date}"
-    else:
-        url_obs = f"{API_PATH}/observations?project_id={main_project}&created_d1={start_date}&created_d2={end_date}"
-        url_spe = f"{API_PATH}/observations/species_counts?project_id={main_project}&created_d1={start_date}&created_d2={end_date}"
-        url_part = f"{API_PATH}/observations/observers?project_id={main_project}&created_d1={start_date}&created_d2={end_date}"
-        url_ident = f"{API_PATH}/observations/identifiers?project_id={main_project}&created_d1={start_date}&created_d2={end_date}"
-    session = requests.Session()
-    total_obs = session.get(url_obs).json()["total_results"]
-    total_spe = session.get(url_spe).json()["total_results"]
-    total_part = session.get(url_part).json()["total_results"]
-    total_ident = session.get(url_ident).json()["total_results"]
-
-    return total_obs, total_spe, total_part, total_ident
+        params["place_id"] = place_id
+    return [
+        count_job(endpoint, params, **keys)
+        for endpoint in ["observations", "species", "observers", "identifiers"]
+    ]
 
 
-def get_monthly_metrics(places, meses, session=None):
-    if session is None:
-        session = requests.Session()
-    total_metrics = []
+def _get_place_metrics(places, meses, cumulative, session=None):
+    jobs = []
     for place_k, place_v in places.items():
+        # Sin places se usa el proyecto principal; con varios se suman
+        place_ids = place_v if len(place_v) > 0 else [None]
         for key, value in meses.items():
-            total = {}
-            total_obs = 0
-            total_spe = 0
-            total_part = 0
-            total_ident = 0
-            if len(place_v) == 0:
-                total_obs, total_spe, total_part, total_ident = _get_totals(
-                    None, f"{key}-01", f"{key}-{value}", session
-                )
-            elif len(place_v) == 1:
-                total_obs, total_spe, total_part, total_ident = _get_totals(
-                    place_v[0], f"{key}-01", f"{key}-{value}", session
-                )
-            elif len(place_v) > 1:
-                for p in place_v:
-                    obs, spe, part, ident = _get_totals(
-                        p, f"{key}-01", f"{key}-{value}", session
+            start_date = "" if cumulative else f"{key}-01"
+            for p in place_ids:
+                jobs.extend(
+                    _get_totals_jobs(
+                        p, start_date, f"{key}-{value}", city=place_k, month=key
                     )
-                    total_obs += obs
-                    total_spe += spe
-                    total_part += part
-                    total_ident += ident
-
-            total["city"] = place_k
-            total["month"] = key
-            total["total_obs"] = total_obs
-            total["total_spe"] = total_spe
-            total["total_part"] = total_part
-            total["total_ident"] = total_ident
-            total_metrics.append(total)
+                )
 
-    df = pd.DataFrame(total_metrics)
-    return df
+    df = counts_wide(get_counts(jobs, session=session), index=["city", "month"])
+    df = df.rename(
+        columns={
+            "observations": "total_obs",
+            "species": "total_spe",
+            "observers": "total_part",
+            "identifiers": "total_ident",
+        }
+    )
+    return df[["city", "month", "total_obs", "total_spe", "total_part", "total_ident"]]
 
 
-def get_cumulative_monthly_metrics(places, meses, session=None):
-    if session is None:
-        session = requests.Session()
-    total_metrics = []
-    for place_k, place_v in places.items():
-        for key, value in meses.items():
-            total = {}
-            total_obs = 0
-            total_spe = 0
-            total_part = 0
-            total_id = 0
-            if len(place_v) == 0:
-                total_obs, total_spe, total_part, total_id = _get_totals(
-                    None, f"", f"{key}-{value}", session
-                )
-            elif len(place_v) == 1:
-                total_obs, total_spe, total_part, total_id = _get_totals(
-                    place_v[0], f"", f"{key}-{value}", session
-                )
-            elif len(place_v) > 1:
-                for p in place_v:
-                    obs, spe, part, iden = _get_totals(
-                        p, f"", f"{key}-{value}", session
-                    )
-                    total_obs += obs
-                    total_spe += spe
-                    total_part += part
-                    total_id += iden
+def get_monthly_metrics(places, meses, session=None):
+    return _get_place_metrics(places, meses, cumulative=False, session=session)
 
-            total["city"] = place_k
-            total["month"] = key
-            total["total_obs"] = total_obs
-            total["total_spe"] = total_spe
-            total["total_part"] = total_part
-            total["total_ident"] = total_id
-            total_metrics.append(total)
 
-    df = pd.DataFrame(total_metrics)
-    return df
+def get_cumulative_monthly_metrics(places, meses, session=None):
+    return _get_place_metrics(places, meses, cumulative=True, session=session)
 
 
 def get_obs_from_project_places(project, places):
@@ -156,15 +106,15 @@ def get_obs_from_project_places(project, places):
             obs = get_obs(id_project=project, place_id=v[i])
             total_obs.extend(obs)
         df1, df2 = get_dfs(total_obs)
-        df1.to_csv(f"{directory}/data/obs_{k}.csv", index=False)
+        write_table(df1, f"{directory}/data/obs_{k}.csv")
         # df2.to_csv(f"{directory}/data/photos_{k}.csv")
 
 
 def get_obs_from_main_project(main_project):
     obs = get_obs(id_project=main_project)
     df_obs, df_photos = get_dfs(obs)
-    df_obs.to_csv(f"{directory}/data/{main_project}_obs.csv", index=False)
-    df_photos.to_csv(f"{directory}/data/{main_project}_photos.csv", index=False)
+    write_table(df_obs, f"{directory}/data/{main_project}_obs.csv")
+    write_table(df_photos, f"{directory}/data/{main_project}_photos.csv")
 
 
 def update_main_metrics(proj_id, df_main_metrics, session=None):
@@ -172,111 +122,59 @@ def update_main_metrics(proj_id, df_main_metrics, session=None):
     df_main_metrics.date = pd.to_datetime(df_main_metrics["date"], format="mixed")
     fecha_fin = datetime.today() - timedelta(days=60)
     antiguo = df_main_metrics[df_main_metrics.date <= fecha_fin].copy()
-    results = []
-    observations = f"{API_PATH}/observations?"
-    species = f"{API_PATH}/observations/species_counts?"
-    observers = f"{API_PATH}/observations/observers?"
-    identifiers = f"{API_PATH}/observations/identifiers?"
-
-    # Crear una sesión de requests
-    if session is None:
-        session = requests.Session()
 
     # Fecha de inicio de la actualización
     day = fecha_fin + timedelta(days=1)
-
     rango_temporal = (datetime.today().date() - day.date()).days
 
+    jobs = []
     for i in range(rango_temporal + 1):
-        print(i)
-        st_day = day.strftime("%Y-%m-%d")
-
+        st_day = (day + timedelta(days=i)).strftime("%Y-%m-%d")
         params = {
             "project_id": proj_id,
             "created_d2": st_day,
             "order": "desc",
             "order_by": "created_at",
         }
+        for endpoint in ["observations", "species", "observers", "identifiers"]:
+            jobs.append(count_job(endpoint, params, date=st_day))
 
-        # Utilizar la sesión para realizar las solicitudes
-        total_obs = session.get(observations, params=params).json()["total_results"]
-        total_species = session.get(species, params=params).json()["total_results"]
-        total_participants = session.get(observers, params=params).json()[
-            "total_results"
-        ]
-        total_identifiers = session.get(identifiers, params=params).json()[
-            "total_results"
-        ]
-
-        result = {
-            "date": st_day,
-            "observations": total_obs,
-            "species": total_species,
-            "participants": total_participants,
-            "identifiers": total_identifiers,
-        }
-
-        results.append(result)
-
-        day = day + timedelta(days=1)
-
-    result_df = pd.DataFrame(results)
+    result_df = counts_wide(get_counts(jobs, session=session), index="date")
+    result_df = result_df.rename(columns={"observers": "participants"})[
+        ["date", "observations", "species", "participants", "identifiers"]
+    ]
     total_result = pd.concat([antiguo, result_df], ignore_index=True)
     print("Updated main metrics")
     return total_result
 
 
 def get_metrics_cities(main_project, places, session=None):
-    result = []
     print("Places antes:", len(places))
     del places["BioPlatgesMet"]
     print("Places después:", len(places))
 
-    species = f"{API_PATH}/observations/species_counts?"
-    observers = f"{API_PATH}/observations/observers?"
-    observations = f"{API_PATH}/observations?"
-    if session is None:
-        session = requests.Session()
-
+    jobs = []
     for k, v in places.items():
-        if len(v) == 1:
-            url1 = f"{species}&project_id={main_project}&place_id={v[0]}"
-            total_species = session.get(url1).json()["total_results"]
-
-            url2 = f"{observers}&project_id={main_project}&place_id={v[0]}"
-            total_participants = session.get(url2).json()["total_results"]
-
-            url3 = f"{observations}&project_id={main_project}&place_id={v[0]}"
-            total_obs = session.get(url3).json()["total_results"]
-
-        else:
-            total_species = 0
-            total_participants = 0
-            total_obs = 0
-
-            for place_v in v:
-                url1 = f"{species}&project_id={main_project}&place_id={place_v}"
-                total_species += session.get(url1).json()["total_results"]
-
-                url2 = f"{observers}&project_id={main_project}&place_id={place_v}"
-                total_participants += session.get(url2).json()["total_results"]
-
-                url3 = f"{observations}&project_id={main_project}&place_id={place_v}"
-                total_obs += session.get(url3).json()["total_results"]
-        data = {
-            "ciutat": k,
-            "espècies": total_species,
-            "participants": total_participants,
-            "observacions": total_obs,
+        # Las ciudades con varios places suman sus totales
+        for place_v in v:
+            params = {"project_id": main_project, "place_id": place_v}
+            for endpoint in ["species", "observers", "observations"]:
+                jobs.append(count_job(endpoint, params, ciutat=k))
+
+    main_metrics = counts_wide(get_counts(jobs, session=session), index="ciutat")
+    main_metrics = main_metrics.rename(
+        columns={
+            "species": "espècies",
+            "observers": "participants",
+            "observations": "observacions",
         }
-        result.append(data)
-    main_metrics = pd.DataFrame(result)
-    return main_metrics
+    )
+    return main_metrics[["ciutat", "espècies", "participants", "observacions"]]
 
 
 def get_num_species(main_project, session=None):
     if session is None:
-        session = requests.Session()
+        session = MinkaSession()
     num_species = []
     base_url = f"{API_PATH}/observations/species_counts?"
     start_date = datetime(2022, 1, 1)
@@ -300,17 +198,9 @@ def get_num_species(main_project, session=None):
     return df_introduced_by_month
 
 
-def _get_species(user_name, proj_id, session=None):
-    if session is None:
-        session = requests.Session()
-    species = f"{API_PATH}/observations/species_counts"
-    params = {"project_id": proj_id, "user_login": user_name}
-    return session.get(species, params=params).json()["total_results"]
-
-
 def _get_identifiers(df_users, proj_id, session=None):
     if session is None:
-        session = requests.Session()
+        session = MinkaSession()
     identifiers = f"{API_PATH}/observations/identifiers?"
     url4 = f"{identifiers}&project_id={proj_id}"
     results = session.get(url4).json()["results"]
@@ -325,8 +215,8 @@ def _get_identifiers(df_users, proj_id, session=None):
 
 def get_participation_df(main_project, session=None):
     if session is None:
-        session = requests.Session()
-    df_obs = pd.read_csv(f"{directory}/data/{main_project}_obs.csv")
+        session = MinkaSession()
+    df_obs = read_table(f"{directory}/data/{main_project}_obs.csv")
     pt_users = (
         df_obs["user_login"]
         .value_counts()
@@ -336,27 +226,22 @@ def get_participation_df(main_project, session=None):
     )
     pt_users = _get_identifiers(pt_users, main_project, session)
 
-    pt_users["espècies"] = pt_users["participant"].apply(
-        lambda x: _get_species(x, main_project, session)
+    jobs = [
+        count_job(
+            "species",
+            {"project_id": main_project, "user_login": user_name},
+            participant=user_name,
+        )
+        for user_name in pt_users["participant"]
+    ]
+    df_species = counts_wide(get_counts(jobs, session=session), index="participant")
+    pt_users = pd.merge(pt_users, df_species, on="participant", how="left").rename(
+        columns={"species": "espècies"}
     )
     return pt_users
 
 
 # Parcelas
-def get_obs_by_place(place_id):
-    observations = "https://api.minka-sdg.org/v1/observations?"
-    url3 = f"{observations}&project_id={main_project}&place_id={place_id}"
-    total_obs = requests.get(url3).json()["total_results"]
-    return total_obs
-
-
-def get_species_by_place(place_id):
-    species = "https://api.minka-sdg.org/v1/observations/species_counts?"
-    url3 = f"{species}&project_id={main_project}&place_id={place_id}"
-    total_obs = requests.get(url3).json()["total_results"]
-    return total_obs
-
-
 main_project = 264
 grupos_biologicos = {
     "Plantes": 12,
@@ -372,87 +257,110 @@ grupos_biologicos = {
 }
 
 
-# observaciones de cada grupo biológico por parcela
-def get_obs_by_place_taxon(place_id, taxon_id):
-    observations = "https://api.minka-sdg.org/v1/observations?"
-    url3 = f"{observations}&project_id={main_project}&place_id={place_id}&taxon_id={taxon_id}"
-    total_obs = requests.get(url3).json()["total_results"]
-    return total_obs
+# observaciones, especies y observaciones de cada grupo biológico por parcela
+def get_metrics_parcelas(df_parcelas, session=None):
+    jobs = []
+    for place_id in df_parcelas["place_id"].unique():
+        params = {"project_id": main_project, "place_id": place_id}
+        jobs.append(count_job("observations", params, place_id=place_id, col="num_obs"))
+        jobs.append(count_job("species", params, place_id=place_id, col="num_species"))
+        for k, v in grupos_biologicos.items():
+            params_taxon = {**params, "taxon_id": v}
+            jobs.append(
+                count_job("observations", params_taxon, place_id=place_id, col=k)
+            )
+    columns = ["num_obs", "num_species", *grupos_biologicos.keys()]
+    if not jobs:
+        return df_parcelas.reindex(columns=[*df_parcelas.columns, *columns])
+    df_counts = get_counts(jobs, session=session).pivot(
+        index="place_id", columns="col", values="total_results"
+    )
+
+    for col in columns:
+        df_parcelas[col] = df_parcelas["place_id"].map(df_counts[col])
+    return df_parcelas
 
 
 if __name__ == "__main__":
     start_time = time.time()
 
-    session = requests.Session()
+    session = MinkaSession()
 
-    print("Actualizando métricas acumulativas del proyecto principal")
-    df_main_metrics = pd.read_csv(f"{directory}/data/264_main_metrics.csv")
-    result_df = update_main_metrics(main_project, df_main_metrics, session)
-    result_df.to_csv(f"{directory}/data/{main_project}_main_metrics.csv", index=False)
-
-    print("Descargando métricas mensuales de los places del proyecto")
-    current_year = datetime.now().year
-    years = list(range(2022, current_year + 1))
-    meses = get_month_dict(years)
+    with stage("main_metrics"):
+        print("Actualizando métricas acumulativas del proyecto principal")
+        df_main_metrics = pd.read_csv(f"{directory}/data/264_main_metrics.csv")
+        result_df = update_main_metrics(main_project, df_main_metrics, session)
+        result_df.to_csv(
+            f"{directory}/data/{main_project}_main_metrics.csv", index=False
+        )
 
-    df = get_monthly_metrics(places, meses, session)
-    df.to_csv(f"{directory}/data/city_monthly_metrics.csv", index=False)
+    with stage("monthly_metrics"):
+        print("Descargando métricas mensuales de los places del proyecto")
+        current_year = datetime.now().year
+        years = list(range(2022, current_year + 1))
+        meses = get_month_dict(years)
 
-    print("Descargando métricas mensuales acumuladas de los places del proyecto")
-    df_cumulative = get_cumulative_monthly_metrics(
-        places=places, meses=meses, session=session
-    )
-    df_cumulative.to_csv(
-        f"{directory}/data/cumulative_city_monthly_metrics.csv", index=False
-    )
+        df = get_monthly_metrics(places, meses, session)
+        df.to_csv(f"{directory}/data/city_monthly_metrics.csv", index=False)
 
-    print("Descargando métricas de ciudades")
-    main_metrics_by_city = get_metrics_cities(main_project, places, session)
-    main_metrics_by_city.to_csv(f"{directory}/data/city_total_metrics.csv", index=False)
-
-    print("Descargando observaciones de proyecto principal")
-    get_obs_from_main_project(main_project)
-    get_obs_from_project_places(main_project, places)
-
-    print("Incluyendo ciudad en 264_obs.csv")
-    df_obs = pd.read_csv(f"{directory}/data/264_obs.csv")
-    for city in [
-        "Badalona",
-        "Barcelona",
-        "Castelldefels",
-        "El Prat de Llobregat",
-        "Gavà",
-        "Montgat",
-        "Sant Adrià del Besòs",
-        "Viladecans",
-    ]:
-        df_city = pd.read_csv(f"{directory}/data/obs_{city}.csv")
-        df_obs.loc[df_obs["id"].isin(df_city["id"].to_list()), "address"] = city
-    df_obs.to_csv(f"{directory}/data/264_obs.csv", index=False)
-
-    print("Descargando especies introducidas")
-    df_introduced_by_month = get_num_species(main_project, session)
-    df_introduced_by_month.to_csv(
-        f"{directory}/data/introduced_by_month.csv", index=False
-    )
+        print("Descargando métricas mensuales acumuladas de los places del proyecto")
+        df_cumulative = get_cumulative_monthly_metrics(
+            places=places, meses=meses, session=session
+        )
+        df_cumulative.to_csv(
+            f"{directory}/data/cumulative_city_monthly_metrics.csv", index=False
+        )
 
-    print("Descargando tabla de participantes")
-    pt_users = get_participation_df(main_project)
-    pt_users.to_csv(f"{directory}/data/{main_project}_participants.csv", index=False)
+    with stage("cities"):
+        print("Descargando métricas de ciudades")
+        main_metrics_by_city = get_metrics_cities(main_project, places, session)
+        main_metrics_by_city.to_csv(
+            f"{directory}/data/city_total_metrics.csv", index=False
+        )
 
-    # update de parcelas
-    print("Actualizando datos de parcelas")
-    df_parcelas = pd.read_csv(f"{directory}/data/parcelas.csv")
-    # Observaciones por parcela
-    df_parcelas["num_obs"] = df_parcelas["place_id"].apply(get_obs_by_place)
-    df_parcelas["num_species"] = df_parcelas["place_id"].apply(get_species_by_place)
+    with stage("observations"):
+        print("Descargando observaciones de proyecto principal")
+        get_obs_from_main_project(main_project)
+        get_obs_from_project_places(main_project, places)
+
+        print("Incluyendo ciudad en 264_obs.csv")
+        df_obs = read_table(f"{directory}/data/264_obs.csv")
+        for city in [
+            "Badalona",
+            "Barcelona",
+            "Castelldefels",
+            "El Prat de Llobregat",
+            "Gavà",
+            "Montgat",
+            "Sant Adrià del Besòs",
+            "Viladecans",
+        ]:
+            df_city = read_table(f"{directory}/data/obs_{city}.csv")
+            df_obs.loc[df_obs["id"].isin(df_city["id"].to_list()), "address"] = city
+        write_table(df_obs, f"{directory}/data/264_obs.csv")
+
+    with stage("species"):
+        print("Descargando especies introducidas")
+        df_introduced_by_month = get_num_species(main_project, session)
+        df_introduced_by_month.to_csv(
+            f"{directory}/data/introduced_by_month.csv", index=False
+        )
 
-    for k, v in grupos_biologicos.items():
-        df_parcelas[k] = df_parcelas["place_id"].apply(
-            lambda x: get_obs_by_place_taxon(x, v)
+    with stage("participants"):
+        print("Descargando tabla de participantes")
+        pt_users = get_participation_df(main_project)
+        pt_users.to_csv(
+            f"{directory}/data/{main_project}_participants.csv", index=False
         )
 
-    df_parcelas.to_csv(f"{directory}/data/parcelas.csv", index=False)
+    with stage("parcelas"):
+        print("Actualizando datos de parcelas")
+        df_parcelas = pd.read_csv(f"{directory}/data/parcelas.csv")
+        df_parcelas = get_metrics_parcelas(df_parcelas, session)
+
+        df_parcelas.to_csv(f"{directory}/data/parcelas.csv", index=False)
+
+    write_report(f"{directory}/data/run_report.json")
 
     end_time = time.time()
     execution_time = end_time - start_time
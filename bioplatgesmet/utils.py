@@ -1,6 +1,7 @@
 import datetime
 import math
 import os
+import sys
 
 import folium
 import numpy as np
@@ -14,6 +15,15 @@ from geopy.geocoders import Nominatim
 from markdownlit import mdlit
 from mecoda_minka import get_dfs, get_obs
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.client import get_session
+from common.project_metrics import (
+    get_previous_totals,
+    get_project_totals,
+    get_projects_totals,
+)
+from common.storage import read_table
+
 try:
     directory = f"{os.environ['DASHBOARDS']}/bioplatgesmet"
 except KeyError:
@@ -23,6 +33,8 @@ except KeyError:
 
 base_url = "https://minka-sdg.org"
 api_path = f"https://api.minka-sdg.org/v1"
+session = get_session()
+METRIC_ENDPOINTS = ["observations", "species", "observers", "identifiers"]
 
 
 codes = {
@@ -40,75 +52,29 @@ codes = {
 # Definición de funciones
 @st.cache_data(ttl=360)
 def get_main_metrics(proj_id):
-    observations = "https://api.minka-sdg.org/v1/observations?"
-    url3 = f"{observations}&project_id={proj_id}"
-    total_obs = requests.get(url3).json()["total_results"]
-
-    species = "https://api.minka-sdg.org/v1/observations/species_counts?"
-    url1 = f"{species}&project_id={proj_id}"
-    total_species = requests.get(url1).json()["total_results"]
-
-    observers = "https://api.minka-sdg.org/v1/observations/observers?"
-    url2 = f"{observers}&project_id={proj_id}"
-    total_participants = requests.get(url2).json()["total_results"]
-
-    identifiers = "https://api.minka-sdg.org/v1/observations/identifiers?"
-    url4 = f"{identifiers}&project_id={proj_id}"
-    total_identifiers = requests.get(url4).json()["total_results"]
-
-    return total_obs, total_species, total_participants, total_identifiers
+    totals = get_project_totals(proj_id, METRIC_ENDPOINTS)
+    return (
+        totals["observations"],
+        totals["species"],
+        totals["observers"],
+        totals["identifiers"],
+    )
 
 
 @st.cache_data(ttl=360)
 def get_last_week_metrics(proj_id):
-    last_week_date = (datetime.datetime.today() - datetime.timedelta(days=7)).strftime(
-        "%Y-%m-%d"
+    totals = get_previous_totals(proj_id, days=7, endpoints=METRIC_ENDPOINTS)
+    return (
+        totals["observations"],
+        totals["species"],
+        totals["observers"],
+        totals["identifiers"],
     )
 
-    species = "https://api.minka-sdg.org/v1/observations/species_counts?"
-    url1 = f"{species}&project_id={proj_id}&d2={last_week_date}&order=desc&order_by=created_at"
-    lw_spe = requests.get(url1).json()["total_results"]
-
-    observers = "https://api.minka-sdg.org/v1/observations/observers?"
-    url2 = f"{observers}&project_id={proj_id}&d2={last_week_date}&order=desc&order_by=created_at"
-    lw_part = requests.get(url2).json()["total_results"]
-
-    observations = "https://api.minka-sdg.org/v1/observations?"
-    url3 = f"{observations}&project_id={proj_id}&d2={last_week_date}&order=desc&order_by=created_at"
-    lw_obs = requests.get(url3).json()["total_results"]
-
-    identifiers = f"https://api.minka-sdg.org/v1/observations/identifiers?"
-    url4 = f"{identifiers}project_id={proj_id}&d2={last_week_date}"
-    lw_ident = requests.get(url4).json()["total_results"]
-
-    return lw_obs, lw_spe, lw_part, lw_ident
-
 
 @st.cache_data(ttl=360)
 def get_metrics_cities(codes):
-    result = []
-
-    for k, v in codes.items():
-        species = "https://api.minka-sdg.org/v1/observations/species_counts?"
-        url1 = f"{species}&project_id={k}"
-        total_species = requests.get(url1).json()["total_results"]
-
-        observers = "https://api.minka-sdg.org/v1/observations/observers?"
-        url2 = f"{observers}&project_id={k}"
-        total_participants = requests.get(url2).json()["total_results"]
-
-        observations = "https://api.minka-sdg.org/v1/observations?"
-        url3 = f"{observations}&project_id={k}"
-        total_obs = requests.get(url3).json()["total_results"]
-
-        data = {
-            "ciutat": v,
-            "espècies": total_species,
-            "participants": total_participants,
-            "observacions": total_obs,
-        }
-        result.append(data)
-    main_metrics = pd.DataFrame(result)
+    main_metrics = get_projects_totals(codes, key="ciutat")
     return main_metrics
 
 
@@ -325,7 +291,7 @@ def create_markercluster(df, center=None, zoom=10):
 
 @st.cache_data(ttl=360)
 def get_total_obs():
-    df_total = pd.read_csv(f"{directory}/data/264_obs.csv")
+    df_total = read_table(f"{directory}/data/264_obs.csv")
     return df_total
 
 
@@ -345,7 +311,7 @@ def convert_table(df, index):
 @st.cache_data(ttl=360)
 def get_table_count(url, parameter):
     if parameter == "identifiers":
-        results = requests.get(url).json()["results"]
+        results = session.get(url).json()["results"]
         total = []
         for result in results:
             identifiers_count = {
@@ -358,15 +324,15 @@ def get_table_count(url, parameter):
 
     elif parameter == "observers":
         results = []
-        total_results = requests.get(url).json()["total_results"]
+        total_results = session.get(url).json()["total_results"]
 
         if total_results > 500:
             num = math.ceil(total_results / 500)
             for i in range(1, num + 1):
                 page_url = f"{url}&page={i}"
-                results.extend(requests.get(page_url).json()["results"])
+                results.extend(session.get(page_url).json()["results"])
         else:
-            results = requests.get(url).json()["results"]
+            results = session.get(url).json()["results"]
 
         total = []
         for result in results:
@@ -380,15 +346,15 @@ def get_table_count(url, parameter):
 
     elif parameter == "species":
         results = []
-        total_results = requests.get(url).json()["total_results"]
+        total_results = session.get(url).json()["total_results"]
 
         if total_results > 500:
             num = math.ceil(total_results / 500)
             for i in range(1, num + 1):
                 page_url = f"{url}&page={i}"
-                results.extend(requests.get(page_url).json()["results"])
+                results.extend(session.get(page_url).json()["results"])
         else:
-            results = requests.get(url).json()["results"]
+            results = session.get(url).json()["results"]
 
         total = []
         for result in results:
@@ -562,12 +528,12 @@ def fig_area_evolution(df, field, title, color, start_date=None, end_date=None):
 
 @st.cache_data(ttl=360)
 def get_last_species(city):
-    df = pd.read_csv(f"{directory}/data/obs_{city}.csv")
+    df = read_table(f"{directory}/data/obs_{city}.csv")
     df2 = df.drop_duplicates(subset=["taxon_id"], keep="first")
     result = df2.sort_values(by=["created_at"], ascending=False)[
         ["taxon_name", "created_at", "id"]
     ].head(5)
-    df_photos = pd.read_csv(f"{directory}/data/264_photos.csv")
+    df_photos = read_table(f"{directory}/data/264_photos.csv")
     result["image"] = result["id"].apply(
         lambda x: df_photos[df_photos["id"] == x]["photos_medium_url"].head(1).item()
     )
@@ -579,16 +545,16 @@ def get_last_species(city):
 
 @st.cache_data(ttl=360)
 def get_num_species_by_city(city):
-    df = pd.read_csv(f"{directory}/data/obs_{city}.csv")
+    df = read_table(f"{directory}/data/obs_{city}.csv")
     df_species = df.taxon_name.value_counts().to_frame().reset_index()
     return df_species
 
 
 @st.cache_data(ttl=360)
 def get_best_observers(city):
-    df = pd.read_csv(f"{directory}/data/obs_{city}.csv")
+    df = read_table(f"{directory}/data/obs_{city}.csv")
     df_observers = (
-        df.groupby("user_login")
+        df.groupby("user_login", observed=True)
         .agg("count")["id"]
         .sort_values(ascending=False)
         .to_frame()
@@ -600,20 +566,23 @@ def get_best_observers(city):
 
 @st.cache_data(ttl=360)
 def get_obs_by_rank(i_rank):
-    df = pd.read_csv(f"{directory}/data/264_obs.csv")
+    df = read_table(f"{directory}/data/264_obs.csv")
     df2 = df[df.quality_grade == "research"]
     ranks = ["kingdom", "phylum", "class", "order", "family", "genus"]
     result_df = (
-        df2.groupby(by=ranks[: i_rank + 1]).count()["id"].to_frame().reset_index()
+        df2.groupby(by=ranks[: i_rank + 1], observed=True)
+        .count()["id"]
+        .to_frame()
+        .reset_index()
     )
     return result_df
 
 
 @st.cache_data(ttl=360)
 def get_rank_names(rank_level):
-    df = pd.read_csv(f"{directory}/data/264_obs.csv")
+    df = read_table(f"{directory}/data/264_obs.csv")
     df2 = df[df.quality_grade == "research"]
-    list_names = df2[rank_level].unique()
+    list_names = df2[rank_level].astype(object).unique()
     return list_names
 
 
@@ -647,7 +616,7 @@ def get_num_species(main_project):
         date_str = current_date.strftime("%Y-%m-%d")
         url = f"{base_url}project_id={main_project}&introduced=true&d2={date_str}"
         try:
-            total_species = requests.get(url).json()["total_results"]
+            total_species = session.get(url).json()["total_results"]
             datos = {"data": date_str, "introduced_species": total_species}
             num_species.append(datos)
         except Exception as e:
@@ -666,7 +635,7 @@ def get_introduced_species(project_id, date=None):
         url = f"{species}project_id={project_id}&introduced=true"
     else:
         url = f"{species}project_id={project_id}&introduced=true&d2={date}"
-    total_species = requests.get(url).json()["total_results"]
+    total_species = session.get(url).json()["total_results"]
     return total_species
 
 
@@ -805,7 +774,9 @@ def get_number_species(df):
         group_name = cols[i]
         parent_name = cols[i - 1] if i > 0 else None
 
-        group_data = df.groupby(group_cols).size().reset_index(name="number")
+        group_data = (
+            df.groupby(group_cols, observed=True).size().reset_index(name="number")
+        )
         group_data.columns = group_cols + ["number"]
         group_data["name"] = group_data[group_name]
         group_data["parent"] = group_data[parent_name] if parent_name else "Life"
@@ -829,7 +800,7 @@ def get_photo_url_from_taxon(taxon_id):
     """Get photo URL from taxon ID"""
     taxon_id = int(taxon_id)
     url = f"https://minka-sdg.org/taxa/{taxon_id}.json"
-    photo_url = requests.get(url).json()["photo_url"]
+    photo_url = session.get(url).json()["photo_url"]
     photo_url = photo_url.replace("/square.", "/large.")
     return photo_url
 
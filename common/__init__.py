@@ -0,0 +1,3 @@
+"""
+Código compartido por los updaters y los dashboards de MINKA.
+"""
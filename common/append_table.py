@@ -0,0 +1,102 @@
+"""
+Tabla append-only por rangos de ids.
+
+Cada descarga de un rango de ids `[start, end)` se guarda como una parte
+inmutable (`{start}_{end}.parquet`, o `.csv` si pyarrow no está instalado)
+dentro de la carpeta de la tabla. Las partes se escriben de forma atómica, así
+que una descarga interrumpida sólo pierde los rangos que no había terminado, y
+la siguiente continúa desde el final del tramo continuo ya descargado.
+"""
+
+import ast
+import os
+
+import pandas as pd
+
+from common.storage import HAS_PARQUET
+
+
+class AppendTable:
+    """
+    Partes de la tabla en la carpeta `path`. `list_columns` son columnas con
+    listas, que en las partes CSV se guardan como texto.
+    """
+
+    def __init__(self, path: str, list_columns: list = ()):
+        self.path = path
+        self.list_columns = list(list_columns)
+        os.makedirs(path, exist_ok=True)
+
+    def parts(self) -> list:
+        """
+        Partes guardadas como (start, end, fichero), ordenadas por `start`.
+        """
+        parts = []
+        for name in os.listdir(self.path):
+            stem, ext = os.path.splitext(name)
+            if ext not in (".parquet", ".csv"):
+                continue
+            start, end = stem.split("_")
+            parts.append((int(start), int(end), os.path.join(self.path, name)))
+        return sorted(parts)
+
+    def covered(self, first_id: int) -> int:
+        """
+        Final del tramo continuo de rangos descargados desde `first_id`: a
+        partir de ese id falta algo por descargar.
+        """
+        end = first_id
+        for start, part_end, __ in self.parts():
+            if start > end:
+                break
+            end = max(end, part_end)
+        return end
+
+    def write_part(self, start: int, end: int, df: pd.DataFrame):
+        """
+        Guarda `df` como la parte del rango `[start, end)` y borra las partes
+        anteriores contenidas en ese rango (p. ej. el último lote, que se
+        descarga de nuevo cuando hay ids más altos).
+        """
+        ext = ".parquet" if HAS_PARQUET else ".csv"
+        path = os.path.join(self.path, f"{start:010d}_{end:010d}{ext}")
+        tmp_path = f"{path}.tmp"
+        if HAS_PARQUET:
+            df.to_parquet(tmp_path, index=False)
+        else:
+            df.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, path)
+        for part_start, part_end, part_path in self.parts():
+            if start <= part_start and part_end <= end and part_path != path:
+                os.remove(part_path)
+
+    def version(self):
+        """
+        Cambia cada vez que se añade una parte.
+        """
+        parts = self.parts()
+        return (len(parts), parts[-1][1]) if parts else None
+
+    def read(self, columns: list = None) -> pd.DataFrame:
+        """
+        Todas las partes en una tabla, en orden de rango. Con `columns` sólo se
+        leen esas columnas. Si quedan partes solapadas (una descarga interrumpida
+        entre escribir una parte y borrar las que sustituye) cada `id` sale una
+        sola vez, el de la parte que termina más tarde.
+        """
+        frames = []
+        for __, __, path in self.parts():
+            if path.endswith(".parquet"):
+                frames.append(pd.read_parquet(path, columns=columns))
+                continue
+            df = pd.read_csv(path, usecols=columns)
+            for col in self.list_columns:
+                if col in df.columns:
+                    df[col] = df[col].apply(ast.literal_eval)
+            frames.append(df)
+        if not frames:
+            return pd.DataFrame(columns=columns)
+        df = pd.concat(frames, ignore_index=True)
+        if "id" in df.columns:
+            df = df.drop_duplicates(subset="id", keep="last", ignore_index=True)
+        return df
@@ -0,0 +1,220 @@
+"""
+Cliente HTTP para la API de MINKA con limitación de ritmo y reintentos.
+
+`MinkaSession` es un `requests.Session` que, en cada petición:
+- espera un token de un token bucket compartido por todo el proceso, para no
+  superar el ritmo que tolera la API aunque haya varios hilos;
+- aplica un timeout por defecto;
+- reintenta los errores transitorios (timeouts, errores de conexión, 429 y 5xx)
+  con backoff exponencial con jitter, respetando `Retry-After` si llega;
+- registra el intento en `common.instrumentation` (endpoint, bytes, latencia).
+
+Se usa igual que una sesión de requests: `session.get(url, params=...)`. Las
+peticiones a MINKA de otras sesiones (las descargas de mecoda_minka) también
+toman token del mismo bucket, aunque sin reintentos.
+Las apps de Streamlit comparten una única sesión por proceso (`get_session`),
+con conexiones keep-alive reutilizadas entre renders.
+
+Con las variables de entorno `MINKA_API_PATH` y `MINKA_BASE_URL` todas las
+peticiones del proceso a la API y a la web de MINKA (también las de
+mecoda_minka) se redirigen a otro servidor, p. ej. el de `common.fake_api`.
+"""
+
+import json
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from common import instrumentation
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+API_PATH = "https://api.minka-sdg.org/v1"
+BASE_URL = "https://minka-sdg.org"
+
+# (prefijo original, destino); la API va antes porque su host contiene el de la web
+REDIRECTS = [
+    (API_PATH, os.environ.get("MINKA_API_PATH")),
+    (BASE_URL, os.environ.get("MINKA_BASE_URL")),
+]
+
+RATE = float(os.environ.get("MINKA_RATE", 10))  # peticiones por segundo
+BURST = int(os.environ.get("MINKA_BURST", 20))
+TIMEOUT = (10, 60)  # conexión, lectura
+RETRIES = 5
+BACKOFF = 1.0  # segundos, se dobla en cada intento
+MAX_BACKOFF = 60.0
+RETRY_STATUS = {429, 500, 502, 503, 504}
+POOL_SIZE = 16
+HEADERS = {"Accept": "application/json", "Accept-Encoding": "gzip, deflate"}
+
+
+class TokenBucket:
+    """
+    Token bucket thread-safe: `rate` tokens por segundo, hasta `burst` acumulados.
+    """
+
+    def __init__(self, rate: float = RATE, burst: int = BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.burst, self.tokens + (now - self.last) * self.rate
+                )
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def resolve_url(url: str) -> str:
+    """
+    URL a la que va realmente la petición según `REDIRECTS`.
+    """
+    for prefix, target in REDIRECTS:
+        if target and url.startswith(prefix):
+            return target.rstrip("/") + url[len(prefix) :]
+    return url
+
+
+# Un único bucket por proceso: todas las sesiones comparten el ritmo
+_bucket = TokenBucket()
+
+
+def _retry_after(response: requests.Response):
+    try:
+        return float(response.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return None
+
+
+class MinkaSession(requests.Session):
+    def __init__(
+        self,
+        bucket: TokenBucket = None,
+        timeout=TIMEOUT,
+        retries: int = RETRIES,
+        backoff: float = BACKOFF,
+        pool_size: int = POOL_SIZE,
+    ):
+        super().__init__()
+        self.headers.update(HEADERS)
+        self.bucket = bucket if bucket is not None else _bucket
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+
+    def _sleep(self, attempt: int, retry_after=None):
+        # Backoff exponencial con jitter completo
+        delay = min(MAX_BACKOFF, self.backoff * 2**attempt)
+        delay = random.uniform(0, delay)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        time.sleep(delay)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        for attempt in range(self.retries + 1):
+            self.bucket.acquire()
+            start = time.perf_counter()
+            try:
+                response = super().request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                instrumentation.record(
+                    url, elapsed=time.perf_counter() - start, attempt=attempt
+                )
+                if attempt == self.retries:
+                    raise
+                print(f"Error en {url} ({e.__class__.__name__}), reintentando...")
+                self._sleep(attempt)
+                continue
+
+            instrumentation.record(
+                url,
+                status=response.status_code,
+                nbytes=len(response.content),
+                elapsed=time.perf_counter() - start,
+                attempt=attempt,
+            )
+            if response.status_code not in RETRY_STATUS or attempt == self.retries:
+                return response
+            print(f"Error {response.status_code} en {url}, reintentando...")
+            self._sleep(attempt, _retry_after(response))
+        return response
+
+
+def _is_minka(url: str) -> bool:
+    return any(
+        url.startswith(prefix) or (target and url.startswith(target))
+        for prefix, target in REDIRECTS
+    )
+
+
+def _patch_requests():
+    # Las sesiones que no son MinkaSession (mecoda_minka, requests.get...)
+    # acaban todas en requests.Session.request: se redirigen como el resto y
+    # sus peticiones a MINKA toman token del bucket compartido. Las de otros
+    # servicios (WoRMS, GitHub) no pasan por el bucket.
+    request = requests.Session.request
+
+    def patched(self, method, url, *args, **kwargs):
+        if not isinstance(self, MinkaSession) and _is_minka(str(url)):
+            _bucket.acquire()
+        return request(self, method, resolve_url(url), *args, **kwargs)
+
+    requests.Session.request = patched
+
+
+_patch_requests()
+
+
+def loads(content):
+    """
+    Decodifica JSON con orjson si está instalado.
+    """
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def get_json(url: str, params: dict = None, session=None):
+    if session is None:
+        session = get_session()
+    response = session.get(url, params=params)
+    response.raise_for_status()
+    return loads(response.content)
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> MinkaSession:
+    """
+    Sesión compartida por todo el proceso (todas las páginas y usuarios de una
+    app de Streamlit), con su pool de conexiones keep-alive.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = MinkaSession()
+        return _session
@@ -0,0 +1,102 @@
+"""
+Motor de consultas de conteo contra la API de MINKA.
+
+Cada consulta ("job") es un endpoint + parámetros de la que sólo interesa el
+campo `total_results`. Los jobs se lanzan en paralelo con concurrencia acotada
+sobre un pool de conexiones reutilizadas y el resultado se devuelve como un
+DataFrame en formato largo (una fila por job).
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import requests
+
+from common.client import API_PATH, get_session, loads
+from common.http_cache import get_cache
+
+ENDPOINTS = {
+    "observations": f"{API_PATH}/observations",
+    "species": f"{API_PATH}/observations/species_counts",
+    "observers": f"{API_PATH}/observations/observers",
+    "identifiers": f"{API_PATH}/observations/identifiers",
+}
+
+# El ritmo real lo marca el token bucket de MinkaSession; coincide con el
+# tamaño del pool de la sesión compartida
+MAX_WORKERS = 16
+
+
+def count_job(endpoint: str, params: dict, **keys) -> dict:
+    """
+    Crea un job de conteo. Las claves extra (`date`, `city`...) se devuelven
+    como columnas en el DataFrame de resultados.
+    """
+    if endpoint not in ENDPOINTS:
+        raise ValueError(f"Endpoint desconocido: {endpoint}")
+    return {"endpoint": endpoint, "params": params, "keys": keys}
+
+
+def _get_total(session: requests.Session, job: dict, cache=None) -> int:
+    # Sólo se lee total_results: pedimos una única fila de resultados
+    params = {"per_page": 1, **job["params"]}
+    url = ENDPOINTS[job["endpoint"]]
+    if cache is not None:
+        return cache.get_json(session, url, params)["total_results"]
+    response = session.get(url, params=params)
+    response.raise_for_status()
+    return loads(response.content)["total_results"]
+
+
+def get_counts(
+    jobs: list, max_workers: int = MAX_WORKERS, session=None, cache: bool = False
+) -> pd.DataFrame:
+    """
+    Ejecuta los jobs de conteo en paralelo.
+
+    Devuelve un DataFrame con las claves de cada job, la columna `endpoint`
+    y la columna `total_results`, en el mismo orden que `jobs`.
+    Con `cache=True` las respuestas pasan por la caché en disco compartida;
+    las apps lo activan, los updaters del cron no, para no publicar totales
+    de hace unos minutos.
+    """
+    if not jobs:
+        return pd.DataFrame(
+            {"endpoint": pd.Series(dtype=str), "total_results": pd.Series(dtype=int)}
+        )
+    if session is None:
+        session = get_session()
+    cache = get_cache() if cache else None
+
+    max_workers = max(1, min(max_workers, len(jobs)))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        totals = list(executor.map(lambda job: _get_total(session, job, cache), jobs))
+
+    rows = [
+        {**job["keys"], "endpoint": job["endpoint"], "total_results": total}
+        for job, total in zip(jobs, totals)
+    ]
+    return pd.DataFrame(rows)
+
+
+def counts_wide(df_counts: pd.DataFrame, index) -> pd.DataFrame:
+    """
+    Pasa el resultado de `get_counts` a formato ancho: una columna por endpoint.
+    Los jobs con las mismas claves se suman (p. ej. ciudades con varios places).
+    Sin jobs devuelve un df vacío con las columnas de `index` y de todos los
+    endpoints.
+    """
+    if df_counts.empty:
+        keys = [index] if isinstance(index, str) else list(index)
+        columns = {col: pd.Series(dtype=object) for col in keys}
+        columns.update({endpoint: pd.Series(dtype=int) for endpoint in ENDPOINTS})
+        return pd.DataFrame(columns)
+    df_wide = df_counts.pivot_table(
+        index=index,
+        columns="endpoint",
+        values="total_results",
+        aggfunc="sum",
+        sort=False,
+    )
+    df_wide.columns.name = None
+    return df_wide.fillna(0).astype(int).reset_index()
@@ -0,0 +1,814 @@
+"""
+Servidor local que imita la API de MINKA para medir y probar los updaters sin
+depender de api.minka-sdg.org.
+
+Sirve `/v1/observations`, `/v1/observations/species_counts`, `observers` e
+`identifiers`, `/v1/identifications`, `/v1/projects`, `/v1/places`,
+`/v1/taxa`, `/v1/users` y `/taxa/{id}.json` de la web. Las respuestas salen de:
+
+- fixtures grabados: un JSON por consulta en `--fixtures DIR`, con nombre el
+  sha1 del path + parámetros normalizados. Con `--record` las consultas que no
+  tienen fixture se piden a la API real y se guardan (el servidor no debe
+  arrancarse con `MINKA_API_PATH` definida);
+- datos sintéticos deterministas (`--observations N`, `--seed`). Cualquier
+  id de proyecto o de place existe y contiene una fracción fija de las
+  observaciones, así que todos los updaters encuentran sus proyectos.
+
+La latencia (`--latency`, `--jitter`), el tamaño máximo de página
+(`--max-per-page`), el límite de resultados paginables (`--max-results`) y una
+tasa de errores 503 (`--error-rate`) son configurables.
+
+Uso:
+
+    python -m common.fake_api --port 8765 --observations 100000
+    export MINKA_API_PATH=http://127.0.0.1:8765/v1
+    export MINKA_BASE_URL=http://127.0.0.1:8765
+    export DASHBOARDS=$(mktemp -d)
+    python biomarato_25/update.py
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import numpy as np
+import pandas as pd
+import requests
+
+API_PATH = "https://api.minka-sdg.org/v1"
+BASE_URL = "https://minka-sdg.org"
+
+START_DATE = np.datetime64("2022-01-01")
+END_DATE = np.datetime64("2025-12-31")
+RANKS = ["kingdom", "phylum", "class", "order", "family", "genus", "species"]
+RANK_LEVELS = {
+    "kingdom": 70,
+    "phylum": 60,
+    "class": 50,
+    "order": 40,
+    "family": 30,
+    "genus": 20,
+    "species": 10,
+}
+ICONIC = ["Animalia", "Plantae", "Fungi", "Chromista", "Protozoa"]
+# Hijos por nivel del árbol taxonómico (phylum ... species)
+BRANCHING = [4, 3, 3, 4, 4, 3]
+QUALITY_GRADES = np.array(["research", "needs_id", "casual"])
+# Fracción (en %) de las observaciones que pertenece a cada proyecto y place
+PROJECT_SHARE = 20
+# Los ids de identificación de MINKA empiezan muy por encima de 1, y
+# download_identifications no pide los primeros 50.000
+IDENT_FIRST_ID = 50001
+PLACE_SHARE = 30
+DEFAULT_PER_PAGE = 30
+
+
+def _member_mask(ids: np.ndarray, group_id: int, share: int) -> np.ndarray:
+    # Pertenencia determinista de cada observación a un proyecto o place
+    mixed = (ids.astype(np.uint64) * np.uint64(2654435761)) ^ np.uint64(
+        group_id * 40503
+    )
+    return (mixed % np.uint64(100)) < share
+
+
+def _iso(value) -> str:
+    return pd.Timestamp(value).strftime("%Y-%m-%dT%H:%M:%S+00:00")
+
+
+class Dataset:
+    """
+    Datos sintéticos: árbol de taxones, usuarios, observaciones e
+    identificaciones, en arrays de numpy para filtrar rápido.
+    """
+
+    def __init__(
+        self,
+        num_observations: int = 10000,
+        num_users: int = None,
+        num_projects: int = 50,
+        seed: int = 0,
+    ):
+        rng = np.random.default_rng(seed)
+        self.num_projects = num_projects
+        self._user_counts = None
+        self._build_taxa()
+
+        num_users = num_users or max(10, num_observations // 50)
+        self.users = pd.DataFrame(
+            {
+                "id": np.arange(1, num_users + 1),
+                "login": [f"user{i}" for i in range(1, num_users + 1)],
+                "created_at": START_DATE
+                - rng.integers(0, 1000, num_users).astype("timedelta64[D]"),
+            }
+        )
+
+        n = num_observations
+        days = int((END_DATE - START_DATE).astype(int))
+        observed_on = START_DATE + np.sort(rng.integers(0, days, n)).astype(
+            "timedelta64[D]"
+        )
+        delay = rng.exponential(3, n).astype(int).astype("timedelta64[D]")
+        created_at = observed_on.astype("datetime64[s]") + (
+            delay.astype("timedelta64[s]") + rng.integers(0, 86400, n)
+        ).astype("timedelta64[s]")
+        # Pocos usuarios hacen la mayoría de observaciones
+        user_idx = np.minimum(
+            (rng.pareto(1.2, n) * num_users / 20).astype(int), num_users - 1
+        )
+        taxon_idx = self.species_idx[
+            np.minimum(
+                (rng.pareto(1.0, n) * len(self.species_idx) / 10).astype(int),
+                len(self.species_idx) - 1,
+            )
+        ]
+        # Algunas observaciones sólo están identificadas a género
+        coarse = rng.random(n) < 0.1
+        taxon_idx = np.where(coarse, self.parent_idx[taxon_idx], taxon_idx)
+        self.obs = pd.DataFrame(
+            {
+                "id": np.arange(1, n + 1),
+                "observed_on": observed_on,
+                "created_at": created_at,
+                "updated_at": created_at
+                + rng.integers(0, 30 * 86400, n).astype("timedelta64[s]"),
+                "user_idx": user_idx,
+                "taxon_idx": taxon_idx,
+                "quality_grade": QUALITY_GRADES[rng.choice(3, n, p=[0.6, 0.3, 0.1])],
+                "latitude": rng.uniform(40.5, 42.8, n).round(6),
+                "longitude": rng.uniform(0.2, 3.3, n).round(6),
+                "num_photos": rng.integers(0, 4, n),
+            }
+        )
+
+        # Identificaciones: la del autor más 0-3 de otros usuarios
+        extra = rng.integers(0, 4, n)
+        obs_idx = np.concatenate([np.arange(n), np.repeat(np.arange(n), extra)])
+        own = np.concatenate([np.ones(n, bool), np.zeros(extra.sum(), bool)])
+        order = np.argsort(obs_idx, kind="stable")
+        obs_idx, own = obs_idx[order], own[order]
+        ident_user = np.where(
+            own,
+            user_idx[obs_idx],
+            rng.integers(0, max(1, num_users // 10), len(obs_idx)),
+        )
+        self.idents = pd.DataFrame(
+            {
+                "id": np.arange(IDENT_FIRST_ID, IDENT_FIRST_ID + len(obs_idx)),
+                "obs_idx": obs_idx,
+                "user_idx": ident_user,
+                "taxon_idx": taxon_idx[obs_idx],
+                "own_observation": own,
+                "created_at": created_at[obs_idx]
+                + rng.integers(0, 7 * 86400, len(obs_idx)).astype("timedelta64[s]"),
+            }
+        )
+
+    def _build_taxa(self):
+        rows = [{"name": "Life", "rank": "stateofmatter", "parent": -1}]
+        frontier = []
+        for name in ICONIC:
+            rows.append({"name": name, "rank": "kingdom", "parent": 0})
+            frontier.append(len(rows) - 1)
+        for level, branching in zip(RANKS[1:], BRANCHING):
+            next_frontier = []
+            for parent in frontier:
+                for j in range(branching):
+                    rows.append(
+                        {
+                            "name": f"{rows[parent]['name']} {level[:3]}{j}",
+                            "rank": level,
+                            "parent": parent,
+                        }
+                    )
+                    next_frontier.append(len(rows) - 1)
+            frontier = next_frontier
+
+        taxa = pd.DataFrame(rows)
+        taxa["id"] = np.arange(1, len(taxa) + 1)
+        # Nombres binomiales para géneros y especies
+        is_genus = taxa["rank"] == "genus"
+        taxa.loc[is_genus, "name"] = [f"Genus{i}" for i in range(is_genus.sum())]
+        is_species = taxa["rank"] == "species"
+        taxa.loc[is_species, "name"] = [
+            f"{taxa.at[p, 'name']} species{i}"
+            for i, p in enumerate(taxa.loc[is_species, "parent"])
+        ]
+        ancestors = []
+        for i, parent in enumerate(taxa["parent"]):
+            ancestors.append((ancestors[parent] if parent >= 0 else []) + [i])
+        taxa["ancestors"] = ancestors
+        taxa["iconic"] = [
+            taxa.at[a[1], "name"] if len(a) > 1 else None for a in ancestors
+        ]
+        taxa["introduced"] = (taxa["id"] % 7) == 0
+
+        self.taxa = taxa
+        self.parent_idx = taxa["parent"].to_numpy()
+        self.species_idx = np.flatnonzero(is_species.to_numpy())
+        self.id_to_idx = {tid: i for i, tid in enumerate(taxa["id"])}
+        self._descendants = {}
+
+    def descendants(self, taxon_id: int) -> np.ndarray:
+        """
+        Índices del taxón y de todos sus descendientes.
+        """
+        if taxon_id not in self._descendants:
+            idx = self.id_to_idx.get(taxon_id)
+            self._descendants[taxon_id] = np.array(
+                (
+                    [i for i, a in enumerate(self.taxa["ancestors"]) if idx in a]
+                    if idx is not None
+                    else []
+                ),
+                dtype=int,
+            )
+        return self._descendants[taxon_id]
+
+    # Representación JSON
+
+    def taxon_json(self, idx: int, ancestors: bool = False) -> dict:
+        row = self.taxa.iloc[idx]
+        taxon = {
+            "id": int(row["id"]),
+            "name": row["name"],
+            "rank": row["rank"],
+            "rank_level": RANK_LEVELS.get(row["rank"], 100),
+            "ancestor_ids": [int(self.taxa.at[a, "id"]) for a in row["ancestors"]],
+            "ancestry": "/".join(
+                str(self.taxa.at[a, "id"]) for a in row["ancestors"][:-1]
+            ),
+            "iconic_taxon_name": row["iconic"] if pd.notna(row["iconic"]) else None,
+            "preferred_common_name": row["name"],
+            "introduced": bool(row["introduced"]),
+            "is_active": True,
+            "default_photo": {
+                "medium_url": f"{BASE_URL}/attachments/taxa/{row['id']}/medium.jpg"
+            },
+        }
+        if ancestors:
+            taxon["ancestors"] = [self.taxon_json(a) for a in row["ancestors"][1:-1]]
+        return taxon
+
+    def user_json(self, idx: int, counts: bool = False) -> dict:
+        row = self.users.iloc[idx]
+        user = {
+            "id": int(row["id"]),
+            "login": row["login"],
+            "name": row["login"].capitalize(),
+            "created_at": _iso(row["created_at"]),
+            "icon_url": None,
+        }
+        if counts:
+            user.update(self.user_counts().iloc[idx].to_dict())
+        return user
+
+    def user_counts(self) -> pd.DataFrame:
+        """
+        Observaciones, identificaciones y especies de cada usuario (por índice).
+        """
+        if self._user_counts is None:
+            obs = self.obs
+            species = obs[np.isin(obs["taxon_idx"], self.species_idx)]
+            index = pd.RangeIndex(len(self.users))
+            self._user_counts = (
+                pd.DataFrame(
+                    {
+                        "observations_count": obs.groupby("user_idx").size(),
+                        "identifications_count": self.idents.groupby("user_idx").size(),
+                        "species_count": species.groupby("user_idx")[
+                            "taxon_idx"
+                        ].nunique(),
+                    }
+                )
+                .reindex(index)
+                .fillna(0)
+                .astype(int)
+            )
+        return self._user_counts
+
+    def obs_json(self, row) -> dict:
+        obs_id = int(row.id)
+        photos = [
+            {
+                "id": obs_id * 10 + k,
+                "url": f"{BASE_URL}/attachments/photos/{obs_id * 10 + k}/square.jpg",
+                "license_code": "cc-by",
+                "attribution": "(c) MINKA",
+            }
+            for k in range(row.num_photos)
+        ]
+        observed = pd.Timestamp(row.observed_on)
+        created = pd.Timestamp(row.created_at)
+        return {
+            "id": obs_id,
+            "uuid": f"00000000-0000-0000-0000-{obs_id:012d}",
+            "quality_grade": row.quality_grade,
+            "observed_on": observed.strftime("%Y-%m-%d"),
+            "observed_on_details": {
+                "date": observed.strftime("%Y-%m-%d"),
+                "year": observed.year,
+                "month": observed.month,
+                "day": observed.day,
+            },
+            "time_observed_at": _iso(row.created_at),
+            "created_at": _iso(created),
+            "created_at_details": {"date": created.strftime("%Y-%m-%d")},
+            "updated_at": _iso(row.updated_at),
+            "taxon": self.taxon_json(int(row.taxon_idx)),
+            "user": self.user_json(int(row.user_idx)),
+            "location": f"{row.latitude},{row.longitude}",
+            "geojson": {
+                "type": "Point",
+                "coordinates": [row.longitude, row.latitude],
+            },
+            "photos": photos,
+            "observation_photos": [
+                {"id": p["id"], "position": k, "photo": p} for k, p in enumerate(photos)
+            ],
+            "place_guess": "Catalunya",
+            "identifications_count": 1,
+            "comments_count": 0,
+            "license_code": "cc-by",
+        }
+
+    # Filtros
+
+    def filter_obs(self, params: dict) -> np.ndarray:
+        """
+        Máscara de las observaciones que cumplen los parámetros de la query.
+        """
+        obs = self.obs
+        ids = obs["id"].to_numpy()
+        mask = np.ones(len(obs), bool)
+
+        def date(value):
+            return np.datetime64(value[:10])
+
+        for key, value in params.items():
+            if value in ("", None):
+                continue
+            if key == "project_id":
+                group = np.zeros(len(obs), bool)
+                for pid in str(value).split(","):
+                    group |= _member_mask(ids, int(pid), PROJECT_SHARE)
+                mask &= group
+            elif key == "place_id":
+                group = np.zeros(len(obs), bool)
+                for pid in str(value).split(","):
+                    group |= _member_mask(ids, int(pid), PLACE_SHARE)
+                mask &= group
+            elif key in ("taxon_id", "taxon_ids"):
+                taxa = np.concatenate(
+                    [self.descendants(int(t)) for t in str(value).split(",")]
+                )
+                mask &= np.isin(obs["taxon_idx"].to_numpy(), taxa)
+            elif key == "user_id":
+                users = [int(u) - 1 for u in str(value).split(",")]
+                mask &= np.isin(obs["user_idx"].to_numpy(), users)
+            elif key == "user_login":
+                logins = str(value).split(",")
+                users = np.flatnonzero(self.users["login"].isin(logins))
+                mask &= np.isin(obs["user_idx"].to_numpy(), users)
+            elif key == "id":
+                mask &= np.isin(ids, [int(i) for i in str(value).split(",")])
+            elif key == "id_above":
+                mask &= ids > int(value)
+            elif key == "id_below":
+                mask &= ids < int(value)
+            elif key == "d1":
+                mask &= obs["observed_on"].to_numpy() >= date(value)
+            elif key == "d2":
+                mask &= obs["observed_on"].to_numpy() <= date(value)
+            elif key == "created_d1":
+                mask &= obs["created_at"].to_numpy() >= date(value)
+            elif key == "created_d2":
+                mask &= obs["created_at"].to_numpy() < date(value) + np.timedelta64(
+                    1, "D"
+                )
+            elif key == "updated_since":
+                mask &= obs["updated_at"].to_numpy() >= date(value)
+            elif key in ("quality_grade", "grade"):
+                mask &= obs["quality_grade"].isin(str(value).split(",")).to_numpy()
+            elif key == "photos" and value == "true":
+                mask &= obs["num_photos"].to_numpy() > 0
+            elif key == "introduced" and value == "true":
+                introduced = np.flatnonzero(self.taxa["introduced"])
+                mask &= np.isin(obs["taxon_idx"].to_numpy(), introduced)
+            elif key == "rank":
+                ranks = np.flatnonzero(self.taxa["rank"].isin(str(value).split(",")))
+                mask &= np.isin(obs["taxon_idx"].to_numpy(), ranks)
+            elif key == "iconic_taxa":
+                iconic = np.flatnonzero(self.taxa["iconic"].isin(str(value).split(",")))
+                mask &= np.isin(obs["taxon_idx"].to_numpy(), iconic)
+            elif key == "year":
+                years = [int(y) for y in str(value).split(",")]
+                mask &= obs["observed_on"].dt.year.isin(years).to_numpy()
+            elif key == "month":
+                months = [int(m) for m in str(value).split(",")]
+                mask &= obs["observed_on"].dt.month.isin(months).to_numpy()
+        return mask
+
+
+def _page(params: dict, max_per_page: int) -> tuple:
+    per_page = min(int(params.get("per_page", DEFAULT_PER_PAGE)), max_per_page)
+    page = max(int(params.get("page", 1)), 1)
+    return page, per_page
+
+
+class FakeMinka:
+    """
+    Resuelve una petición (path + parámetros) a (status, cuerpo JSON).
+    """
+
+    def __init__(
+        self,
+        dataset: Dataset,
+        fixtures: str = None,
+        record: bool = False,
+        max_per_page: int = 200,
+        max_results: int = 10000,
+    ):
+        self.data = dataset
+        self.fixtures = fixtures
+        self.record = record
+        self.max_per_page = max_per_page
+        self.max_results = max_results
+        self.requests = Counter()
+        self._lock = threading.Lock()
+        if fixtures:
+            os.makedirs(fixtures, exist_ok=True)
+
+    def count(self, path: str):
+        # Peticiones recibidas por endpoint, con los ids sustituidos
+        with self._lock:
+            self.requests[re.sub(r"/\d+(?=/|\.|$)", "/{id}", path)] += 1
+
+    def request_counts(self) -> Counter:
+        with self._lock:
+            return Counter(self.requests)
+
+    # Fixtures
+
+    def _fixture_path(self, path: str, params: dict) -> str:
+        query = urlencode(sorted((k, v) for k, v in params.items() if v != ""))
+        key = hashlib.sha1(f"{path}?{query}".encode()).hexdigest()
+        return os.path.join(self.fixtures, f"{key}.json")
+
+    def _replay(self, path: str, params: dict):
+        fixture = self._fixture_path(path, params)
+        if os.path.exists(fixture):
+            with open(fixture) as f:
+                return 200, json.load(f)
+        if self.record:
+            real = API_PATH + path[3:] if path.startswith("/v1") else BASE_URL + path
+            response = requests.get(real, params=params, timeout=60)
+            if response.ok:
+                with open(fixture, "w") as f:
+                    f.write(response.text)
+            return response.status_code, response.json()
+        return None
+
+    # Rutas
+
+    def handle(self, path: str, params: dict) -> tuple:
+        if self.fixtures:
+            replayed = self._replay(path, params)
+            if replayed is not None:
+                return replayed
+
+        routes = [
+            (r"/v1/observations/species_counts", self.species_counts),
+            (r"/v1/observations/observers", self.observers),
+            (r"/v1/observations/identifiers", self.identifiers),
+            (r"/v1/observations(?:/(?P<ids>[\d,]+))?", self.observations),
+            (r"/v1/identifications", self.identifications),
+            (r"/v1/projects(?:/(?P<ids>[\d,]+))?", self.projects),
+            (r"/v1/places/(?P<ids>[\d,]+)", self.places),
+            (r"/v1/taxa(?:/(?P<ids>[\d,]+))?", self.taxa),
+            (r"/v1/users/(?P<ids>\d+)", self.users),
+            (r"/taxa/(?P<ids>\d+)\.json", self.web_taxon),
+        ]
+        for pattern, route in routes:
+            match = re.fullmatch(pattern, path.rstrip("/"))
+            if match:
+                ids = match.groupdict().get("ids")
+                if ids:
+                    params = {**params, "id": ids}
+                return route(params)
+        return 404, {"error": f"Ruta desconocida: {path}"}
+
+    def _paginate(self, params: dict, items, total: int, render) -> tuple:
+        page, per_page = _page(params, self.max_per_page)
+        if page * per_page > self.max_results:
+            return 403, {"error": "Too many results, use id_above"}
+        start, end = (page - 1) * per_page, page * per_page
+        if isinstance(items, pd.DataFrame):
+            chunk = items.iloc[start:end].itertuples(index=False)
+        else:
+            chunk = items[start:end]
+        return 200, {
+            "total_results": total,
+            "page": page,
+            "per_page": per_page,
+            "results": [render(item) for item in chunk],
+        }
+
+    def observations(self, params: dict) -> tuple:
+        data = self.data
+        df = data.obs[data.filter_obs(params)]
+        order_by = params.get("order_by", "created_at")
+        column = {"observed_on": "observed_on", "id": "id", "updated_at": "updated_at"}
+        df = df.sort_values(
+            column.get(order_by, "created_at"),
+            ascending=params.get("order", "desc") == "asc",
+            kind="stable",
+        )
+        if params.get("only_id") == "true":
+            render = lambda row: {"id": int(row.id)}
+        else:
+            render = data.obs_json
+        return self._paginate(params, df, len(df), render)
+
+    def species_counts(self, params: dict) -> tuple:
+        data = self.data
+        taxa = data.obs.loc[data.filter_obs(params), "taxon_idx"]
+        taxa = taxa[np.isin(taxa, data.species_idx)]
+        counts = taxa.value_counts()
+        items = list(counts.items())
+        return self._paginate(
+            params,
+            items,
+            len(items),
+            lambda item: {"count": int(item[1]), "taxon": data.taxon_json(item[0])},
+        )
+
+    def observers(self, params: dict) -> tuple:
+        data = self.data
+        df = data.obs[data.filter_obs(params)]
+        species = df[np.isin(df["taxon_idx"], data.species_idx)]
+        stats = pd.DataFrame(
+            {
+                "observation_count": df.groupby("user_idx").size(),
+                "species_count": species.groupby("user_idx")["taxon_idx"].nunique(),
+            }
+        ).fillna(0)
+        by = (
+            "species_count"
+            if params.get("order_by") == "species_count"
+            else "observation_count"
+        )
+        stats = stats.sort_values(by, ascending=False)
+        items = list(stats.itertuples())
+        return self._paginate(
+            params,
+            items,
+            len(items),
+            lambda row: {
+                "user_id": int(data.users.at[row.Index, "id"]),
+                "observation_count": int(row.observation_count),
+                "species_count": int(row.species_count),
+                "user": data.user_json(row.Index, counts=True),
+            },
+        )
+
+    def identifiers(self, params: dict) -> tuple:
+        data = self.data
+        obs_idx = np.flatnonzero(data.filter_obs(params))
+        idents = data.idents[np.isin(data.idents["obs_idx"], obs_idx)]
+        counts = idents.groupby("user_idx").size().sort_values(ascending=False)
+        items = list(counts.items())
+        return self._paginate(
+            params,
+            items,
+            len(items),
+            lambda item: {
+                "user_id": int(data.users.at[item[0], "id"]),
+                "count": int(item[1]),
+                "user": data.user_json(item[0], counts=True),
+            },
+        )
+
+    def identifications(self, params: dict) -> tuple:
+        data = self.data
+        idents = data.idents
+        ids = idents["id"].to_numpy()
+        mask = np.ones(len(idents), bool)
+        if params.get("own_observation") in ("true", "false"):
+            mask &= idents["own_observation"].to_numpy() == (
+                params["own_observation"] == "true"
+            )
+        if "id_above" in params:
+            mask &= ids > int(params["id_above"])
+        if "id_below" in params:
+            mask &= ids < int(params["id_below"])
+        if "user_id" in params:
+            users = [int(u) - 1 for u in str(params["user_id"]).split(",")]
+            mask &= np.isin(idents["user_idx"], users)
+        df = idents[mask].sort_values(
+            "id", ascending=params.get("order", "desc") == "asc"
+        )
+        return self._paginate(
+            params,
+            df,
+            len(df),
+            lambda row: {
+                "id": int(row.id),
+                "created_at": _iso(row.created_at),
+                "own_observation": bool(row.own_observation),
+                "current": True,
+                "category": "supporting",
+                "user": data.user_json(int(row.user_idx)),
+                "taxon_id": int(data.taxa.at[row.taxon_idx, "id"]),
+                "taxon": data.taxon_json(int(row.taxon_idx)),
+                "observation": {"id": int(data.obs.at[row.obs_idx, "id"])},
+            },
+        )
+
+    def _project_json(self, project_id: int) -> dict:
+        created = START_DATE + np.timedelta64(project_id % 1000, "D")
+        return {
+            "id": project_id,
+            "title": f"Projecte {project_id}",
+            "slug": f"projecte-{project_id}",
+            "description": f"Projecte sintètic {project_id}",
+            "project_type": "collection",
+            "created_at": _iso(created),
+            "updated_at": _iso(created + np.timedelta64(30, "D")),
+            "place_id": project_id,
+            "admins": [{"user": self.data.user_json(0)}],
+            "user_ids": [],
+            "search_parameters": [],
+        }
+
+    def projects(self, params: dict) -> tuple:
+        if "id" in params:
+            ids = [int(i) for i in str(params["id"]).split(",")]
+        else:
+            ids = list(range(1, self.data.num_projects + 1))
+            if params.get("order_by") == "created":
+                ids = ids[::-1]
+        return self._paginate(params, ids, len(ids), self._project_json)
+
+    def places(self, params: dict) -> tuple:
+        results = []
+        for place_id in str(params["id"]).split(","):
+            # Rectángulo que cubre la zona de las observaciones sintéticas
+            ring = [[0.2, 40.5], [3.3, 40.5], [3.3, 42.8], [0.2, 42.8], [0.2, 40.5]]
+            results.append(
+                {
+                    "id": int(place_id),
+                    "name": f"Place {place_id}",
+                    "display_name": f"Place {place_id}",
+                    "geometry_geojson": {
+                        "type": "MultiPolygon",
+                        "coordinates": [[ring]],
+                    },
+                    "bounding_box_geojson": {"type": "Polygon", "coordinates": [ring]},
+                }
+            )
+        return 200, {"total_results": len(results), "page": 1, "results": results}
+
+    def taxa(self, params: dict) -> tuple:
+        data = self.data
+        if "id" in params:
+            idx = [
+                data.id_to_idx[int(i)]
+                for i in str(params["id"]).split(",")
+                if int(i) in data.id_to_idx
+            ]
+        else:
+            idx = list(range(len(data.taxa)))
+        return self._paginate(
+            params, idx, len(idx), lambda i: data.taxon_json(i, ancestors=True)
+        )
+
+    def users(self, params: dict) -> tuple:
+        user_idx = int(params["id"]) - 1
+        if not 0 <= user_idx < len(self.data.users):
+            return 200, {"total_results": 0, "page": 1, "results": []}
+        user = self.data.user_json(user_idx, counts=True)
+        return 200, {"total_results": 1, "page": 1, "results": [user]}
+
+    def web_taxon(self, params: dict) -> tuple:
+        idx = self.data.id_to_idx.get(int(params["id"]))
+        if idx is None:
+            return 404, {"error": "Not found"}
+        taxon = self.data.taxon_json(idx)
+        return 200, {
+            "id": taxon["id"],
+            "name": taxon["name"],
+            "rank": taxon["rank"],
+            "photo_url": taxon["default_photo"]["medium_url"],
+        }
+
+
+def make_handler(api: FakeMinka, latency: float, jitter: float, error_rate: float):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            parts = urlsplit(self.path)
+            params = dict(parse_qsl(parts.query, keep_blank_values=True))
+            api.count(parts.path)
+            time.sleep(max(0.0, latency + random.uniform(-jitter, jitter)))
+
+            if error_rate and random.random() < error_rate:
+                status, body = 503, {"error": "Service Unavailable"}
+            else:
+                try:
+                    status, body = api.handle(parts.path, params)
+                except (KeyError, ValueError) as e:
+                    status, body = 422, {"error": str(e)}
+                except Exception as e:
+                    status, body = 500, {"error": repr(e)}
+
+            content = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(
+    port: int = 0,
+    observations: int = 10000,
+    users: int = None,
+    projects: int = 50,
+    seed: int = 0,
+    latency: float = 0.0,
+    jitter: float = 0.0,
+    error_rate: float = 0.0,
+    max_per_page: int = 200,
+    max_results: int = 10000,
+    fixtures: str = None,
+    record: bool = False,
+    background: bool = True,
+):
+    """
+    Arranca el servidor en 127.0.0.1:`port` (0 = puerto libre).
+
+    Con `background=True` corre en un hilo y devuelve (servidor, URL base);
+    la API queda en `{URL base}/v1`, las peticiones recibidas en
+    `servidor.api.request_counts()` y se para con `servidor.shutdown()`.
+    """
+    dataset = Dataset(observations, users, projects, seed)
+    api = FakeMinka(dataset, fixtures, record, max_per_page, max_results)
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", port), make_handler(api, latency, jitter, error_rate)
+    )
+    server.daemon_threads = True
+    server.api = api
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    if background:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server, base_url
+    print(f"API de MINKA simulada en {base_url}/v1")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="API de MINKA simulada")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--observations", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=None)
+    parser.add_argument("--projects", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0, help="segundos")
+    parser.add_argument("--jitter", type=float, default=0.0, help="segundos")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--max-per-page", type=int, default=200)
+    parser.add_argument("--max-results", type=int, default=10000)
+    parser.add_argument("--fixtures", default=None)
+    parser.add_argument("--record", action="store_true")
+    args = parser.parse_args()
+
+    serve(
+        port=args.port,
+        observations=args.observations,
+        users=args.users,
+        projects=args.projects,
+        seed=args.seed,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        max_per_page=args.max_per_page,
+        max_results=args.max_results,
+        fixtures=args.fixtures,
+        record=args.record,
+        background=False,
+    )
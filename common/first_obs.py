@@ -0,0 +1,104 @@
+"""
+Índice persistente de la primera observación (grado research) de cada taxón
+en un place.
+
+Las listas de especies de los dashboards muestran, para cada especie, la
+fecha, el autor, el id y la foto de su primera observación. El índice se
+guarda en un CSV con una fila por (place_id, taxon_id), así que en cada
+ejecución sólo se consultan los taxones nuevos, con una única petición por
+taxón (la foto viene en la misma respuesta) y en paralelo.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from common.client import API_PATH, get_session, loads
+
+FIELDS = ["first_date", "author", "obs_id", "photo_url"]
+COLUMNS = ["place_id", "taxon_id"] + FIELDS
+MAX_WORKERS = 16
+
+
+def fetch_first_obs(taxon_id: int, place_id: int, session=None) -> list:
+    """
+    Devuelve [fecha, autor, obs_id, url de la foto] de la primera observación
+    research del taxón en el place, o [None, None, None, None] si no hay.
+    """
+    if session is None:
+        session = get_session()
+    params = {
+        "place_id": place_id,
+        "quality_grade": "research",
+        "taxon_id": taxon_id,
+        "order_by": "observed_on",
+        "order": "asc",
+        "per_page": 1,
+    }
+    response = session.get(f"{API_PATH}/observations", params=params)
+    response.raise_for_status()
+    results = loads(response.content)["results"]
+    if not results:
+        return [None, None, None, None]
+
+    obs = results[0]
+    photos = obs.get("photos") or []
+    photo_url = photos[0]["url"].replace("/square", "/large") if photos else None
+    return [obs["observed_on"], obs["user"]["login"], obs["id"], photo_url]
+
+
+def load_index(path: str) -> pd.DataFrame:
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=COLUMNS)
+    return pd.read_csv(path)[COLUMNS]
+
+
+def save_index(df_index: pd.DataFrame, path: str):
+    # Escritura atómica para no dejar el índice a medias si se corta el proceso
+    tmp_path = f"{path}.tmp"
+    df_index.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def get_first_obs(
+    taxon_ids,
+    place_id: int,
+    path: str,
+    session=None,
+    max_workers: int = MAX_WORKERS,
+) -> pd.DataFrame:
+    """
+    Primera observación de cada taxón de `taxon_ids` en `place_id`, con las
+    columnas `FIELDS` y en el mismo orden que `taxon_ids`.
+
+    Los taxones que no están en el índice de `path` se consultan en paralelo y
+    se añaden al índice. Los que no tienen ninguna observación no se guardan,
+    para volver a consultarlos en la próxima ejecución.
+    """
+    if session is None:
+        session = get_session()
+    taxon_ids = [int(taxon_id) for taxon_id in taxon_ids]
+
+    df_index = load_index(path)
+    known = df_index[df_index["place_id"] == place_id].set_index("taxon_id")[FIELDS]
+    missing = [t for t in dict.fromkeys(taxon_ids) if t not in known.index]
+
+    if missing:
+        print(f"Primera observación de {len(missing)} taxones nuevos")
+        max_workers = max(1, min(max_workers, len(missing)))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            rows = list(
+                executor.map(lambda t: fetch_first_obs(t, place_id, session), missing)
+            )
+        df_new = pd.DataFrame(rows, columns=FIELDS)
+        df_new.insert(0, "taxon_id", missing)
+        df_new.insert(0, "place_id", place_id)
+        df_new = df_new[df_new["obs_id"].notna()]
+        if len(df_new) > 0:
+            df_index = pd.concat([df_index, df_new], ignore_index=True)
+            save_index(df_index, path)
+        known = pd.concat([known, df_new.set_index("taxon_id")[FIELDS]])
+
+    df_first = known.reindex(taxon_ids).reset_index(drop=True)
+    return df_first.astype({"obs_id": "Int64"})
@@ -0,0 +1,235 @@
+"""
+Caché en disco de respuestas JSON de MINKA compartida entre procesos.
+
+Los updaters del cron y las apps de Streamlit piden las mismas URLs (totales
+de proyecto, páginas de species_counts, taxa...). Las respuestas se guardan en
+un SQLite bajo `{DASHBOARDS}/.cache`, con clave URL + parámetros normalizados,
+un TTL por endpoint, un tamaño máximo con expulsión LRU y revalidación
+condicional (ETag / Last-Modified) cuando la entrada ha caducado.
+"""
+
+import hashlib
+import os
+import sqlite3
+import tempfile
+import time
+from contextlib import contextmanager
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+
+from common import instrumentation
+from common.client import get_session, loads, resolve_url
+
+CACHE_DIR = os.environ.get(
+    "MINKA_CACHE_DIR",
+    os.path.join(os.environ.get("DASHBOARDS", tempfile.gettempdir()), ".cache"),
+)
+CACHE_FILE = "minka_http.sqlite"
+MAX_BYTES = 256 * 1024 * 1024
+
+# TTL en segundos según el path; se usa la primera coincidencia
+TTLS = [
+    ("/observations/species_counts", 300),
+    ("/observations/observers", 300),
+    ("/observations/identifiers", 300),
+    ("/observations", 300),
+    ("/projects", 3600),
+    ("/users", 3600),
+    ("/places", 7 * 86400),
+    ("/taxa", 7 * 86400),
+]
+DEFAULT_TTL = 300
+
+
+def normalize_url(url: str, params: dict = None) -> str:
+    """
+    URL con los parámetros de la query y de `params` unidos y ordenados, para
+    que la misma consulta tenga siempre la misma clave.
+    """
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    if params:
+        query.extend((k, str(v)) for k, v in params.items() if v is not None)
+    query = sorted((k, v) for k, v in query if k)
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), ""))
+
+
+def ttl_for(url: str) -> int:
+    path = urlsplit(url).path
+    for prefix, ttl in TTLS:
+        if prefix in path:
+            return ttl
+    return DEFAULT_TTL
+
+
+class ResponseCache:
+    """
+    Caché de respuestas en SQLite. Abre una conexión por operación, así que
+    se puede usar desde varios hilos y procesos a la vez.
+    """
+
+    def __init__(self, cache_dir: str = CACHE_DIR, max_bytes: int = MAX_BYTES):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, CACHE_FILE)
+        self.max_bytes = max_bytes
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    url TEXT,
+                    body BLOB,
+                    size INTEGER,
+                    etag TEXT,
+                    last_modified TEXT,
+                    stored_at REAL,
+                    accessed_at REAL
+                )
+                """)
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_accessed ON responses (accessed_at)"
+            )
+            # Tamaño total de las respuestas, para no sumarlo en cada escritura
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS stats (id INTEGER PRIMARY KEY, total INTEGER)"
+            )
+            conn.execute(
+                "INSERT OR IGNORE INTO stats "
+                "SELECT 0, COALESCE(SUM(size), 0) FROM responses"
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _lookup(self, key: str):
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT body, etag, last_modified, stored_at FROM responses WHERE key = ?",
+                (key,),
+            ).fetchone()
+
+    def _touch(self, key: str, revalidated: bool = False):
+        now = time.time()
+        with self._connect() as conn:
+            if revalidated:
+                conn.execute(
+                    "UPDATE responses SET stored_at = ?, accessed_at = ? WHERE key = ?",
+                    (now, now, key),
+                )
+            else:
+                conn.execute(
+                    "UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key)
+                )
+
+    def _store(self, key: str, url: str, response: requests.Response):
+        now = time.time()
+        body = response.content
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            old = conn.execute("SELECT size FROM responses WHERE key = ?", (key,))
+            old_size = (old.fetchone() or (0,))[0]
+            conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    url,
+                    body,
+                    len(body),
+                    response.headers.get("ETag"),
+                    response.headers.get("Last-Modified"),
+                    now,
+                    now,
+                ),
+            )
+            conn.execute(
+                "UPDATE stats SET total = total + ? WHERE id = 0",
+                (len(body) - old_size,),
+            )
+            total = conn.execute("SELECT total FROM stats WHERE id = 0").fetchone()[0]
+        if total > self.max_bytes:
+            self._evict()
+
+    def _evict(self):
+        # LRU: borra las entradas menos usadas hasta quedar por debajo del máximo
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            total = conn.execute("SELECT total FROM stats WHERE id = 0")
+            excess = total.fetchone()[0] - self.max_bytes
+            if excess <= 0:
+                return
+            rows = conn.execute(
+                "SELECT key, size FROM responses ORDER BY accessed_at ASC"
+            )
+            to_delete = []
+            freed = 0
+            for key, size in rows:
+                if freed >= excess:
+                    break
+                to_delete.append((key,))
+                freed += size
+            conn.executemany("DELETE FROM responses WHERE key = ?", to_delete)
+            conn.execute("UPDATE stats SET total = total - ? WHERE id = 0", (freed,))
+
+    def get_json(self, session, url: str, params: dict = None, ttl: int = None):
+        """
+        Devuelve el JSON de `url` + `params`, desde la caché si sigue vigente o
+        revalidándolo contra la API si ha caducado.
+        """
+        # La clave es la URL real, para no mezclar respuestas de otro servidor
+        full_url = normalize_url(resolve_url(url), params)
+        key = hashlib.sha1(full_url.encode()).hexdigest()
+        ttl = ttl_for(full_url) if ttl is None else ttl
+
+        row = self._lookup(key)
+        if row is not None:
+            body, etag, last_modified, stored_at = row
+            if time.time() - stored_at < ttl:
+                self._touch(key)
+                instrumentation.record_cache_hit(full_url)
+                return loads(body)
+            headers = {}
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+        else:
+            headers = {}
+
+        response = session.get(full_url, headers=headers)
+        if response.status_code == 304 and row is not None:
+            self._touch(key, revalidated=True)
+            return loads(row[0])
+        response.raise_for_status()
+        self._store(key, full_url, response)
+        return loads(response.content)
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM responses")
+            conn.execute("UPDATE stats SET total = 0 WHERE id = 0")
+
+
+_cache = None
+
+
+def get_cache() -> ResponseCache:
+    """
+    Instancia de la caché compartida por todo el proceso.
+    """
+    global _cache
+    if _cache is None:
+        _cache = ResponseCache()
+    return _cache
+
+
+def cached_get_json(url: str, params: dict = None, session=None, ttl: int = None):
+    if session is None:
+        session = get_session()
+    return get_cache().get_json(session, url, params, ttl)
@@ -0,0 +1,187 @@
+"""
+Instrumentación de las peticiones HTTP de los updaters.
+
+`MinkaSession` registra cada intento de petición (endpoint, bytes, latencia,
+errores) y la caché en disco registra sus aciertos. Los registros se agrupan
+por la etapa del pipeline activa (`with stage("main_metrics"): ...`) y por
+endpoint, y al final de la ejecución se vuelcan con `write_report` a un JSON
+junto a los CSV de datos.
+
+Las etapas son globales al proceso, no por hilo, para que las peticiones que
+lanzan los hilos del motor de conteos cuenten en la etapa que los lanzó.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from urllib.parse import urlsplit
+
+import numpy as np
+
+NO_STAGE = "sin_etapa"
+PERCENTILES = [50, 90, 99]
+
+_lock = threading.Lock()
+_stage = NO_STAGE
+_stages = {}
+_calls = defaultdict(
+    lambda: {
+        "calls": 0,
+        "bytes": 0,
+        "errors": 0,
+        "retries": 0,
+        "cache_hits": 0,
+        "latencies": [],
+    }
+)
+_started_at = datetime.now()
+
+
+def endpoint_for(url: str) -> str:
+    """
+    Nombre del endpoint de una URL: el path sin la versión de la API y con
+    los ids numéricos sustituidos, p. ej. `/observations/species_counts` o
+    `/taxa/{id}`. Las URLs que no son de la API llevan el host delante.
+    """
+    parts = urlsplit(url)
+    path = re.sub(r"/\d+(?=/|\.|$)", "/{id}", parts.path)
+    api_path = re.sub(r"^/v\d+(?=/|$)", "", path)
+    if api_path != path:
+        return api_path or "/"
+    return f"{parts.netloc}{path}"
+
+
+def record(
+    url: str,
+    status: int = None,
+    nbytes: int = 0,
+    elapsed: float = 0.0,
+    attempt: int = 0,
+):
+    """
+    Registra un intento de petición. Sin `status` (excepción de red) o con
+    un status >= 400 cuenta como error.
+    """
+    with _lock:
+        entry = _calls[(_stage, endpoint_for(url))]
+        entry["calls"] += 1
+        entry["bytes"] += nbytes
+        entry["latencies"].append(elapsed)
+        if status is None or status >= 400:
+            entry["errors"] += 1
+        if attempt > 0:
+            entry["retries"] += 1
+
+
+def record_cache_hit(url: str):
+    with _lock:
+        _calls[(_stage, endpoint_for(url))]["cache_hits"] += 1
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Marca una etapa del pipeline: las peticiones hechas dentro se agrupan bajo
+    `name` y se mide su tiempo total.
+    """
+    global _stage
+    with _lock:
+        previous, _stage = _stage, name
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        with _lock:
+            _stages[name] = _stages.get(name, 0.0) + elapsed
+            _stage = previous
+
+
+def _summary(entries: list) -> dict:
+    latencies = [lat for entry in entries for lat in entry["latencies"]]
+    summary = {
+        key: sum(entry[key] for entry in entries)
+        for key in ["calls", "bytes", "errors", "retries", "cache_hits"]
+    }
+    if latencies:
+        values = np.percentile(latencies, PERCENTILES) * 1000
+        summary["latency_ms"] = {
+            f"p{p}": round(float(v), 1) for p, v in zip(PERCENTILES, values)
+        }
+        summary["latency_ms"]["max"] = round(max(latencies) * 1000, 1)
+    return summary
+
+
+def report() -> dict:
+    """
+    Resumen de la ejecución: totales, y por etapa y endpoint las llamadas,
+    bytes, errores, reintentos, aciertos de caché y percentiles de latencia.
+    """
+    with _lock:
+        calls = {key: dict(entry) for key, entry in _calls.items()}
+        stages = dict(_stages)
+
+    by_stage = defaultdict(dict)
+    for (stage_name, endpoint), entry in calls.items():
+        by_stage[stage_name][endpoint] = entry
+    for stage_name in stages:
+        by_stage.setdefault(stage_name, {})
+
+    by_endpoint = defaultdict(list)
+    for (_, endpoint), entry in calls.items():
+        by_endpoint[endpoint].append(entry)
+
+    finished_at = datetime.now()
+    return {
+        "started_at": _started_at.isoformat(timespec="seconds"),
+        "finished_at": finished_at.isoformat(timespec="seconds"),
+        "duration_s": round((finished_at - _started_at).total_seconds(), 1),
+        "totals": _summary(list(calls.values())),
+        "stages": {
+            stage_name: {
+                "duration_s": round(stages.get(stage_name, 0.0), 1),
+                **_summary(list(endpoints.values())),
+                "endpoints": {
+                    endpoint: _summary([entry])
+                    for endpoint, entry in sorted(endpoints.items())
+                },
+            }
+            for stage_name, endpoints in by_stage.items()
+        },
+        "endpoints": {
+            endpoint: _summary(entries)
+            for endpoint, entries in sorted(by_endpoint.items())
+        },
+    }
+
+
+def write_report(path: str) -> dict:
+    """
+    Escribe el resumen de la ejecución en `path` (JSON) e imprime el tiempo y
+    las llamadas de cada etapa.
+    """
+    run_report = report()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(run_report, f, indent=2, ensure_ascii=False)
+
+    for stage_name, summary in run_report["stages"].items():
+        print(
+            f"{stage_name}: {summary['duration_s']} s, "
+            f"{summary['calls']} peticiones, {summary['errors']} errores"
+        )
+    return run_report
+
+
+def reset():
+    global _stage, _started_at
+    with _lock:
+        _stage = NO_STAGE
+        _stages.clear()
+        _calls.clear()
+        _started_at = datetime.now()
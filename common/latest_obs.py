@@ -0,0 +1,75 @@
+"""
+Vistas materializadas de "últimas observaciones" para las páginas de los
+dashboards.
+
+Los updaters las construyen una vez por ejecución a partir de las tablas de
+observaciones y fotos (unión, filtros y orden) y las guardan con un esquema
+fijo; las páginas sólo tienen que leerlas y paginar.
+"""
+
+import pandas as pd
+
+TAXONOMY = ["kingdom", "phylum", "class", "order", "family", "genus"]
+
+# Últimas observaciones con foto, de la más reciente a la más antigua
+LAST_OBS_COLUMNS = [
+    "id",
+    "user_login",
+    "user_rank",
+    "taxon_name",
+    "observed_on",
+    "quality_grade",
+    *TAXONOMY,
+    "photos_medium_url",
+]
+
+# Primera observación de cada especie, de la más reciente a la más antigua
+LAST_SPECIES_COLUMNS = [
+    "id",
+    "user_login",
+    "taxon_id",
+    "taxon_name",
+    "observed_on",
+    "observed_on_time",
+    "photos_medium_url",
+    "attribution",
+]
+
+
+def build_last_obs(
+    df_obs: pd.DataFrame,
+    df_photos: pd.DataFrame,
+    grade: str = "research",
+    exclude_logins: list = (),
+) -> pd.DataFrame:
+    """
+    Observaciones con foto (la primera de cada una) y grado `grade`, sin las
+    de `exclude_logins`, ordenadas por id descendente. `user_rank` numera las
+    observaciones de cada usuario desde la más reciente (0, 1, ...).
+    """
+    obs = df_obs[
+        (df_obs["quality_grade"] == grade)
+        & ~df_obs["user_login"].isin(list(exclude_logins))
+    ]
+    photos = df_photos.drop_duplicates(subset="id", keep="first")
+    view = obs.merge(photos[["id", "photos_medium_url"]], on="id")
+    view = view.sort_values(by="id", ascending=False).reset_index(drop=True)
+    view["user_rank"] = view.groupby(
+        "user_login", observed=True, dropna=False
+    ).cumcount()
+    return view.reindex(columns=LAST_OBS_COLUMNS)
+
+
+def build_last_species(df_obs: pd.DataFrame, df_photos: pd.DataFrame) -> pd.DataFrame:
+    """
+    Primera observación de cada especie con su foto, ordenadas de la especie
+    registrada más recientemente a la más antigua.
+    """
+    order = ["observed_on", "observed_on_time"]
+    species = df_obs[df_obs["taxon_rank"] == "species"].sort_values(by=order)
+    species = species.drop_duplicates(subset=["taxon_id"], keep="first")
+    species = species.sort_values(by=order, ascending=False)
+
+    photos = df_photos.drop_duplicates(subset=["id"], keep="first")
+    view = species.merge(photos[["id", "photos_medium_url", "attribution"]], on="id")
+    return view.reset_index(drop=True).reindex(columns=LAST_SPECIES_COLUMNS)
@@ -0,0 +1,59 @@
+"""
+Pertenencia de observaciones a proyectos o places sin descargarlas.
+
+Con `only_id=true` la API devuelve sólo los ids de las observaciones, lo que
+permite saber qué observaciones de una tabla ya descargada (p. ej. la del
+proyecto paraguas) pertenecen a cada subproyecto sin volver a descargarlas.
+"""
+
+import numpy as np
+import pandas as pd
+
+from common.client import API_PATH, get_session, loads
+
+# Con only_id la API admite páginas mucho más grandes; si devuelve menos, la
+# paginación por id_above sigue funcionando
+ID_PAGE = 10000
+
+
+def get_observation_ids(session=None, **params) -> np.ndarray:
+    """
+    Ids de todas las observaciones que cumplen `params`, en orden ascendente.
+    Pagina por `id_above` para no depender del límite de resultados.
+    """
+    if session is None:
+        session = get_session()
+    url = f"{API_PATH}/observations"
+    ids = []
+    last_id = 0
+    while True:
+        query = {
+            **params,
+            "only_id": "true",
+            "order_by": "id",
+            "order": "asc",
+            "id_above": last_id,
+            "per_page": ID_PAGE,
+        }
+        response = session.get(url, params=query)
+        response.raise_for_status()
+        results = loads(response.content)["results"]
+        if not results:
+            break
+        ids.extend(result["id"] for result in results)
+        last_id = results[-1]["id"]
+    return np.array(ids, dtype="int64")
+
+
+def split_by_membership(
+    df_obs: pd.DataFrame, df_photos: pd.DataFrame, ids: np.ndarray
+) -> tuple:
+    """
+    Observaciones y fotos de `df_obs` / `df_photos` cuyo id está en `ids`.
+    """
+    obs_mask = np.isin(df_obs["id"].to_numpy(dtype="int64"), ids)
+    photos_mask = np.isin(df_photos["id"].to_numpy(dtype="int64"), ids)
+    return (
+        df_obs[obs_mask].reset_index(drop=True),
+        df_photos[photos_mask].reset_index(drop=True),
+    )
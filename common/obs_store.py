@@ -0,0 +1,139 @@
+"""
+Tabla incremental de observaciones y fotos de un proyecto.
+
+Sustituye el patrón de leer los CSV completos, concatenar lo descargado y
+reescribirlos: las observaciones se insertan o sustituyen por `id` y sus
+fotos con ellas, las eliminadas (borradas o casual) quedan como tombstones y
+el estado de la sincronización (watermark de `updated_since` y tombstones)
+se guarda en un JSON junto a la tabla. Los ficheros sólo se reescriben, una
+vez por sincronización, si algo ha cambiado.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from common.storage import read_table, typed, write_table
+
+
+class ObsStore:
+    """
+    Observaciones (`obs_path`) y fotos (`photos_path`) de un proyecto, con
+    clave `id` de observación. Las fotos se enlazan por su columna `id`; sin
+    `photos_path` no se guardan.
+    """
+
+    def __init__(self, obs_path: str, photos_path: str = None):
+        self.obs_path = obs_path
+        self.photos_path = photos_path
+        self.state_path = f"{os.path.splitext(obs_path)[0]}_sync.json"
+
+        self.df_obs = self._read(obs_path, ["id"])
+        self.df_photos = (
+            self._read(photos_path, ["id", "photos_id"])
+            if photos_path
+            else pd.DataFrame(columns=["id", "photos_id"])
+        )
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            state = {}
+        self.watermark = state.get("watermark")
+        self.tombstones = set(state.get("tombstones", []))
+        self.changed = False
+
+    @staticmethod
+    def _read(path: str, columns: list) -> pd.DataFrame:
+        try:
+            return read_table(path)
+        except (FileNotFoundError, pd.errors.EmptyDataError):
+            return pd.DataFrame(columns=columns)
+
+    def __len__(self) -> int:
+        return len(self.df_obs)
+
+    def max_id(self) -> int:
+        """
+        Mayor id conocido, contando los eliminados, para pedir sólo las
+        observaciones nuevas (`id_above`) sin recuperar las eliminadas.
+        """
+        ids = [int(self.df_obs["id"].max())] if len(self.df_obs) else []
+        return max(ids + list(self.tombstones) + [0])
+
+    def upsert(self, df_obs: pd.DataFrame, df_photos: pd.DataFrame = None):
+        """
+        Inserta o sustituye las observaciones de `df_obs` y, si se pasan, sus
+        fotos. Una observación eliminada que vuelve deja de ser tombstone.
+        """
+        if df_obs is None or len(df_obs) == 0:
+            return
+        # Mismos tipos que la tabla guardada (fechas en hora local sin zona)
+        df_obs = typed(df_obs)
+        ids = df_obs["id"].to_numpy(dtype="int64")
+        keep = ~np.isin(self.df_obs["id"].to_numpy(dtype="int64"), ids)
+        self.df_obs = pd.concat([self.df_obs[keep], df_obs], ignore_index=True)
+        if df_photos is not None:
+            keep = ~np.isin(self.df_photos["id"].to_numpy(dtype="int64"), ids)
+            self.df_photos = pd.concat(
+                [self.df_photos[keep], df_photos], ignore_index=True
+            )
+        self.tombstones.difference_update(ids.tolist())
+        self.changed = True
+
+    def remove(self, ids):
+        """
+        Elimina las observaciones `ids` y sus fotos y las guarda como tombstones.
+        """
+        ids = np.asarray(list(ids), dtype="int64")
+        if len(ids) == 0:
+            return
+        drop = np.isin(self.df_obs["id"].to_numpy(dtype="int64"), ids)
+        if drop.any():
+            self.df_obs = self.df_obs[~drop].reset_index(drop=True)
+            drop = np.isin(self.df_photos["id"].to_numpy(dtype="int64"), ids)
+            self.df_photos = self.df_photos[~drop].reset_index(drop=True)
+            self.changed = True
+        self.tombstones.update(ids.tolist())
+
+    def replace(self, df_obs: pd.DataFrame, df_photos: pd.DataFrame = None):
+        """
+        Sustituye la tabla completa (descarga completa del proyecto).
+        """
+        self.df_obs = typed(df_obs).reset_index(drop=True)
+        if df_photos is not None:
+            self.df_photos = df_photos.reset_index(drop=True)
+        else:
+            self.df_photos = self.df_photos.iloc[0:0]
+        self.tombstones = set()
+        self.changed = True
+
+    def save(self, watermark: str = None) -> bool:
+        """
+        Escribe la tabla si ha cambiado y el estado de la sincronización. El
+        `watermark` es la fecha desde la que pedir cambios la próxima vez.
+        Devuelve si se ha reescrito la tabla.
+        """
+        written = self.changed
+        if self.changed:
+            self.df_obs = self.df_obs.sort_values(by="id", ascending=False)
+            self.df_photos = self.df_photos.sort_values(by="photos_id", ascending=False)
+            write_table(self.df_obs, self.obs_path)
+            if self.photos_path:
+                write_table(self.df_photos, self.photos_path)
+            self.changed = False
+        if watermark is not None:
+            self.watermark = watermark
+
+        state = {
+            "watermark": self.watermark,
+            "observations": len(self.df_obs),
+            "tombstones": sorted(self.tombstones),
+        }
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp_path, self.state_path)
+        return written
@@ -0,0 +1,72 @@
+"""
+Métricas de proyecto que comparten todos los dashboards: totales del
+proyecto, totales hasta hace unos días y totales por subproyecto.
+
+Todas las consultas pasan por el motor de conteos (`common.counts`), que usa
+la sesión compartida del proceso y la caché en disco.
+"""
+
+import datetime
+
+import pandas as pd
+
+from common.counts import count_job, counts_wide, get_counts
+
+MAIN_ENDPOINTS = ["species", "observers", "observations"]
+
+# Nombres de columna de las tablas de los dashboards
+COLUMN_NAMES = {
+    "species": "espècies",
+    "observers": "participants",
+    "observations": "observacions",
+    "identifiers": "identificadors",
+}
+
+
+def get_project_totals(
+    proj_id, endpoints: list = MAIN_ENDPOINTS, session=None, **params
+) -> dict:
+    """
+    Devuelve un dict endpoint -> total_results para el proyecto.
+    """
+    jobs = [count_job(e, {"project_id": proj_id, **params}) for e in endpoints]
+    df_counts = get_counts(jobs, session=session, cache=True)
+    return dict(zip(df_counts["endpoint"], df_counts["total_results"]))
+
+
+def get_previous_totals(
+    proj_id,
+    days: int = 7,
+    endpoints: list = MAIN_ENDPOINTS,
+    created: bool = False,
+    session=None,
+) -> dict:
+    """
+    Totales del proyecto hace `days` días, para calcular los incrementos.
+
+    Por defecto cuenta lo observado hasta esa fecha (`d2`); con `created=True`
+    cuenta lo subido desde esa fecha (`created_d1`).
+    """
+    date = (datetime.datetime.today() - datetime.timedelta(days=days)).strftime(
+        "%Y-%m-%d"
+    )
+    params = {"created_d1": date} if created else {"d2": date}
+    return get_project_totals(proj_id, endpoints, session=session, **params)
+
+
+def get_projects_totals(
+    projects: dict, key: str = "project", endpoints: list = MAIN_ENDPOINTS, **params
+) -> pd.DataFrame:
+    """
+    Totales de varios proyectos `{proj_id: nombre}`: un df con una fila por
+    proyecto (columna `key` con el nombre) y una columna por endpoint, con los
+    nombres de `COLUMN_NAMES`.
+    """
+    jobs = [
+        count_job(e, {"project_id": proj_id, **params}, **{key: name})
+        for proj_id, name in projects.items()
+        for e in endpoints
+    ]
+    df_totals = counts_wide(get_counts(jobs, cache=True), index=key)
+    df_totals = df_totals.rename(columns=COLUMN_NAMES)
+    return df_totals[[key] + [COLUMN_NAMES[e] for e in endpoints]]
@@ -0,0 +1,125 @@
+"""
+Snapshots versionados de la carpeta `data` de un dashboard.
+
+Los updaters escriben en `data/` mientras trabajan y, al acabar, publican una
+copia completa en `data/snapshots/{versión}`; el fichero `data/snapshots/CURRENT`
+apunta a la versión publicada y se sustituye de forma atómica. Las apps leen
+siempre del snapshot publicado, así que nunca ven un fichero a medio escribir
+ni mezclan un df_obs nuevo con un df_photos antiguo, y pueden usar la versión
+como clave de caché: si no ha cambiado, no hace falta recargar nada.
+
+Los ficheros que no han cambiado desde el snapshot anterior se enlazan (hard
+link) en vez de copiarse, y si no ha cambiado ninguno no se publica versión
+nueva. Se conservan las últimas `KEEP` versiones para los lectores que aún
+estén usando una anterior.
+"""
+
+import os
+import shutil
+from datetime import datetime
+
+SNAPSHOTS = "snapshots"
+CURRENT = "CURRENT"
+KEEP = 3
+# Estado interno de los updaters, que las apps no leen y cambia en cada ejecución
+PRIVATE = ("run_report.json", "_sync.json", ".tmp")
+
+
+def current_version(data_dir: str):
+    """
+    Versión publicada de `data_dir`, o None si aún no hay ningún snapshot.
+    """
+    try:
+        with open(os.path.join(data_dir, SNAPSHOTS, CURRENT)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def data_path(data_dir: str, name: str, version: str = None) -> str:
+    """
+    Ruta de `name` en el snapshot `version` (por defecto, el publicado). Sin
+    snapshots devuelve la ruta en `data_dir`, como antes.
+    """
+    version = version or current_version(data_dir)
+    if version is None:
+        return os.path.join(data_dir, name)
+    return os.path.join(data_dir, SNAPSHOTS, version, name)
+
+
+def _data_files(data_dir: str) -> list:
+    # Ficheros de datos, en rutas relativas; sin los snapshots ni el estado
+    files = []
+    for root, dirs, names in os.walk(data_dir):
+        if root == data_dir:
+            dirs[:] = [d for d in dirs if d != SNAPSHOTS]
+        for name in names:
+            if not name.endswith(PRIVATE):
+                files.append(os.path.relpath(os.path.join(root, name), data_dir))
+    return sorted(files)
+
+
+def _unchanged(src: str, previous: str) -> bool:
+    try:
+        a, b = os.stat(src), os.stat(previous)
+    except FileNotFoundError:
+        return False
+    return a.st_size == b.st_size and a.st_mtime_ns == b.st_mtime_ns
+
+
+def publish(data_dir: str, keep: int = KEEP) -> str:
+    """
+    Publica el contenido actual de `data_dir` como un snapshot nuevo y
+    devuelve su versión (o la publicada, si nada ha cambiado).
+    """
+    snapshots_dir = os.path.join(data_dir, SNAPSHOTS)
+    os.makedirs(snapshots_dir, exist_ok=True)
+    previous = current_version(data_dir)
+    previous_dir = os.path.join(snapshots_dir, previous) if previous else None
+
+    files = _data_files(data_dir)
+    if previous_dir is not None:
+        unchanged = [
+            _unchanged(os.path.join(data_dir, f), os.path.join(previous_dir, f))
+            for f in files
+        ]
+        if all(unchanged) and len(files) == len(_data_files(previous_dir)):
+            print(f"Datos sin cambios, se mantiene el snapshot {previous}")
+            return previous
+    else:
+        unchanged = [False] * len(files)
+
+    version = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    tmp_dir = os.path.join(snapshots_dir, f"{version}.tmp")
+    for name, same in zip(files, unchanged):
+        src = os.path.join(data_dir, name)
+        dst = os.path.join(tmp_dir, name)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        if same:
+            os.link(os.path.join(previous_dir, name), dst)
+        else:
+            # copy2 conserva el mtime, que es lo que se compara la próxima vez
+            shutil.copy2(src, dst)
+    os.makedirs(tmp_dir, exist_ok=True)
+    os.rename(tmp_dir, os.path.join(snapshots_dir, version))
+
+    # Cambio de versión atómico para los lectores
+    pointer = os.path.join(snapshots_dir, CURRENT)
+    with open(f"{pointer}.tmp", "w") as f:
+        f.write(version)
+    os.replace(f"{pointer}.tmp", pointer)
+    print(f"Publicado el snapshot {version}")
+
+    _prune(snapshots_dir, version, keep)
+    return version
+
+
+def _prune(snapshots_dir: str, current: str, keep: int):
+    versions = sorted(
+        d
+        for d in os.listdir(snapshots_dir)
+        if os.path.isdir(os.path.join(snapshots_dir, d))
+    )
+    old = [v for v in versions if v != current]
+    for version in old[: max(0, len(versions) - keep)]:
+        shutil.rmtree(os.path.join(snapshots_dir, version), ignore_errors=True)
@@ -0,0 +1,103 @@
+"""
+Almacenamiento tipado de las tablas de observaciones y fotos.
+
+Los updaters guardan cada tabla dos veces: un Parquet con tipos (fechas como
+timestamps, logins y rangos como categorías) que es lo que leen los
+dashboards, y el CSV de siempre, que es lo que se ofrece en los botones de
+descarga. Si pyarrow no está instalado sólo se escribe el CSV y la lectura
+aplica los tipos sobre el CSV.
+"""
+
+import os
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+
+    HAS_PARQUET = True
+except ImportError:
+    HAS_PARQUET = False
+
+TIMEZONE = "Europe/Madrid"
+
+# Fechas con hora: se pasan a hora local sin zona, como las compara el código
+# de los dashboards con fechas naive
+DATETIME_COLUMNS = ["created_at", "updated_at"]
+DATE_COLUMNS = ["observed_on"]
+CATEGORY_COLUMNS = [
+    "user_login",
+    "user_name",
+    "taxon_rank",
+    "quality_grade",
+    "iconic_taxon",
+    "iconic_taxon_name",
+    "license_obs",
+    "kingdom",
+    "phylum",
+    "class",
+    "order",
+    "family",
+    "genus",
+    "place_name",
+    "address",
+]
+
+
+def parquet_path(path: str) -> str:
+    return f"{os.path.splitext(path)[0]}.parquet"
+
+
+def is_naive_datetime(values: pd.Series) -> bool:
+    return pd.api.types.is_datetime64_dtype(values) and values.dt.tz is None
+
+
+def typed(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Aplica los tipos de las tablas de observaciones a las columnas presentes.
+    """
+    df = df.copy()
+    for col in DATETIME_COLUMNS:
+        if col in df.columns and not is_naive_datetime(df[col]):
+            values = pd.to_datetime(df[col], utc=True, errors="coerce", format="mixed")
+            df[col] = values.dt.tz_convert(TIMEZONE).dt.tz_localize(None)
+    for col in DATE_COLUMNS:
+        if col in df.columns and not pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = pd.to_datetime(df[col], errors="coerce", format="mixed")
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    return df
+
+
+def write_table(df: pd.DataFrame, path: str, csv: bool = True):
+    """
+    Guarda `df` como Parquet tipado junto a `path` y, con `csv=True`, también
+    como CSV en `path`.
+    """
+    # El CSV va primero: read_table descarta el Parquet si es más antiguo
+    if csv or not HAS_PARQUET:
+        df.to_csv(path, index=False)
+    if HAS_PARQUET:
+        tmp_path = f"{parquet_path(path)}.tmp"
+        typed(df).to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, parquet_path(path))
+
+
+def read_table(path: str, columns: list = None) -> pd.DataFrame:
+    """
+    Lee la tabla de `path` con tipos. Usa el Parquet si existe y no es más
+    antiguo que el CSV (que puede haberse escrito a mano); si no, el CSV.
+    Con `columns` sólo se leen esas columnas.
+    """
+    pq_path = parquet_path(path)
+    if (
+        HAS_PARQUET
+        and os.path.exists(pq_path)
+        and (
+            not os.path.exists(path)
+            or os.path.getmtime(pq_path) >= os.path.getmtime(path)
+        )
+    ):
+        return pd.read_parquet(pq_path, columns=columns)
+    return typed(pd.read_csv(path, usecols=columns))
@@ -0,0 +1,32 @@
+"""
+Consulta de taxones por lotes.
+
+`/taxa/{ids}` admite varios ids separados por comas, así que los nombres de
+cientos de taxones salen con unas pocas peticiones. Las respuestas pasan por la
+caché HTTP compartida, donde `/taxa` dura una semana.
+"""
+
+import pandas as pd
+
+from common.client import API_PATH
+from common.http_cache import cached_get_json
+
+# Ids por petición
+TAXA_BATCH = 30
+
+
+def get_taxon_names(taxon_ids, session=None) -> dict:
+    """
+    Nombre de cada taxón de `taxon_ids` (sin repetir ni nulos), como
+    {taxon_id: nombre}. Los que no existen no aparecen.
+    """
+    ids = sorted({int(taxon_id) for taxon_id in taxon_ids if pd.notna(taxon_id)})
+    names = {}
+    for start in range(0, len(ids), TAXA_BATCH):
+        batch = ",".join(str(taxon_id) for taxon_id in ids[start : start + TAXA_BATCH])
+        data = cached_get_json(
+            f"{API_PATH}/taxa/{batch}", {"per_page": TAXA_BATCH}, session=session
+        )
+        for result in data["results"]:
+            names[result["id"]] = result["name"]
+    return names
@@ -7,6 +7,8 @@ import pandas as pd
 import plotly.express as px
 import requests
 import streamlit as st
+from data_cache import file_version, load_obs_cube
+from obs_cube import CUBE_FILE, EMBIMOS_USERS, cumulative_daily, period_total, rollup
 
 try:
     directory = f"{os.environ['DASHBOARDS']}/internal-analytics"
@@ -25,30 +27,8 @@ st.set_page_config(
 API_PATH = "https://api.minka-sdg.org/v1"
 CATALUNYA_PLACE = 374
 
-EXCLUDE_USERS = [
-    "xasalva",
-    "bertinhaco",
-    "jaume-piera",
-    "sonialinan",
-    "adrisoacha",
-    "irodero",
-    "anomalia",
-    "aluna",
-    "carlosrodero",
-    "lydia",
-    "elibonfill",
-    "marinatorresgi",
-    "meri",
-    "verificador_1",
-    "loreto_rodriguez",
-    "minkatutor",
-    "minkatest",
-    "anonimousminkacontributor",
-    "minkauser10",
-    "test_minka_athens",
-    "infominka",
-    "admin",
-]
+# Cuentas EMBIMOS, las mismas con las que se construye el cubo
+EXCLUDE_USERS = EMBIMOS_USERS
 
 
 def check_password():
@@ -82,40 +62,9 @@ def convert_df(df):
     return df.to_csv(index=False).encode("utf-8")
 
 
-@st.cache_data(ttl=360)
-def create_obs_year_df(df_obs):
-    # Convertir la columna de fecha a datetime
-    df_obs["created_at"] = pd.to_datetime(df_obs["created_at"])
-    df_obs["embimos"] = df_obs["user_login"].isin(EXCLUDE_USERS)
-
-    # Extraer el año
-    df_obs["year"] = df_obs["created_at"].dt.year
-
-    # Agrupar por año y calcular los KPIs adicionales
-    df_obs_year = (
-        df_obs.groupby("year")
-        .agg(
-            total_observations=("created_at", "size"),
-            research_quality=("quality_grade", lambda x: (x == "research").sum()),
-            in_catalunya=(
-                "catalunya",
-                lambda x: x.sum(),
-            ),  # Asume que es booleano (True/False)
-            out_catalunya=(
-                "catalunya",
-                lambda x: (~x).sum(),
-            ),  # Contar False como fuera de Cataluña
-            web=("device", lambda x: (x == "web").sum()),  # Contar "web"
-            app=("device", lambda x: (x == "app").sum()),  # Contar "app"
-            observers=("user_id", "nunique"),
-            embimos=("embimos", lambda x: (x).sum()),  # Contar True
-            not_embimos=("embimos", lambda x: (~x).sum()),  # Contar False
-        )
-        .reset_index()
-    )
-
-    # Mostrar resultado
-    return df_obs_year
+def create_obs_year_df(cube, month_users):
+    # KPIs por año a partir del cubo
+    return rollup(cube, month_users, period="year")
 
 
 def get_identifiers_by_period(period):
@@ -150,93 +99,14 @@ def get_identifiers_by_period(period):
         return None
 
 
-@st.cache_data(ttl=360)
-def create_obs_year_month_df(df_obs):
-
-    # Convertir la columna de fecha a datetime
-    df_obs["created_at"] = pd.to_datetime(df_obs["created_at"])
-    df_obs["embimos"] = df_obs["user_login"].isin(EXCLUDE_USERS)
-
-    # Extraer el año y el mes
-    df_obs["year"] = df_obs["created_at"].dt.year
-    df_obs["month"] = df_obs["created_at"].dt.month
-
-    # Agrupar por año y mes, calculando los KPIs
-    df_obs_year_month = (
-        df_obs.groupby(["year", "month"])
-        .agg(
-            total_observations=("created_at", "size"),
-            research_quality=("quality_grade", lambda x: (x == "research").sum()),
-            in_catalunya=("catalunya", lambda x: x.sum()),  # Contar True
-            out_catalunya=("catalunya", lambda x: (~x).sum()),  # Contar False
-            web=("device", lambda x: (x == "web").sum()),  # Contar "web"
-            app=("device", lambda x: (x == "app").sum()),  # Contar "app"
-            observers=("user_id", "nunique"),
-            embimos=("embimos", lambda x: (x).sum()),  # Contar True
-            not_embimos=("embimos", lambda x: (~x).sum()),  # Contar False
-        )
-        .reset_index()
-    )
+def create_obs_year_month_df(cube, month_users):
+    # KPIs por año y mes a partir del cubo
+    return rollup(cube, month_users, period="month")
 
-    # Mostrar resultado
-    return df_obs_year_month
-
-
-@st.cache_data(ttl=360)
-def create_obs_daily_df(df_obs):
-    # Convertir la columna de fecha a datetime
-    df_obs["created_at"] = pd.to_datetime(df_obs["created_at"])
-    df_obs["embimos"] = df_obs["user_login"].isin(EXCLUDE_USERS)
-
-    # Extraer la fecha sin la hora
-    df_obs["date"] = df_obs["created_at"].dt.date
-
-    # Agrupar por fecha y calcular los valores diarios
-    df_daily = (
-        df_obs.groupby("date")
-        .agg(
-            daily_total=("created_at", "size"),
-            daily_research=("quality_grade", lambda x: (x == "research").sum()),
-            daily_catalonia=("catalunya", lambda x: x.sum()),  # Contar True
-            daily_outside_catalonia=("catalunya", lambda x: (~x).sum()),  # Contar False
-            daily_web=("device", lambda x: (x == "web").sum()),  # Contar "web"
-            daily_app=("device", lambda x: (x == "app").sum()),  # Contar "app"
-            daily_users=("user_id", lambda x: set(x)),
-            daily_embimos=("embimos", lambda x: (x).sum()),  # Contar True
-            daily_not_embimos=("embimos", lambda x: (~x).sum()),  # Contar False
-        )
-        .reset_index()
-    )
 
-    # Calcular los valores acumulativos
-    df_daily["cumulative_total"] = df_daily["daily_total"].cumsum()
-    df_daily["cumulative_research"] = df_daily["daily_research"].cumsum()
-    df_daily["cumulative_catalonia"] = df_daily["daily_catalonia"].cumsum()
-    df_daily["cumulative_outside_catalonia"] = df_daily[
-        "daily_outside_catalonia"
-    ].cumsum()
-    df_daily["cumulative_web"] = df_daily["daily_web"].cumsum()
-    df_daily["cumulative_app"] = df_daily["daily_app"].cumsum()
-    df_daily["cumulative_embimos"] = df_daily["daily_embimos"].cumsum()
-    df_daily["cumulative_not_embimos"] = df_daily["daily_not_embimos"].cumsum()
-
-    # Seleccionar las columnas finales
-    df_cumulative = df_daily[
-        [
-            "date",
-            "cumulative_total",
-            "cumulative_research",
-            "cumulative_catalonia",
-            "cumulative_outside_catalonia",
-            "cumulative_web",
-            "cumulative_app",
-            "cumulative_embimos",
-            "cumulative_not_embimos",
-        ]
-    ].copy()
-
-    # Mostrar resultado
-    return df_cumulative
+def create_obs_daily_df(cube):
+    # Valores acumulados día a día a partir del cubo
+    return cumulative_daily(cube)
 
 
 def create_radio_selector(key):
@@ -649,30 +519,17 @@ def create_daily_line_chart(df, key, visualization_type):
     )
 
 
-def compare_total_observations(df_obs, days=30):
-    # Asegúrate de que 'created_at' sea datetime
-    df_obs["created_at"] = pd.to_datetime(df_obs["created_at"])
-
-    # Filtra el rango de fechas para el periodo actual
-    end_date = df_obs["created_at"].max()
-    start_date = end_date - pd.Timedelta(days=days)
-    current_period = df_obs[
-        (df_obs["created_at"] >= start_date) & (df_obs["created_at"] <= end_date)
-    ]
+def compare_total_observations(cube, days=30):
+    # Periodo actual: los `days` días completos hasta el último día con
+    # observaciones (el cubo es diario, así que no se cortan días por la hora)
+    end_date = cube["date"].max()
+    start_date = end_date - pd.Timedelta(days=days - 1)
+    total_current = period_total(cube, start_date, end_date)
 
-    # Calcula el total de observaciones para el periodo actual
-    total_current = len(current_period)
-
-    # Mismo periodo pero del año pasado
-    start_date_last_year = start_date - pd.DateOffset(years=1)
+    # Mismo número de días, acabando el mismo día del año pasado
     end_date_last_year = end_date - pd.DateOffset(years=1)
-    last_year_period = df_obs[
-        (df_obs["created_at"] >= start_date_last_year)
-        & (df_obs["created_at"] <= end_date_last_year)
-    ]
-
-    # Calcula el total de observaciones para el periodo del año pasado
-    total_last_year = len(last_year_period)
+    start_date_last_year = end_date_last_year - pd.Timedelta(days=days - 1)
+    total_last_year = period_total(cube, start_date_last_year, end_date_last_year)
 
     # Resultados
     return {
@@ -687,9 +544,10 @@ def compare_total_observations(df_obs, days=30):
     }
 
 
-def create_comparative_lines(visualization_type="Total observations"):
-    # Asegurar que el DataFrame está en session_state
-    df = st.session_state.df_obs_year_month.copy()
+def create_comparative_lines(
+    df_obs_year_month, visualization_type="Total observations"
+):
+    df = df_obs_year_month.copy()
 
     # Convertir "date" a datetime si no lo está
     df["date"] = pd.to_datetime(df["date"])
@@ -775,12 +633,8 @@ if __name__ == "__main__":
     if not check_password():
         st.stop()  # Do not continue if check_password is not True.
 
-    # Carga origen de datos
-    if "df_obs" not in st.session_state or st.session_state.df_obs is None:
-        df_obs = pd.read_csv(f"{directory}/data/minka_obs.csv")
-        # Eliminar observaciones importadas
-        df_obs = df_obs[df_obs.imported == False].reset_index(drop=True)
-        st.session_state.df_obs = df_obs
+    # Cubo de KPIs de las observaciones (sin las importadas), compartido
+    cube, month_users = load_obs_cube(file_version(CUBE_FILE))
 
     # Selector de botones
     visualization_type = create_radio_selector("observations")
@@ -792,41 +646,29 @@ if __name__ == "__main__":
     col1, col2 = st.columns([3, 2])
     with col1:
         st.header("Total number of observations submitted per year")
-        if (
-            "df_obs_year" not in st.session_state
-            or st.session_state.df_obs_year is None
-        ):
-            st.session_state.df_obs_year = create_obs_year_df(st.session_state.df_obs)
-        create_yearly_bar_chart(st.session_state.df_obs_year, key1, visualization_type)
+        df_obs_year = create_obs_year_df(cube, month_users)
+        create_yearly_bar_chart(df_obs_year, key1, visualization_type)
 
     # Agrupación mensual
     key2 = "obs_by_year_month"
     col1, col2 = st.columns([6, 2])
     with col1:
         st.header("Total number of observations submitted per month")
-        if (
-            "df_obs_year_month" not in st.session_state
-            or st.session_state.df_obs_year_month is None
-        ):
-            st.session_state.df_obs_year_month = create_obs_year_month_df(
-                st.session_state.df_obs
-            )
-        create_monthly_line_chart(
-            st.session_state.df_obs_year_month, key2, visualization_type
-        )
+        df_obs_year_month = create_obs_year_month_df(cube, month_users)
+        create_monthly_line_chart(df_obs_year_month, key2, visualization_type)
 
     # Evolución diaria
     key3 = "cumulative_obs_by_day"
     st.header("Cumulative number of observations submitted by day")
     col1, col2 = st.columns([6, 2])
     with col1:
-        df_ob_daily = create_obs_daily_df(st.session_state.df_obs)
+        df_ob_daily = create_obs_daily_df(cube)
         print(df_ob_daily.columns)
         create_daily_line_chart(df_ob_daily, key3, visualization_type)
 
     # Comparación meses de distintos años
     st.header("Comparative of monthly observations between years")
-    create_comparative_lines(visualization_type)
+    create_comparative_lines(df_obs_year_month, visualization_type)
 
     # Comparación de periodos
     st.header("Compare current period with same period of last year")
@@ -835,7 +677,7 @@ if __name__ == "__main__":
         options=[1] + list(range(10, 30, 10)) + list(range(30, 361, 10)),
         value=30,
     )
-    results = compare_total_observations(st.session_state.df_obs, days=num_days)
+    results = compare_total_observations(cube, days=num_days)
     st.markdown(f"**Period compared**:")
     st.markdown(
         f"{results['start_date']} to {results['end_date']} || {results['start_date_last_year']} to {results['end_date_last_year']}"
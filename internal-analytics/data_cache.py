@@ -0,0 +1,150 @@
+"""
+Datasets compartidos por todas las sesiones del dashboard.
+
+Se cargan una vez por proceso con `st.cache_resource`, que no copia el
+resultado para cada sesión como `st.session_state` o `st.cache_data`, con tipos
+compactos y las columnas derivadas ya calculadas. Son de sólo lectura: las
+páginas filtran o agregan sobre ellos, pero no les añaden ni modifican columnas.
+
+La clave de caché incluye la versión (mtime) del fichero, así que se recargan
+cuando los scripts de descarga lo reescriben; `max_entries` descarta la
+versión anterior.
+"""
+
+import os
+import sys
+
+import pandas as pd
+import streamlit as st
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.append_table import AppendTable
+from common.storage import parquet_path, read_table
+from identifier_stats import read_identifiers_by_period, read_user_months
+from obs_cube import read_cube
+
+try:
+    directory = f"{os.environ['DASHBOARDS']}/internal-analytics"
+except KeyError:
+    print(
+        "Configura la variable de entorno DASHBOARDS en .bashrc apuntando al directorio de los dashboards."
+    )
+
+# Columnas de minka_obs que usan las páginas
+OBS_COLUMNS = [
+    "created_at",
+    "user_id",
+    "user_login",
+    "quality_grade",
+    "device",
+    "catalunya",
+    "imported",
+]
+
+
+def file_version(name: str):
+    """
+    Versión de `data/{name}`: el mtime más reciente del CSV o su Parquet.
+    """
+    path = f"{directory}/data/{name}"
+    mtimes = [
+        os.path.getmtime(p) for p in (path, parquet_path(path)) if os.path.exists(p)
+    ]
+    return max(mtimes, default=None)
+
+
+def _add_dates(df: pd.DataFrame, column: str = "created_at") -> pd.DataFrame:
+    # Año, mes, trimestre y día de `column`, con enteros pequeños
+    df[column] = pd.to_datetime(df[column])
+    df["year"] = df[column].dt.year.astype("int16")
+    df["month"] = df[column].dt.month.astype("int8")
+    df["quarter"] = df[column].dt.quarter.astype("int8")
+    df["date"] = df[column].dt.normalize()
+    return df
+
+
+@st.cache_resource(max_entries=2, show_spinner="Loading observations...")
+def load_obs(version, embimos_users: tuple, exclude_embimos: bool = False):
+    """
+    Observaciones no importadas de minka_obs, con la columna `embimos` (si el
+    autor está en `embimos_users`) y las fechas derivadas de `created_at`. Con
+    `exclude_embimos` sólo las del resto de usuarios.
+    """
+    df = read_table(f"{directory}/data/minka_obs.csv", columns=OBS_COLUMNS)
+    df = df[df["imported"] == False].drop(columns="imported")
+    embimos = df["user_login"].isin(embimos_users)
+    if exclude_embimos:
+        df = df[~embimos]
+        embimos = embimos[~embimos]
+    df = df.reset_index(drop=True)
+    df["embimos"] = embimos.to_numpy()
+
+    df["user_id"] = pd.to_numeric(df["user_id"], downcast="integer")
+    df["catalunya"] = df["catalunya"].astype(bool)
+    for col in ["user_login", "quality_grade", "device"]:
+        df[col] = df[col].astype("category")
+    return _add_dates(df)
+
+
+@st.cache_resource(max_entries=1)
+def load_obs_cube(version):
+    """
+    Cubo de KPIs de observaciones y pares mes × usuario (ver obs_cube).
+    """
+    return read_cube(directory)
+
+
+def identifications_table() -> AppendTable:
+    # Tabla append-only de download_identifications
+    return AppendTable(f"{directory}/data/minka_identifications")
+
+
+@st.cache_resource(max_entries=1, show_spinner="Loading identifications...")
+def load_identifications(version):
+    """
+    Identificaciones (id, usuario y fecha en UTC), ordenadas por id.
+    """
+    columns = ["id", "user.id", "user.login", "created_at"]
+    df = identifications_table().read(columns=columns)
+    df["created_at"] = pd.to_datetime(df["created_at"], utc=True)
+    df["user.login"] = df["user.login"].astype("category")
+    return df.sort_values(by="id").reset_index(drop=True)
+
+
+@st.cache_resource(max_entries=1)
+def load_identifiers_by_period(version):
+    """
+    Identificadores distintos por año y mes (ver identifier_stats).
+    """
+    return read_identifiers_by_period(directory)
+
+
+@st.cache_resource(max_entries=1)
+def load_user_months(version):
+    """
+    Matriz usuario × mes de identificaciones, indexada por login en orden
+    alfabético (ver identifier_stats).
+    """
+    return read_user_months(directory)
+
+
+@st.cache_resource(max_entries=1)
+def load_accounts(version):
+    """
+    Cuentas de minka_accounts.
+    """
+    df = pd.read_csv(f"{directory}/data/minka_accounts.csv")
+    df["created_at"] = pd.to_datetime(df["created_at"])
+    return df
+
+
+@st.cache_resource(max_entries=1)
+def load_projects(version, embimos_users: tuple):
+    """
+    Proyectos de minka_projects, con la columna `embimos` (si el administrador
+    está en `embimos_users`) y las fechas derivadas de `created_at`.
+    """
+    df = pd.read_csv(f"{directory}/data/minka_projects.csv")
+    df["last_observation"] = pd.to_datetime(df["last_observation"])
+    df["embimos"] = df["admin"].isin(embimos_users)
+    return _add_dates(df)
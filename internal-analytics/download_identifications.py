@@ -1,11 +1,23 @@
-import ast
-import math
 import os
+import sys
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import pandas as pd
 import requests
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from common.append_table import AppendTable
+from common.client import MinkaSession, loads
+from common.taxa import get_taxon_names
+from identifier_stats import (
+    PERIODS_FILE,
+    build_identifiers_by_period,
+    build_user_months,
+    save_user_months,
+)
+
 API_PATH = "https://api.minka-sdg.org/v1"
 EXCLUDE_USERS = [
     "xasalva",
@@ -32,7 +44,24 @@ EXCLUDE_USERS = [
     "admin",
 ]
 
-session = requests.Session()
+IDENT_COLUMNS = [
+    "id",
+    "user.id",
+    "user.login",
+    "created_at",
+    "taxon_id",
+    "taxon.ancestor_ids",
+    "observation.id",
+]
+# Primer id que se descarga (la descarga empezaba en el lote 6)
+first_id = 50001
+# Rangos de ids que se descargan en paralelo, cada uno por páginas
+batch_size = 10000
+page_max = 200
+max_workers = 8
+page_retries = 3
+
+session = MinkaSession()
 
 
 try:
@@ -43,76 +72,105 @@ except KeyError:
     )
 
 
+def identifications_table() -> AppendTable:
+    return AppendTable(
+        f"{directory}/data/minka_identifications", list_columns=["taxon.ancestor_ids"]
+    )
+
+
+def _get_page(params: dict) -> list:
+    # Reintenta la página si falla, en vez de saltársela
+    url = f"{API_PATH}/identifications"
+    for attempt in range(page_retries):
+        try:
+            response = session.get(url, params=params)
+            response.raise_for_status()
+            return loads(response.content)["results"]
+        except (requests.RequestException, ValueError, KeyError) as e:
+            if attempt == page_retries - 1:
+                raise
+            print(f"Error en {params}: {e}, reintentando...")
+            time.sleep(2 * (attempt + 1))
+
+
+def download_batch(start: int, end: int) -> pd.DataFrame:
+    """
+    Identificaciones (en observaciones de otros) con id en `[start, end)`, sin
+    las de los usuarios excluidos. Pagina por `id_above`.
+    """
+    frames = []
+    last_id = start - 1
+    while True:
+        params = {
+            "own_observation": "false",
+            "id_above": last_id,
+            "id_below": end,
+            "order_by": "id",
+            "order": "asc",
+            "per_page": page_max,
+        }
+        results = _get_page(params)
+        if not results:
+            break
+        frames.append(pd.json_normalize(results).reindex(columns=IDENT_COLUMNS))
+        last_id = results[-1]["id"]
+
+    if not frames:
+        return pd.DataFrame(columns=IDENT_COLUMNS)
+    df = pd.concat(frames, ignore_index=True)
+    return df[~df["user.login"].isin(EXCLUDE_USERS)].reset_index(drop=True)
+
+
 def download_identifications():
-    # Obtener el ID más alto disponible en MINKA
-    batch_size = 10000
-    page_max = 200
-    df_identifications = pd.DataFrame()
+    """
+    Descarga las identificaciones nuevas, desde el final del tramo ya guardado
+    hasta el id más alto de la API, por lotes en paralelo. Cada lote terminado
+    se añade como una parte de la tabla; los que fallan se vuelven a pedir en
+    la próxima ejecución. Devuelve la tabla completa.
+    """
+    table = identifications_table()
 
     # Obtener el ID más alto disponible en la API
-    url = f"{API_PATH}/identifications?own_observation=false&per_page=1"
+    params = {"own_observation": "false", "per_page": 1}
     try:
-        max_id = session.get(url).json()["results"][0]["id"]
+        max_id = _get_page(params)[0]["id"]
         print(f"Max ID en la API: {max_id}")
     except Exception as e:
         print(f"Error al obtener el ID máximo: {str(e)}")
-        return None
-
-    print("Iniciando descarga...")
-
-    for i in range(6, math.ceil(max_id / batch_size) + 2):
-        print(f"Lote {i}...")
-        for page in range(1, math.ceil(batch_size / page_max) + 1):
-            url = f"{API_PATH}/identifications?own_observation=false&id_above={(i-1)*batch_size}&id_below={(i*batch_size) +1}&per_page={page_max}&page={page}"
+        return table.read()
+
+    start = table.covered(first_id)
+    batches = [
+        (batch_start, min(batch_start + batch_size, max_id + 1))
+        for batch_start in range(start, max_id + 1, batch_size)
+    ]
+    print(f"Descargando {len(batches)} lotes desde el id {start}...")
+
+    pending = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(download_batch, *batch): batch for batch in batches}
+        for future in as_completed(futures):
+            batch_start, batch_end = futures[future]
             try:
-                response = session.get(url).json()
-
-                if "results" in response and response["results"]:
-                    results = pd.json_normalize(response["results"])[
-                        [
-                            "id",
-                            "user.id",
-                            "user.login",
-                            "created_at",
-                            "taxon_id",
-                            "taxon.ancestor_ids",
-                            "observation.id",
-                        ]
-                    ]
-
-                    # Filtrar usuarios excluidos
-                    results = results[
-                        ~results["user.login"].isin(EXCLUDE_USERS)
-                    ].reset_index(drop=True)
-
-                    if not results.empty:
-                        df_identifications = pd.concat(
-                            [df_identifications, results], ignore_index=True
-                        )
-                        print(f"Total registros: {len(df_identifications)}")
-                else:
-                    print(f"No hay más resultados en lote {i}, página {page}")
-                    break  # Salir del bucle interno si no hay más datos
-
+                df = future.result()
             except Exception as e:
-                print(f"Error en lote {i}, página {page}: {str(e)}")
-                time.sleep(
-                    2
-                )  # Pequeña pausa en caso de error para evitar bloqueos de API
+                print(f"Error en el lote {batch_start}-{batch_end}: {str(e)}")
+                pending.append(futures[future])
+                continue
+            table.write_part(batch_start, batch_end, df)
+            print(f"Lote {batch_start}-{batch_end}: {len(df)} identificaciones")
 
-    # Guardar el DataFrame en CSV
-    file_path = f"{directory}/data/minka_identifications.csv"
-    df_identifications.to_csv(file_path, index=False)
-    print(f"Datos guardados en {file_path}")
+    if pending:
+        print(f"Lotes pendientes para la próxima ejecución: {sorted(pending)}")
 
-    return df_identifications
+    return table.read()
 
 
 # Identificadores
 def get_identifiers():
     url = f"{API_PATH}/observations/identifiers"
 
-    response = requests.get(url).json()
+    response = session.get(url).json()
 
     total_identifiers = []
 
@@ -135,65 +193,56 @@ def get_identifiers():
     ].reset_index(drop=True)
 
 
-def get_last_identification(user_id, df_identifications):
-    last_id = df_identifications.loc[
-        df_identifications["user.id"] == user_id, "created_at"
-    ].max()
-    return last_id
-
-
-def get_most_freq_taxon(user_id, column_name, df_identifications):
-    df_identifications["kingdom"] = df_identifications["taxon.ancestor_ids"].apply(
-        lambda x: x[0] if len(x) > 1 else None
-    )
-    df_identifications["phylum"] = df_identifications["taxon.ancestor_ids"].apply(
-        lambda x: x[1] if len(x) > 1 else None
+def build_identifier_profiles(df_identifications: pd.DataFrame) -> pd.DataFrame:
+    """
+    Por usuario (`user.id`): día de la última identificación (UTC) y ids del
+    kingdom, phylum y taxón que más ha identificado, con agregaciones agrupadas
+    sobre toda la tabla. En caso de empate gana el id menor, como con `mode()`.
+    """
+    ancestors = df_identifications["taxon.ancestor_ids"]
+    has_ancestors = ancestors.str.len() > 1
+    taxa = pd.DataFrame(
+        {
+            "user.id": df_identifications["user.id"],
+            "most_kingdom": ancestors.str[0].where(has_ancestors),
+            "most_phylum": ancestors.str[1].where(has_ancestors),
+            "most_taxon": df_identifications["taxon_id"],
+        }
     )
 
-    filtered_values = df_identifications.loc[
-        df_identifications["user.id"] == user_id, column_name
-    ].dropna()  # Elimina valores NaN
-    most_freq = filtered_values.mode()
-    taxon_id = most_freq.iloc[0] if not most_freq.empty else None
-    if taxon_id is not None:
-        url_taxon = f"https://minka-sdg.org/taxa/{int(taxon_id)}.json"
-        taxon_name = session.get(url_taxon).json()["name"]
-    else:
-        taxon_name = None
-    return taxon_name
+    created_at = pd.to_datetime(df_identifications["created_at"], utc=True)
+    profiles = created_at.groupby(df_identifications["user.id"]).max().dt.date
+    profiles = profiles.to_frame("last_identification")
+    for col in ["most_kingdom", "most_phylum", "most_taxon"]:
+        counts = taxa.groupby(["user.id", col]).size().reset_index(name="n")
+        counts = counts.sort_values(
+            by=["user.id", "n", col], ascending=[True, False, True]
+        )
+        profiles[col] = counts.drop_duplicates("user.id").set_index("user.id")[col]
+    return profiles
 
 
 if __name__ == "__main__":
     df_identifications = download_identifications()
-    # df_identifications = pd.read_csv(f"{directory}/data/minka_identifications.csv")
+
+    print("Get identifiers by period")
+    df_periods = build_identifiers_by_period(df_identifications)
+    df_periods.to_csv(f"{directory}/data/{PERIODS_FILE}", index=False)
+
+    print("Get identifications by user and month")
+    save_user_months(build_user_months(df_identifications), directory)
 
     print("Get identifiers")
     df_identifiers = get_identifiers()
 
-    print("Get last identification")
-    df_identifiers["last_identification"] = df_identifiers["identifier_id"].apply(
-        lambda x: get_last_identification(x, df_identifications)
-    )
-    df_identifiers["last_identification"] = pd.to_datetime(
-        df_identifiers["last_identification"], utc=True
-    )
-    df_identifiers["last_identification"] = df_identifiers[
-        "last_identification"
-    ].dt.date
-
-    print("Get most frequent taxons")
-    df_identifications["taxon.ancestor_ids"] = df_identifications[
-        "taxon.ancestor_ids"
-    ].apply(ast.literal_eval)
-    df_identifiers["most_kingdom"] = df_identifiers["identifier_id"].apply(
-        lambda x: get_most_freq_taxon(x, "kingdom", df_identifications)
-    )
-    df_identifiers["most_phylum"] = df_identifiers["identifier_id"].apply(
-        lambda x: get_most_freq_taxon(x, "phylum", df_identifications)
-    )
-    df_identifiers["most_taxon"] = df_identifiers["identifier_id"].apply(
-        lambda x: get_most_freq_taxon(x, "taxon_id", df_identifications)
-    )
+    print("Get identifier profiles")
+    profiles = build_identifier_profiles(df_identifications)
+    df_identifiers = df_identifiers.join(profiles, on="identifier_id")
+
+    taxa = ["most_kingdom", "most_phylum", "most_taxon"]
+    names = get_taxon_names(df_identifiers[taxa].stack(), session=session)
+    for col in taxa:
+        df_identifiers[col] = df_identifiers[col].map(names)
 
     print("Save df_identifiers")
     df_identifiers.to_csv(f"{directory}/data/minka_identifiers.csv", index=False)
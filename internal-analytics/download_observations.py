@@ -1,13 +1,50 @@
+import argparse
+import datetime
+import hashlib
+import json
 import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
 
-import geopandas as gpd
+import numpy as np
 import pandas as pd
 import requests
+import shapely
 from mecoda_minka import get_dfs, get_obs
-from shapely.geometry import Point, Polygon
+from shapely.geometry import shape
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from common.client import MinkaSession, loads
+from common.counts import count_job, counts_wide, get_counts
+from common.membership import get_observation_ids
+from common.obs_store import ObsStore
+from obs_cube import CUBE_FILE, USERS_FILE, build_cube
 
 API_PATH = "https://api.minka-sdg.org/v1"
-session = requests.Session()
+CATALUNYA_PLACE = 374
+# Día de la semana (0 = lunes) en que se buscan observaciones borradas aunque
+# el total cuadre con la API
+reconcile_weekday = 6
+
+ACCOUNT_COLUMNS = [
+    "user_id",
+    "user_name",
+    "created_at",
+    "observations_count",
+    "identifications_count",
+    "species_count",
+]
+# Búsqueda de cuentas nuevas: ids que se prueban a la vez, peticiones en
+# paralelo y ids vacíos consecutivos tras los que se para
+users_window = 50
+users_workers = 8
+max_empty = 100
+# Cada cuántas ventanas se guarda el progreso
+checkpoint_windows = 20
+# Peticiones en paralelo de las estadísticas de proyectos
+projects_workers = 8
+session = MinkaSession()
 
 try:
     directory = f"{os.environ['DASHBOARDS']}/internal-analytics"
@@ -18,30 +55,79 @@ except KeyError:
 
 
 # Observaciones de Catalunya
-def get_catalunya_column(df_obs, session=session):
-    url = f"{API_PATH}/places/374"
+def points_within(geojson: dict, longitude, latitude) -> np.ndarray:
+    """
+    Si cada punto está dentro de la geometría GeoJSON (todos los polígonos de
+    un MultiPolygon), con un STRtree de sus polígonos y construcción vectorizada
+    de los puntos. Los puntos sin coordenadas quedan fuera.
+    """
+    polygons = shapely.get_parts(shape(geojson))
+    tree = shapely.STRtree(polygons)
+    points = shapely.points(
+        np.asarray(longitude, dtype=float), np.asarray(latitude, dtype=float)
+    )
+    inside = np.zeros(len(points), dtype=bool)
+    point_idx, __ = tree.query(points, predicate="within")
+    inside[point_idx] = True
+    return inside
 
-    response = session.get(url).json()
 
-    catalunya_geojson = response["results"][0]["geometry_geojson"]
+def _same(a: pd.Series, b: pd.Series) -> pd.Series:
+    return (a == b) | (a.isna() & b.isna())
 
-    # Convertir el GeoJSON en un polígono de Shapely
-    # polygon = Polygon(catalunya_geojson[0][0])  # Extraer la lista interna y crear un polígono
-    polygon = Polygon(catalunya_geojson["coordinates"][0][0])
 
-    # Crear un GeoDataFrame con el polígono
-    gdf_catalunya = gpd.GeoDataFrame({"geometry": [polygon]}, crs="EPSG:4326")
+def get_catalunya_column(df_obs, session=session):
+    """
+    Añade la columna `catalunya`. La clasificación de cada observación se
+    guarda junto a sus coordenadas y sólo se calcula para las nuevas o las
+    que se han movido, o para todas si ha cambiado la geometría del place.
+    """
+    cache_path = f"{directory}/data/minka_obs_catalunya.csv"
+    state_path = f"{directory}/data/minka_obs_catalunya.json"
+
+    url = f"{API_PATH}/places/{CATALUNYA_PLACE}"
+    catalunya_geojson = session.get(url).json()["results"][0]["geometry_geojson"]
+    geometry = hashlib.sha256(
+        json.dumps(catalunya_geojson, sort_keys=True).encode()
+    ).hexdigest()
 
-    # Convertir las coordenadas en geometría de puntos
-    df_obs["geometry"] = df_obs.apply(
-        lambda row: Point(row["longitude"], row["latitude"]), axis=1
+    try:
+        with open(state_path) as f:
+            same_geometry = json.load(f).get("geometry") == geometry
+        cached = pd.read_csv(cache_path) if same_geometry else None
+    except FileNotFoundError:
+        cached = None
+    if cached is None:
+        cached = pd.DataFrame(
+            {
+                "id": pd.Series(dtype="int64"),
+                "longitude": pd.Series(dtype="float64"),
+                "latitude": pd.Series(dtype="float64"),
+                "catalunya": pd.Series(dtype="boolean"),
+            }
+        )
+
+    df = df_obs[["id", "longitude", "latitude"]].merge(
+        cached, on="id", how="left", suffixes=("", "_cached")
     )
+    pending = ~(
+        df["catalunya"].notna()
+        & _same(df["longitude"], df["longitude_cached"])
+        & _same(df["latitude"], df["latitude_cached"])
+    )
+    print(f"Clasificando {pending.sum()} de {len(df)} observaciones")
+    catalunya = df["catalunya"].astype("boolean").fillna(False).to_numpy(dtype=bool)
+    catalunya[pending.to_numpy()] = points_within(
+        catalunya_geojson, df.loc[pending, "longitude"], df.loc[pending, "latitude"]
+    )
+    df_obs["catalunya"] = catalunya
 
-    # Convertir df_obs en un GeoDataFrame con CRS WGS84 (EPSG:4326)
-    gdf_obs = gpd.GeoDataFrame(df_obs, geometry=df_obs["geometry"], crs="EPSG:4326")
-
-    # Crear una nueva columna 'in_catalunya' con valores True/False
-    df_obs["catalunya"] = gdf_obs.within(gdf_catalunya.loc[0, "geometry"])
+    # Guarda la clasificación de las observaciones actuales
+    df = df[["id", "longitude", "latitude"]].assign(catalunya=catalunya)
+    df.to_csv(f"{cache_path}.tmp", index=False)
+    os.replace(f"{cache_path}.tmp", cache_path)
+    with open(state_path, "w") as f:
+        json.dump({"geometry": geometry}, f)
 
     return df_obs
 
@@ -55,78 +141,209 @@ def get_imported_column(df_obs):
     return df_obs
 
 
-# Proyectos
-def get_projects(session=session):
-    projects_data = []
-    url = f"{API_PATH}/projects?order_by=created"
-    total_results = session.get(url).json()["total_results"]
-    for page in range(1, total_results // 300 + 2):
-        url = f"{API_PATH}/projects?order_by=created&per_page=300&page={page}"
-        results = session.get(url).json()["results"]
-        for result in results:
-            data = {}
-            data["project_id"] = result["id"]
-            data["project_name"] = result["title"]
-            data["project_description"] = result["description"]
-            data["created_at"] = result["created_at"]
-            data["updated_at"] = result["updated_at"]
-            data["project_type"] = result["project_type"]
-            data["admin"] = result["admins"][0]["user"]["login"]
-            projects_data.append(data)
-    df_projects = pd.DataFrame(projects_data)
-    df_projects["created_at"] = pd.to_datetime(
-        df_projects["created_at"], utc=True
-    ).dt.date
-    df_projects["updated_at"] = pd.to_datetime(
-        df_projects["updated_at"], utc=True
-    ).dt.date
-
-    df_projects["num_observations"] = df_projects["project_id"].apply(
-        lambda x: _get_observations_by_project(x, session)
-    )
-    df_projects["num_observers"] = df_projects["project_id"].apply(
-        lambda x: _get_observers_by_project(x, session)
-    )
-    df_projects["num_species"] = df_projects["project_id"].apply(
-        lambda x: _get_species_by_project(x, session)
-    )
-    df_projects["last_observation"] = df_projects["project_id"].apply(
-        lambda x: _get_last_observation_by_project(x, session)
-    )
-
-    return df_projects
+# Sincronización de observaciones
+def reconcile_deleted(store: ObsStore, session=session):
+    """
+    Elimina del store las observaciones que ya no existen en la plataforma,
+    con una pasada de sólo ids.
+    """
+    ids = get_observation_ids(session)
+    stored = store.df_obs["id"].to_numpy(dtype="int64")
+    deleted = stored[~np.isin(stored, ids)]
+    print(f"Observaciones borradas: {len(deleted)}")
+    store.remove(deleted)
+
+
+def sync_platform_obs(full=False, session=session) -> ObsStore:
+    """
+    Sincroniza minka_obs con la plataforma. Descarga sólo las observaciones
+    nuevas (`id_above`) y las modificadas desde la última sincronización
+    (`updated_since`) y las fusiona con la tabla guardada; las borradas se
+    buscan con una pasada de sólo ids si el total no cuadra con la API o el
+    día `reconcile_weekday`. Con `full`, o sin tabla, la descarga es completa.
+    """
+    store = ObsStore(f"{directory}/data/minka_obs.csv")
+    started = datetime.datetime.now(datetime.timezone.utc)
+    if full or len(store) == 0:
+        print("Descarga completa de observaciones")
+        store.replace(get_dfs(get_obs())[0])
+    else:
+        obs = get_obs(id_above=store.max_id())
+        if len(obs) > 0:
+            print(f"Observaciones nuevas: {len(obs)}")
+            store.upsert(get_dfs(obs)[0])
+
+        yesterday = datetime.date.today() - datetime.timedelta(days=1)
+        obs = get_obs(updated_since=store.watermark or yesterday.strftime("%Y-%m-%d"))
+        if len(obs) > 0:
+            print(f"Observaciones modificadas: {len(obs)}")
+            store.upsert(get_dfs(obs)[0])
+
+        jobs = [count_job("observations", {})]
+        total = get_counts(jobs, session=session, cache=False)["total_results"].iloc[0]
+        if len(store) != total or datetime.date.today().weekday() == reconcile_weekday:
+            reconcile_deleted(store, session)
+
+    # Columnas derivadas; la de Catalunya sólo se calcula para las que cambian
+    derived = ["catalunya", "imported"]
+    previous = store.df_obs.reindex(columns=derived)
+    print("Get catalunya column")
+    store.df_obs = get_catalunya_column(store.df_obs, session)
+    print("Get imported column")
+    store.df_obs = get_imported_column(store.df_obs)
+    if not previous.equals(store.df_obs[derived]):
+        store.changed = True
 
+    print("Guardando observaciones...")
+    store.save(watermark=started.strftime("%Y-%m-%dT%H:%M:%SZ"))
+    return store
 
-def _get_observations_by_project(project_id, session):
-    url = f"https://api.minka-sdg.org/v1/observations?project_id={project_id}&order=desc&order_by=created_at"
-    try:
-        return session.get(url).json()["total_results"]
-    except:
-        return 0
 
+# Proyectos
+def _project(result: dict) -> dict:
+    return {
+        "project_id": result["id"],
+        "project_name": result["title"],
+        "project_description": result["description"],
+        "created_at": result["created_at"],
+        "updated_at": result["updated_at"],
+        "project_type": result["project_type"],
+        "admin": result["admins"][0]["user"]["login"],
+    }
+
+
+def get_project_list(session=session) -> pd.DataFrame:
+    """
+    Proyectos de la plataforma, del listado paginado de /projects.
+    """
+    projects = []
+    page = 1
+    while True:
+        response = session.get(
+            f"{API_PATH}/projects",
+            params={"order_by": "created", "per_page": 300, "page": page},
+        )
+        response.raise_for_status()
+        data = loads(response.content)
+        projects.extend(_project(result) for result in data["results"])
+        if page * data["per_page"] >= data["total_results"] or not data["results"]:
+            break
+        page += 1
+    df_projects = pd.DataFrame(projects)
+    for col in ["created_at", "updated_at"]:
+        df_projects[col] = pd.to_datetime(df_projects[col], utc=True).dt.date
+    return df_projects
 
-def _get_observers_by_project(project_id, session):
-    url = f"https://api.minka-sdg.org/v1/observations/observers?project_id={project_id}"
-    try:
-        return session.get(url).json()["total_results"]
-    except:
-        return 0
 
+def get_project_observations(project_id: int, session=session) -> dict:
+    """
+    Total de observaciones del proyecto y su última observación (día e id),
+    con una sola petición.
+    """
+    response = session.get(
+        f"{API_PATH}/observations",
+        params={
+            "project_id": project_id,
+            "order": "desc",
+            "order_by": "created_at",
+            "per_page": 1,
+        },
+    )
+    response.raise_for_status()
+    data = loads(response.content)
+    last = data["results"][0] if data["results"] else None
+    return {
+        "num_observations": data["total_results"],
+        "last_observation": last["created_at_details"]["date"] if last else None,
+        "last_observation_id": last["id"] if last else None,
+    }
+
+
+def get_projects(full=False, session=session) -> pd.DataFrame:
+    """
+    Proyectos con sus observaciones, observadores, especies y última
+    observación. La petición de observaciones de cada proyecto se hace en
+    paralelo; observadores y especies sólo se vuelven a contar para los
+    proyectos cuyo `updated_at`, total de observaciones o última observación
+    han cambiado desde la ejecución anterior, salvo con `full` o el día
+    `reconcile_weekday`, en que se cuentan todos.
+    """
+    path = f"{directory}/data/minka_projects.csv"
+    df_projects = get_project_list(session)
+
+    def watermark(project_id):
+        try:
+            return get_project_observations(project_id, session)
+        except Exception as e:
+            print(f"Error en las observaciones del proyecto {project_id}: {str(e)}")
+            return {}
+
+    with ThreadPoolExecutor(max_workers=projects_workers) as executor:
+        watermarks = list(executor.map(watermark, df_projects["project_id"]))
+    df_projects = df_projects.join(
+        pd.DataFrame(watermarks, index=df_projects.index).reindex(
+            columns=["num_observations", "last_observation", "last_observation_id"]
+        )
+    )
 
-def _get_species_by_project(project_id, session):
-    url = f"https://api.minka-sdg.org/v1/observations/species_counts?project_id={project_id}"
-    try:
-        return session.get(url).json()["total_results"]
-    except:
-        return 0
+    full = full or datetime.date.today().weekday() == reconcile_weekday
+    if os.path.exists(path) and not full:
+        previous = pd.read_csv(path, dtype={"updated_at": str, "last_observation": str})
+        previous = df_projects[["project_id"]].merge(previous, how="left")
+    else:
+        previous = pd.DataFrame(index=df_projects.index)
+    previous = previous.reindex(
+        columns=[
+            "updated_at",
+            "num_observations",
+            "num_observers",
+            "num_species",
+            "last_observation",
+            "last_observation_id",
+        ]
+    )
 
+    # Si falla la petición de observaciones se conservan los datos anteriores
+    failed = df_projects["num_observations"].isna()
+    for col in ["num_observations", "last_observation", "last_observation_id"]:
+        df_projects.loc[failed, col] = previous.loc[failed, col]
 
-def _get_last_observation_by_project(project_id, session):
-    url = f"https://api.minka-sdg.org/v1/observations?project_id={project_id}&order=desc&order_by=created_at"
-    try:
-        return session.get(url).json()["results"][0]["created_at_details"]["date"]
-    except:
-        return None
+    unchanged = (
+        _same(df_projects["updated_at"].astype(str), previous["updated_at"])
+        & _same(df_projects["num_observations"], previous["num_observations"])
+        & _same(df_projects["last_observation_id"], previous["last_observation_id"])
+        & previous["num_observers"].notna()
+    )
+    df_projects["num_observers"] = previous["num_observers"].where(unchanged)
+    df_projects["num_species"] = previous["num_species"].where(unchanged)
+
+    changed = df_projects.loc[~unchanged, "project_id"].tolist()
+    print(f"Proyectos con cambios: {len(changed)} de {len(df_projects)}")
+    jobs = [
+        count_job(endpoint, {"project_id": project_id}, project_id=project_id)
+        for project_id in changed
+        for endpoint in ["observers", "species"]
+    ]
+    if jobs:
+        counts = counts_wide(
+            get_counts(jobs, session=session, cache=False), "project_id"
+        )
+        counts = counts.set_index("project_id")
+        df_projects.loc[~unchanged, "num_observers"] = (
+            df_projects.loc[~unchanged, "project_id"]
+            .map(counts["observers"])
+            .to_numpy()
+        )
+        df_projects.loc[~unchanged, "num_species"] = (
+            df_projects.loc[~unchanged, "project_id"].map(counts["species"]).to_numpy()
+        )
+
+    for col in ["num_observations", "num_observers", "num_species"]:
+        df_projects[col] = df_projects[col].fillna(0).astype(int)
+    df_projects["last_observation_id"] = df_projects["last_observation_id"].astype(
+        "Int64"
+    )
+    return df_projects
 
 
 # KPI: Number of unique users contributing to validation per year
@@ -149,87 +366,183 @@ def get_identifiers(session=session):
     return df_identifiers
 
 
-def get_users_created(session=session):
-    try:
-        print(f"{directory}/data/minka_accounts.csv")
-        df_accounts = pd.read_csv(f"{directory}/data/minka_accounts.csv")
-        i = df_accounts.user_id.max() + 1
-    except:
-        i = 1
-        df_accounts = pd.DataFrame()
-
-    max_empty = 100  # Máximo número de IDs consecutivos vacíos antes de detenerse
-    empty_count = 0  # Contador de IDs vacíos consecutivos
-    total = []
-
-    while empty_count < max_empty:
-        user_url = f"{API_PATH}/users/{i}"
-        try:
-            response = session.get(user_url)
-
+# Cuentas
+def _account(user: dict) -> dict:
+    # Los contadores que no vienen en la respuesta quedan nulos, no a 0
+    return {
+        "user_id": user["id"],
+        "user_name": user["login"],
+        "created_at": user["created_at"],
+        "observations_count": user.get("observations_count"),
+        "identifications_count": user.get("identifications_count"),
+        "species_count": user.get("species_count"),
+    }
+
+
+def get_user(user_id: int, session=session):
+    """
+    Cuenta `user_id`, o None si no existe.
+    """
+    response = session.get(f"{API_PATH}/users/{user_id}")
+    if response.status_code != 200:
+        return None
+    results = loads(response.content).get("results")
+    return _account(results[0]) if results else None
+
+
+def get_listed_accounts(session=session) -> pd.DataFrame:
+    """
+    Cuentas con observaciones o identificaciones y sus contadores actuales,
+    de los listados paginados de observers e identifiers.
+    """
+    accounts = []
+    for endpoint in ["observers", "identifiers"]:
+        page = 1
+        while True:
+            response = session.get(
+                f"{API_PATH}/observations/{endpoint}",
+                params={"per_page": 500, "page": page},
+            )
             if response.status_code != 200:
-                print(f"Error {response.status_code} en ID {i}, continuando...")
-                empty_count += 1
-                i += 1
-                continue  # Saltar a la siguiente iteración
-
-            json_data = response.json()
-
-            if "results" not in json_data or not json_data["results"]:
-                empty_count += 1  # Incrementar si el usuario no existe
-            else:
-                data = {
-                    "user_id": i,
-                    "user_name": json_data["results"][0]["login"],
-                    "created_at": json_data["results"][0]["created_at"],
-                    "observations_count": json_data["results"][0]["observations_count"],
-                    "identifications_count": json_data["results"][0][
-                        "identifications_count"
-                    ],
-                    "species_count": json_data["results"][0]["species_count"],
-                }
-                total.append(data)
-                empty_count = (
-                    0  # Reiniciar el contador si encontramos un usuario válido
-                )
-
-            i += 1  # Pasar al siguiente ID
+                print(f"Error {response.status_code} en {endpoint}, página {page}")
+                break
+            data = loads(response.content)
+            for result in data["results"]:
+                accounts.append(_account(result["user"]))
+            # La API puede devolver menos resultados por página de los pedidos
+            per_page = data.get("per_page", 500)
+            if not data["results"] or page * per_page >= data["total_results"]:
+                break
+            page += 1
+    return _merge_accounts(pd.DataFrame(accounts, columns=ACCOUNT_COLUMNS))
+
+
+def _merge_accounts(*dfs) -> pd.DataFrame:
+    # Una fila por cuenta; los datos de los últimos dataframes tienen prioridad,
+    # salvo los nulos, que conservan el valor anterior
+    dfs = [df for df in dfs if len(df) > 0]
+    if not dfs:
+        return pd.DataFrame(columns=ACCOUNT_COLUMNS)
+    df = pd.concat(dfs, ignore_index=True)
+    df = df.groupby("user_id", sort=True, as_index=False).last()
+    counts = ["observations_count", "identifications_count", "species_count"]
+    df[counts] = df[counts].astype("Int64")
+    return df[ACCOUNT_COLUMNS]
 
-        except requests.RequestException as e:
-            print(f"Error en la solicitud: {e}")
-            break  # Detener el bucle si hay un error grave de red
 
-    df_accounts = pd.concat([df_accounts, pd.DataFrame(total)], ignore_index=True)
-
-    return df_accounts
+def get_users_created(session=session):
+    """
+    Tabla de cuentas completa y al día. Los contadores de las cuentas con
+    actividad se refrescan con los listados de observers e identifiers, y las
+    cuentas nuevas se buscan probando ventanas de ids en paralelo desde la
+    última posición guardada, al menos hasta el mayor id de los listados y
+    hasta encontrar `max_empty` ids vacíos seguidos. El progreso se guarda
+    cada `checkpoint_windows` ventanas, así que una ejecución interrumpida
+    continúa donde se quedó.
+    """
+    path = f"{directory}/data/minka_accounts.csv"
+    state_path = f"{directory}/data/minka_accounts_crawl.json"
+    try:
+        df_accounts = pd.read_csv(path)
+    except FileNotFoundError:
+        df_accounts = pd.DataFrame(columns=ACCOUNT_COLUMNS)
+    try:
+        with open(state_path) as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        state = {}
+
+    known_id = int(df_accounts["user_id"].max()) if len(df_accounts) else 0
+    next_id = max(state.get("next_id", 1), known_id + 1)
+
+    print("Refrescando cuentas con actividad")
+    listed = get_listed_accounts(session)
+    df_accounts = _merge_accounts(df_accounts, listed)
+    listed_ids = set(listed["user_id"])
+    last_listed = max(listed_ids, default=0)
+
+    def checkpoint(accounts, position):
+        df = _merge_accounts(
+            df_accounts, pd.DataFrame(accounts, columns=ACCOUNT_COLUMNS)
+        )
+        df.to_csv(f"{path}.tmp", index=False)
+        os.replace(f"{path}.tmp", path)
+        with open(f"{state_path}.tmp", "w") as f:
+            json.dump({"next_id": position}, f)
+        os.replace(f"{state_path}.tmp", state_path)
+        return df
+
+    print(f"Buscando cuentas nuevas desde el id {next_id}")
+    found = []
+    empty_count = 0
+    windows = 0
+    interrupted = False
+    with ThreadPoolExecutor(max_workers=users_workers) as executor:
+        while empty_count < max_empty or next_id <= last_listed:
+            window = range(next_id, next_id + users_window)
+            # Las cuentas de los listados ya están al día y no se piden
+            ids = [i for i in window if i not in listed_ids]
+            try:
+                accounts = dict(
+                    zip(ids, executor.map(lambda i: get_user(i, session), ids))
+                )
+            except requests.RequestException as e:
+                print(f"Error en la solicitud: {e}")
+                interrupted = True
+                break
+            for user_id in window:
+                account = accounts.get(user_id)
+                if account is not None:
+                    found.append(account)
+                if account is None and user_id not in listed_ids:
+                    empty_count += 1
+                else:
+                    empty_count = 0
+            next_id += users_window
+            windows += 1
+            if windows % checkpoint_windows == 0:
+                checkpoint(found, next_id)
+
+    # Si ha terminado, la próxima vez se vuelve a probar desde la última
+    # cuenta encontrada; si no, se continúa donde se ha quedado
+    df_accounts = _merge_accounts(
+        df_accounts, pd.DataFrame(found, columns=ACCOUNT_COLUMNS)
+    )
+    last_id = int(df_accounts["user_id"].max()) if len(df_accounts) else 0
+    print(f"Cuentas nuevas: {len(found)}")
+    return checkpoint([], next_id if interrupted else last_id + 1)
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Descarga las cuentas, observaciones y proyectos de MINKA."
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="descarga completa de observaciones y proyectos en vez de sólo los cambios",
+    )
+    args = parser.parse_args()
 
     # Actualización de usuarios
     print("Get users")
-    session = requests.Session()
+    session = MinkaSession()
     df_accounts = get_users_created(session)
-    df_accounts.to_csv(f"{directory}/data/minka_accounts.csv", index=False)
 
-    # Descarga de observaciones
+    # Observaciones: sólo los cambios desde la última ejecución
     print("Get observations")
-    obs = get_obs()
-    print("Get dfs for obs")
-    df_obs, df_photos = get_dfs(obs)
-
-    print("Get catalunya column")
-    df_obs = get_catalunya_column(df_obs)
+    store = sync_platform_obs(full=args.full, session=session)
+    df_obs = store.df_obs
 
-    print("Get imported column")
-    df_obs = get_imported_column(df_obs)
-
-    print("Guardando observaciones...")
-    df_obs.to_csv(f"{directory}/data/minka_obs.csv", index=False)
+    # Cubo de KPIs para los gráficos de observaciones
+    print("Guardando cubo de observaciones...")
+    cube, month_users = build_cube(df_obs)
+    month_users.to_csv(f"{directory}/data/{USERS_FILE}", index=False)
+    cube.to_csv(f"{directory}/data/{CUBE_FILE}", index=False)
 
     # Descarga de proyectos
     print("Get projects")
-    df_projects = get_projects()
+    df_projects = get_projects(full=args.full, session=session)
 
     print("Guardando proyectos...")
     df_projects.to_csv(f"{directory}/data/minka_projects.csv", index=False)
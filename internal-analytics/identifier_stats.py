@@ -0,0 +1,122 @@
+"""
+Tablas precalculadas de identificadores para 3_identifiers.py.
+
+download_identifications.py las calcula cada noche a partir de la tabla local
+de identificaciones (que ya no incluye las cuentas EMBIMOS), así que la página
+no hace ninguna llamada a la API. Los periodos son años y meses de la fecha de
+la identificación en UTC.
+"""
+
+import os
+import sys
+
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.storage import read_table, write_table
+
+PERIODS_FILE = "minka_identifiers_by_period.csv"
+USER_MONTHS_FILE = "minka_identifications_user_months.csv"
+# Primer mes de las series
+START_MONTH = "2022-04"
+
+
+def build_identifiers_by_period(
+    df_identifications: pd.DataFrame, end=None
+) -> pd.DataFrame:
+    """
+    Identificadores distintos por año y por mes (`frequency` "year" o
+    "month"), desde `START_MONTH` hasta el periodo de `end` (hoy por defecto).
+    `identifiers` cuenta los que identificaron en el periodo y `cumulative`
+    los que lo habían hecho alguna vez hasta el final del periodo.
+    """
+    created_at = pd.to_datetime(df_identifications["created_at"], utc=True)
+    months = created_at.dt.tz_localize(None).dt.to_period("M")
+    pairs = pd.DataFrame({"user.id": df_identifications["user.id"], "month": months})
+    pairs = pairs.drop_duplicates()
+    first_month = pairs.groupby("user.id")["month"].min()
+
+    end = pd.Period(pd.Timestamp.now() if end is None else end, freq="M")
+    first = pd.Period(START_MONTH, freq="M")
+    # Los acumulados cuentan también a quien identificó antes de START_MONTH
+    start = min(first, first_month.min()) if len(first_month) else first
+
+    tables = []
+    for frequency, freq in [("year", "Y"), ("month", "M")]:
+        periods = pd.period_range(start.asfreq(freq), end.asfreq(freq), freq=freq)
+        identifiers = pairs.assign(period=pairs["month"].dt.asfreq(freq))
+        identifiers = identifiers.groupby("period")["user.id"].nunique()
+        new = first_month.dt.asfreq(freq).value_counts()
+        table = pd.DataFrame(
+            {
+                "identifiers": identifiers.reindex(periods, fill_value=0),
+                "cumulative": new.reindex(periods, fill_value=0).cumsum(),
+            }
+        )
+        table = table[table.index >= first.asfreq(freq)]
+        tables.append(
+            table.reset_index(names="period").assign(
+                frequency=frequency, period=lambda df: df["period"].astype(str)
+            )
+        )
+    columns = ["frequency", "period", "identifiers", "cumulative"]
+    return pd.concat(tables, ignore_index=True)[columns]
+
+
+def read_identifiers_by_period(directory: str) -> pd.DataFrame:
+    """
+    Tabla de identificadores por periodo guardada en `directory`/data.
+    """
+    return pd.read_csv(f"{directory}/data/{PERIODS_FILE}", dtype={"period": str})
+
+
+def build_user_months(df_identifications: pd.DataFrame, end=None) -> pd.DataFrame:
+    """
+    Matriz usuario × mes: una fila por `user.login` (ordenadas por login) con
+    el total de identificaciones (`identifications`) y una columna por mes
+    ("YYYY-MM") desde `START_MONTH` hasta el mes de `end` (hoy por defecto).
+    """
+    created_at = pd.to_datetime(df_identifications["created_at"], utc=True)
+    months = created_at.dt.tz_localize(None).dt.to_period("M")
+    end = pd.Period(pd.Timestamp.now() if end is None else end, freq="M")
+    periods = pd.period_range(pd.Period(START_MONTH, freq="M"), end, freq="M")
+
+    logins = df_identifications["user.login"].astype(str)
+    counts = pd.crosstab(logins, months).reindex(columns=periods, fill_value=0)
+    counts.columns = periods.astype(str)
+    counts.insert(0, "identifications", logins.value_counts())
+    counts = counts.astype("int32").sort_index()
+    return counts.rename_axis("user.login").reset_index()
+
+
+def save_user_months(df: pd.DataFrame, directory: str):
+    # Parquet si está pyarrow; si no, CSV
+    write_table(df, f"{directory}/data/{USER_MONTHS_FILE}", csv=False)
+
+
+def read_user_months(directory: str) -> pd.DataFrame:
+    """
+    Matriz usuario × mes guardada en `directory`/data, indexada por login.
+    """
+    df = read_table(f"{directory}/data/{USER_MONTHS_FILE}")
+    return df.set_index(df.pop("user.login").astype(str))
+
+
+def user_timeline(user_months: pd.DataFrame, login: str) -> pd.DataFrame:
+    """
+    Identificaciones de `login` por mes (`period`, `identifications`).
+    """
+    row = user_months.loc[login].drop("identifications")
+    return pd.DataFrame({"period": row.index, "identifications": row.to_numpy()})
+
+
+def top_users_timeline(user_months: pd.DataFrame, n: int = 10) -> tuple:
+    """
+    Los `n` usuarios con más identificaciones, de más a menos, y sus
+    identificaciones por mes (`period`, `user.login`, `identifications`).
+    """
+    top = user_months["identifications"].nlargest(n)
+    rows = user_months.loc[top.index].drop(columns="identifications")
+    timeline = rows.rename_axis(columns="period").stack().rename("identifications")
+    timeline = timeline.reset_index().sort_values(["period", "user.login"])
+    return top.index.tolist(), timeline[["period", "user.login", "identifications"]]
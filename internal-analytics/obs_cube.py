@@ -0,0 +1,159 @@
+"""
+Cubo de KPIs de observaciones de la plataforma.
+
+download_observations.py agrega las observaciones (sin las importadas) por
+día × grado de calidad × Catalunya × dispositivo × cuenta EMBIMOS, y guarda
+aparte los pares mes × usuario para poder contar observadores. Las vistas
+anual, mensual, diaria y de comparación de periodos de 1_observations.py son
+sumas sobre el cubo, que tiene unos pocos miles de filas.
+"""
+
+import os
+import sys
+
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.storage import typed
+
+CUBE_FILE = "minka_obs_cube.csv"
+USERS_FILE = "minka_obs_month_users.csv"
+DIMENSIONS = ["date", "quality_grade", "catalunya", "device", "embimos"]
+
+# Cuentas del equipo (EMBIMOS)
+EMBIMOS_USERS = [
+    "xasalva",
+    "bertinhaco",
+    "jaume-piera",
+    "sonialinan",
+    "adrisoacha",
+    "irodero",
+    "anomalia",
+    "aluna",
+    "carlosrodero",
+    "lydia",
+    "elibonfill",
+    "marinatorresgi",
+    "meri",
+    "verificador_1",
+    "loreto_rodriguez",
+    "minkatutor",
+    "minkatest",
+    "anonimousminkacontributor",
+    "minkauser10",
+    "test_minka_athens",
+    "infominka",
+    "admin",
+]
+
+
+def build_cube(df_obs: pd.DataFrame, embimos_users: list = EMBIMOS_USERS) -> tuple:
+    """
+    Cubo (`DIMENSIONS` + `observations`) y pares (`month`, `user_id`) de las
+    observaciones no importadas de `df_obs`.
+    """
+    obs = df_obs[df_obs["imported"] == False]
+    # Fecha local, como la leen los dashboards
+    created_at = typed(obs[["created_at"]])["created_at"]
+    keys = pd.DataFrame(
+        {
+            "date": created_at.dt.normalize(),
+            "quality_grade": obs["quality_grade"].astype(str),
+            "catalunya": obs["catalunya"].astype(bool),
+            "device": obs["device"].astype(str),
+            "embimos": obs["user_login"].isin(embimos_users),
+        }
+    )
+    cube = keys.groupby(DIMENSIONS).size().reset_index(name="observations")
+
+    month_users = pd.DataFrame(
+        {
+            "month": created_at.dt.to_period("M").dt.to_timestamp(),
+            "user_id": obs["user_id"],
+        }
+    ).drop_duplicates()
+    return cube, month_users.sort_values(["month", "user_id"]).reset_index(drop=True)
+
+
+def read_cube(directory: str) -> tuple:
+    """
+    Cubo y pares mes × usuario guardados en `directory`/data.
+    """
+    cube = pd.read_csv(f"{directory}/data/{CUBE_FILE}", parse_dates=["date"])
+    month_users = pd.read_csv(f"{directory}/data/{USERS_FILE}", parse_dates=["month"])
+    return cube, month_users
+
+
+def _measures(cube: pd.DataFrame) -> pd.DataFrame:
+    # Observaciones de cada fila del cubo repartidas en los KPIs
+    n = cube["observations"]
+    return pd.DataFrame(
+        {
+            "total_observations": n,
+            "research_quality": n.where(cube["quality_grade"] == "research", 0),
+            "in_catalunya": n.where(cube["catalunya"], 0),
+            "out_catalunya": n.where(~cube["catalunya"], 0),
+            "web": n.where(cube["device"] == "web", 0),
+            "app": n.where(cube["device"] == "app", 0),
+            "embimos": n.where(cube["embimos"], 0),
+            "not_embimos": n.where(~cube["embimos"], 0),
+        }
+    )
+
+
+def rollup(cube: pd.DataFrame, month_users: pd.DataFrame, period: str = "year"):
+    """
+    KPIs por año (`period="year"`) o por año y mes (`period="month"`), con el
+    número de observadores distintos de cada periodo.
+    """
+
+    def periods(dates):
+        by = [dates.dt.year.rename("year")]
+        if period == "month":
+            by.append(dates.dt.month.rename("month"))
+        return by
+
+    grouped = _measures(cube).groupby(periods(cube["date"])).sum()
+    observers = month_users.groupby(periods(month_users["month"]))["user_id"]
+    grouped["observers"] = observers.nunique().reindex(grouped.index, fill_value=0)
+
+    columns = [
+        "total_observations",
+        "research_quality",
+        "in_catalunya",
+        "out_catalunya",
+        "web",
+        "app",
+        "observers",
+        "embimos",
+        "not_embimos",
+    ]
+    return grouped[columns].reset_index()
+
+
+def cumulative_daily(cube: pd.DataFrame) -> pd.DataFrame:
+    """
+    KPIs acumulados día a día.
+    """
+    daily = _measures(cube).groupby(cube["date"]).sum().cumsum()
+    daily = daily.rename(
+        columns={
+            "total_observations": "cumulative_total",
+            "research_quality": "cumulative_research",
+            "in_catalunya": "cumulative_catalonia",
+            "out_catalunya": "cumulative_outside_catalonia",
+            "web": "cumulative_web",
+            "app": "cumulative_app",
+            "embimos": "cumulative_embimos",
+            "not_embimos": "cumulative_not_embimos",
+        }
+    )
+    return daily.reset_index()
+
+
+def period_total(cube: pd.DataFrame, start, end) -> int:
+    """
+    Observaciones creadas entre los días `start` y `end`, ambos incluidos.
+    """
+    in_period = (cube["date"] >= start) & (cube["date"] <= end)
+    return int(cube.loc[in_period, "observations"].sum())
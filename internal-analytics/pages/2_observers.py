@@ -4,6 +4,7 @@ from datetime import datetime
 import pandas as pd
 import plotly.express as px
 import streamlit as st
+from data_cache import file_version, load_accounts, load_obs
 
 try:
     directory = f"{os.environ['DASHBOARDS']}/internal-analytics"
@@ -56,7 +57,7 @@ def convert_df(df):
 
 # @st.cache_data(ttl=360)
 def get_observers(df_obs):
-    df_users = pd.read_csv(f"{directory}/data/minka_accounts.csv")
+    df_users = load_accounts(file_version("minka_accounts.csv"))
     df_observers = (
         df_users[df_users.observations_count > 0].reset_index(drop=True).copy()
     )
@@ -67,7 +68,9 @@ def get_observers(df_obs):
 
     # Contar el número de observaciones con "web" y "app" por usuario
     obs_device_counts = (
-        df_obs.groupby(["user_id", "device"]).size().unstack(fill_value=0)
+        df_obs.groupby(["user_id", "device"], observed=True)
+        .size()
+        .unstack(fill_value=0)
     )
 
     # Renombrar columnas
@@ -117,7 +120,6 @@ def get_observers(df_obs):
 def get_active_users(df_observers, df_obs, activity_period=365):
     # Obtener la fecha de referencia
     last_days = pd.Timestamp.today() - pd.Timedelta(days=activity_period)
-    df_obs["created_at"] = pd.to_datetime(df_obs["created_at"])
 
     # Crear una lista con los usuarios que han subido observaciones en los últimos 365 días
     active_users = set(df_obs[df_obs["created_at"] >= last_days]["user_id"])
@@ -282,12 +284,11 @@ def get_avg_per_user(df_obs, period="M"):
     Retorna:
     DataFrame con 'period' y 'avg_observations'.
     """
-    # Asegurar que created_at es de tipo datetime
-    df_obs["created_at"] = pd.to_datetime(df_obs["created_at"])
-
     # Contar observaciones por usuario en cada periodo
     df_user_period = (
-        df_obs.groupby([df_obs["created_at"].dt.to_period(period), "user_login"])
+        df_obs.groupby(
+            [df_obs["created_at"].dt.to_period(period), "user_login"], observed=True
+        )
         .size()
         .reset_index(name="observations")
     )
@@ -341,13 +342,10 @@ if __name__ == "__main__":
 
     # Carga de observaciones
     # Eliminamos observaciones importadas y de cuentas excluidas
-    if "df_obs" not in st.session_state or st.session_state.df_obs is None:
-        df_obs = pd.read_csv(f"{directory}/data/minka_obs.csv")
-        df_obs_filtered = df_obs[df_obs.imported == False]
-        df_obs_filtered = df_obs_filtered[
-            -df_obs_filtered.user_login.isin(EXCLUDE_USERS)
-        ].copy()
-        st.session_state.df_obs = df_obs_filtered
+    # (compartidas entre sesiones)
+    df_obs = load_obs(
+        file_version("minka_obs.csv"), tuple(EXCLUDE_USERS), exclude_embimos=True
+    )
 
     # Extracción de observadores
     st.markdown("**Period of days to be considered active an user:**")
@@ -361,10 +359,10 @@ if __name__ == "__main__":
         )
 
     # Excluye usuarios del listado
-    df_observers = get_observers(st.session_state.df_obs)
+    df_observers = get_observers(df_obs)
 
     df_observers = get_active_users(
-        df_observers, st.session_state.df_obs, activity_period=activity_period
+        df_observers, df_obs, activity_period=activity_period
     )
     df_observers["created_at"] = pd.to_datetime(df_observers["created_at"]).dt.date
 
@@ -393,10 +391,10 @@ if __name__ == "__main__":
         key="period_chart",
     )
     if period_chart == "year":
-        df_avg = get_avg_per_user(st.session_state.df_obs, period="Y")
+        df_avg = get_avg_per_user(df_obs, period="Y")
 
     elif period_chart == "month":
-        df_avg = get_avg_per_user(st.session_state.df_obs, period="M")
+        df_avg = get_avg_per_user(df_obs, period="M")
 
     create_user_line_chart(df_avg, "avg_obs_by_user_yearly")
 
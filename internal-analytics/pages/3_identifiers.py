@@ -1,12 +1,23 @@
-import calendar
 import os
-from datetime import datetime, timedelta
+from datetime import datetime
 
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-import requests
 import streamlit as st
+from data_cache import (
+    file_version,
+    identifications_table,
+    load_identifications,
+    load_identifiers_by_period,
+    load_user_months,
+)
+from identifier_stats import (
+    PERIODS_FILE,
+    USER_MONTHS_FILE,
+    top_users_timeline,
+    user_timeline,
+)
 
 try:
     directory = f"{os.environ['DASHBOARDS']}/internal-analytics"
@@ -58,86 +69,6 @@ def convert_df(df):
     return df.to_csv(index=False).encode("utf-8")
 
 
-def get_identifiers_by_period(period, type="unique"):
-    session = requests.Session()
-
-    if type == "unique":
-        # year
-        if len(str(period).split("-")) == 1:
-            year = str(period).split("-")[0]
-            url_identifiers = f"https://api.minka-sdg.org/v1/observations/identifiers?created_d1={year}-01-01&created_d2={year}-12-31"
-            response = session.get(url_identifiers)
-
-        # year-month
-        if len(str(period).split("-")) == 2:
-            year = str(period).split("-")[0]
-            month = str(period).split("-")[1]
-            _, last_day = calendar.monthrange(int(year), int(month))
-
-            start_date = f"{year}-{month}-01"
-            end_date = f"{year}-{month}-{last_day}"
-
-            url_identifiers = f"https://api.minka-sdg.org/v1/observations/identifiers?created_d1={start_date}&created_d2={end_date}"
-            response = session.get(url_identifiers)
-
-        if response.status_code == 200:
-            results = response.json()["results"]
-            identifiers = []
-            for result in results:
-                data = {}
-                data["identifier_id"] = result["user_id"]
-                data["identifier_name"] = result["user"]["login"]
-                data["number_identifications"] = result["count"]
-                data["created_at"] = result["user"]["created_at"]
-                identifiers.append(data)
-            identifiers_df = pd.DataFrame(identifiers)
-            identifiers_df = identifiers_df[
-                identifiers_df.identifier_name.isin(EXCLUDE_USERS) == False
-            ].reset_index(drop=True)
-            return len(identifiers_df)
-
-        else:
-            print(f"Error fetching data for {period}")
-            return None
-    elif type == "cumulative":
-        # year
-        if len(str(period).split("-")) == 1:
-            year = str(period).split("-")[0]
-            url_identifiers = f"https://api.minka-sdg.org/v1/observations/identifiers?created_d2={year}-12-31"
-            response = session.get(url_identifiers)
-
-        # year-month
-        if len(str(period).split("-")) == 2:
-            year = str(period).split("-")[0]
-            month = str(period).split("-")[1]
-            _, last_day = calendar.monthrange(int(year), int(month))
-
-            end_date = f"{year}-{month}-{last_day}"
-
-            url_identifiers = f"https://api.minka-sdg.org/v1/observations/identifiers?created_d2={end_date}"
-            response = session.get(url_identifiers)
-
-        if response.status_code == 200:
-            results = response.json()["results"]
-            identifiers = []
-            for result in results:
-                data = {}
-                data["identifier_id"] = result["user_id"]
-                data["identifier_name"] = result["user"]["login"]
-                data["number_identifications"] = result["count"]
-                data["created_at"] = result["user"]["created_at"]
-                identifiers.append(data)
-            identifiers_df = pd.DataFrame(identifiers)
-            identifiers_df = identifiers_df[
-                identifiers_df.identifier_name.isin(EXCLUDE_USERS) == False
-            ].reset_index(drop=True)
-            return len(identifiers_df)
-
-        else:
-            print(f"Error fetching data for {period}")
-            return None
-
-
 def create_user_bar_chart(df, key):
     max_value = df["identifiers"].max()
     fig = px.bar(
@@ -348,81 +279,26 @@ if __name__ == "__main__":
         key="unique_selector",
     )
 
-    # Dataframe por año
-    if period_selected == "year":
-        if "df_year" not in st.session_state or st.session_state.df_year is None:
-            current_year = datetime.now().year
-            df_year = pd.DataFrame({"period": list(range(2022, current_year + 1))})
-            df_year["identifiers"] = df_year["period"].apply(get_identifiers_by_period)
-            st.session_state.df_year = df_year
-        create_user_bar_chart(st.session_state.df_year, key="identifiers_by_year")
-
-    # Dataframe por mes
-    elif period_selected == "month":
-        if "df_month" not in st.session_state or st.session_state.df_month is None:
-            end_date = (datetime.now() + timedelta(days=30)).strftime("%Y-%m")
-            date_range = pd.date_range(start="2022-04", end=end_date, freq="ME")
-            year_month = [date.strftime("%Y-%m") for date in date_range]
-            df_month = pd.DataFrame({"period": year_month})
-            df_month["identifiers"] = df_month["period"].apply(
-                get_identifiers_by_period
-            )
-            st.session_state.df_month = df_month
-        create_user_bar_chart(st.session_state.df_month, key="identifiers_by_month")
+    df_periods = load_identifiers_by_period(file_version(PERIODS_FILE))
+    df_periods = df_periods[df_periods["frequency"] == period_selected]
+    create_user_bar_chart(
+        df_periods[["period", "identifiers"]].reset_index(drop=True),
+        key=f"identifiers_by_{period_selected}",
+    )
 
     # Evolución en número de usuarios
     st.header("Unique identifiers in MINKA")
-
-    # Acumulativo por año
-    if period_selected == "year":
-        if (
-            "df_year_cumulative" not in st.session_state
-            or st.session_state.df_year_cumulative is None
-        ):
-            current_year = datetime.now().year
-            df_year_cumulative = pd.DataFrame(
-                {"period": list(range(2022, current_year + 1))}
-            )
-
-            df_year_cumulative["identifiers"] = df_year_cumulative["period"].apply(
-                lambda x: get_identifiers_by_period(x, "cumulative")
-            )
-            st.session_state.df_year_cumulative = df_year_cumulative
-
-        create_user_line_chart(
-            st.session_state.df_year_cumulative, key="identifiers_by_year_cumulative"
-        )
-
-    # Dataframe por mes
-    elif period_selected == "month":
-        if (
-            "df_month_cumulative" not in st.session_state
-            or st.session_state.df_month_cumulative is None
-        ):
-            end_date = (datetime.now() + timedelta(days=30)).strftime("%Y-%m")
-            date_range = pd.date_range(start="2022-04", end=end_date, freq="ME")
-            year_month = [date.strftime("%Y-%m") for date in date_range]
-            df_month_cumulative = pd.DataFrame({"period": year_month})
-            df_month_cumulative["identifiers"] = df_month_cumulative["period"].apply(
-                lambda x: get_identifiers_by_period(x, "cumulative")
-            )
-            st.session_state.df_month_cumulative = df_month_cumulative
-        create_user_line_chart(
-            st.session_state.df_month_cumulative, key="identifiers_by_month_cumulative"
-        )
+    create_user_line_chart(
+        df_periods[["period", "cumulative"]]
+        .rename(columns={"cumulative": "identifiers"})
+        .reset_index(drop=True),
+        key=f"identifiers_by_{period_selected}_cumulative",
+    )
 
     # Identifications by user name
     st.header("Identifications by user name")
-    df_identifications = pd.read_csv(f"{directory}/data/minka_identifications.csv")
-    print(df_identifications.columns)
-    df_identifications = df_identifications.sort_values(
-        by="id", ascending=True
-    ).reset_index(drop=True)
-    df_identifications["created_at"] = pd.to_datetime(
-        df_identifications["created_at"], utc=True
-    )
-
-    identifiers_name = [""] + sorted(df_identifications["user.login"].unique())
+    user_months = load_user_months(file_version(USER_MONTHS_FILE))
+    identifiers_name = [""] + user_months.index.tolist()
 
     col1, col2 = st.columns([1, 3])
     with col1:
@@ -431,83 +307,17 @@ if __name__ == "__main__":
         )
 
     if user_login != "":
-        df_user = (
-            df_identifications.loc[
-                df_identifications["user.login"] == user_login, "created_at"
-            ]
-            .dt.to_period("M")
-            .value_counts()
-            .sort_index()
-            .reset_index()
-        )
-
-        df_user.columns = ["period", "identifications"]
-        df_user["period"] = df_user["period"].astype(str)
-
-        # Generar todos los meses desde el primer hasta el último en el dataset
-        end_date = (
-            pd.Timestamp.now().normalize()
-        )  # Fecha de hoy a medianoche (asegura el mes actual)
-        full_range = pd.date_range(
-            start="2022-04-01", end=end_date, freq="MS"
-        ).strftime("%Y-%m")
-
-        # Crear DataFrame con todos los meses
-        df_full = pd.DataFrame(full_range, columns=["period"])
-
-        # Hacer un merge con los datos originales, rellenando los NaN con 0
-        df_user = df_full.merge(df_user, on="period", how="left").fillna(0)
-
-        # Convertir identificaciones a int (porque fillna lo convierte en float)
-        df_user["identifications"] = df_user["identifications"].astype(int)
         create_user_line_chart(
-            df_user, key=f"{user_login}_identifications", y_column="identifications"
+            user_timeline(user_months, user_login),
+            key=f"{user_login}_identifications",
+            y_column="identifications",
         )
 
     else:
-        # Obtener los 20 usuarios con más identificaciones
-        top_users = (
-            df_identifications["user.login"].value_counts().head(10).index.tolist()
-        )
-
-        df_filtered = df_identifications[
-            df_identifications["user.login"].isin(top_users)
-        ]
-
-        # Calcular identificaciones por mes y usuario
-        df_top_users = (
-            df_filtered.groupby(
-                [df_filtered["created_at"].dt.to_period("M"), "user.login"]
-            )
-            .size()
-            .reset_index(name="identifications")
-        )
-
-        df_top_users["period"] = df_top_users["created_at"].astype(str)
-        df_top_users.drop(columns=["created_at"], inplace=True)
-
-        # Generar rango de fechas completo
-        full_range = pd.date_range(
-            start="2022-04-01", end=pd.Timestamp.now(), freq="MS"
-        ).strftime("%Y-%m")
-        df_full = pd.DataFrame(full_range, columns=["period"])
-
-        # Asegurar que cada usuario tenga todos los meses en su serie de datos
-        users = df_top_users["user.login"].unique()
-        df_full = (
-            df_full.assign(key=1)
-            .merge(pd.DataFrame(users, columns=["user.login"]).assign(key=1), on="key")
-            .drop("key", axis=1)
-        )
-
-        # Unir los datos reales con el rango completo
-        df_users = df_full.merge(
-            df_top_users, on=["period", "user.login"], how="left"
-        ).fillna(0)
-        df_top_users["identifications"] = df_top_users["identifications"].astype(int)
-
+        # Los 10 usuarios con más identificaciones
+        top_users, df_top_users = top_users_timeline(user_months, 10)
         create_user_line_chart(
-            df_top_users,
+            df_top_users.reset_index(drop=True),
             key="top_users_identifications",
             y_column="identifications",
             top_users=top_users,
@@ -515,6 +325,7 @@ if __name__ == "__main__":
 
     # Total tables to download
     st.header("Identifiers (users with at least one identification)")
+    df_identifications = load_identifications(identifications_table().version())
 
     col1, col2, col3 = st.columns([3, 1, 7])
 
@@ -1,9 +1,9 @@
 import os
 from datetime import datetime, timedelta
 
-import pandas as pd
 import plotly.express as px
 import streamlit as st
+from data_cache import file_version, load_projects
 
 try:
     directory = f"{os.environ['DASHBOARDS']}/internal-analytics"
@@ -51,14 +51,13 @@ EXCLUDE_USERS = [
 
 
 @st.cache_data(ttl=360)
-def create_obs_grouped_df(df_projects, period="year"):
-    # Convertir la columna de fecha a datetime
-    df_projects["created_at"] = pd.to_datetime(df_projects["created_at"])
+def create_obs_grouped_df(_df_projects, version, activity_period, period="year"):
+    # Sólo las columnas de la agrupación, con la actividad de este periodo
+    df_projects = _df_projects[["project_id", "year", "quarter", "embimos"]].assign(
+        is_active=is_active_projects(_df_projects, activity_period)
+    )
 
     if period == "year":
-        # Extraer el año
-        df_projects["year"] = df_projects["created_at"].dt.year
-
         # Agrupar por año y calcular los KPIs adicionales
         df_grouped = (
             df_projects.groupby("year")
@@ -76,10 +75,6 @@ def create_obs_grouped_df(df_projects, period="year"):
         )
 
     elif period == "quarter":
-        # Extraer año y trimestre
-        df_projects["year"] = df_projects["created_at"].dt.year
-        df_projects["quarter"] = df_projects["created_at"].dt.quarter
-
         # Agrupar por año y trimestre y calcular los KPIs
         df_grouped = (
             df_projects.groupby(["year", "quarter"])
@@ -100,10 +95,17 @@ def create_obs_grouped_df(df_projects, period="year"):
     return df_grouped
 
 
+def is_active_projects(df_projects, activity_period):
+    # Proyectos con alguna observación en los últimos `activity_period` días
+    return df_projects["last_observation"] > datetime.now() - timedelta(
+        days=activity_period
+    )
+
+
 if __name__ == "__main__":
-    if "df_project" not in st.session_state or st.session_state.df_project is None:
-        df_project = pd.read_csv(f"{directory}/data/minka_projects.csv")
-        st.session_state.df_project = df_project
+    # Proyectos compartidos entre sesiones
+    version = file_version("minka_projects.csv")
+    df_project = load_projects(version, tuple(EXCLUDE_USERS))
 
     # Project Retention Rate or active projects
     st.markdown("**Period of days to be considered active a project:**")
@@ -116,19 +118,8 @@ if __name__ == "__main__":
             label_visibility="collapsed",
         )
 
-    st.session_state.df_project["last_observation"] = pd.to_datetime(
-        st.session_state.df_project["last_observation"]
-    )
-    st.session_state.df_project["is_active"] = st.session_state.df_project[
-        "last_observation"
-    ] > datetime.now() - timedelta(days=activity_period)
-
-    st.session_state.df_project["embimos"] = st.session_state.df_project["admin"].isin(
-        EXCLUDE_USERS
-    )
-
     st.header("Projects created by year")
-    df_year = create_obs_grouped_df(st.session_state.df_project, period="year")
+    df_year = create_obs_grouped_df(df_project, version, activity_period, period="year")
 
     fig_year = px.bar(
         df_year,
@@ -153,7 +144,9 @@ if __name__ == "__main__":
     st.plotly_chart(fig_year)
 
     st.header("Projects created quarterly")
-    df_quarter = create_obs_grouped_df(st.session_state.df_project, period="quarter")
+    df_quarter = create_obs_grouped_df(
+        df_project, version, activity_period, period="quarter"
+    )
     fig_quarter = px.bar(
         df_quarter,
         x=df_quarter["year"].astype(str) + "-Q" + df_quarter["quarter"].astype(str),
@@ -222,11 +215,12 @@ if __name__ == "__main__":
             ),
         )
     with col4:
-        list_users = [""] + sorted(st.session_state.df_project["admin"].unique())
+        list_users = [""] + sorted(df_project["admin"].unique())
         user_name = st.selectbox("Creator of the project", list_users)
 
-    print(st.session_state.df_project.columns)
-    df_result = st.session_state.df_project.copy()
+    df_result = df_project.assign(
+        is_active=is_active_projects(df_project, activity_period)
+    )
     if year_option != "":
         df_result = df_result[df_result["created_at"].dt.year == int(year_option)]
     if quarter_option != "":
@@ -265,14 +259,10 @@ if __name__ == "__main__":
                 "embimos",
             ]
         ].assign(
-            created_at=st.session_state.df_project["created_at"].dt.date,
-            last_observation=st.session_state.df_project["last_observation"].dt.date,
-            is_active=st.session_state.df_project["is_active"].map(
-                {True: "YES", False: "NO"}
-            ),
-            embimos=st.session_state.df_project["embimos"].map(
-                {True: "YES", False: "NO"}
-            ),
+            created_at=df_result["created_at"].dt.date,
+            last_observation=df_result["last_observation"].dt.date,
+            is_active=df_result["is_active"].map({True: "YES", False: "NO"}),
+            embimos=df_result["embimos"].map({True: "YES", False: "NO"}),
         ),
         column_config={
             "project_url": st.column_config.LinkColumn(
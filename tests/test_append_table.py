@@ -0,0 +1,67 @@
+import os
+import sys
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, "internal-analytics"))
+from common.append_table import AppendTable
+
+
+def _ids(start, end):
+    return pd.DataFrame({"id": range(start, end), "user.login": "user"})
+
+
+def test_write_part_replaces_contained_parts(tmp_path):
+    table = AppendTable(str(tmp_path / "table"))
+    table.write_part(1, 11, _ids(1, 11))
+    table.write_part(11, 16, _ids(11, 16))
+    # El último lote se vuelve a descargar con más ids
+    table.write_part(11, 21, _ids(11, 21))
+
+    assert [(start, end) for start, end, __ in table.parts()] == [(1, 11), (11, 21)]
+    assert table.read()["id"].tolist() == list(range(1, 21))
+
+
+def test_read_drops_overlapping_ids(tmp_path):
+    table = AppendTable(str(tmp_path / "table"))
+    table.write_part(1, 16, _ids(1, 16))
+    # Parte que solapa sin contener a la anterior
+    table.write_part(11, 21, _ids(11, 21))
+
+    df = table.read()
+    assert df["id"].is_unique
+    assert len(df) == 20
+
+
+def test_download_resumes_after_interruption(tmp_path, monkeypatch):
+    monkeypatch.setenv("DASHBOARDS", str(tmp_path))
+    import download_identifications as di
+
+    monkeypatch.setattr(di, "directory", str(tmp_path / "internal-analytics"))
+    monkeypatch.setattr(di, "first_id", 1)
+    monkeypatch.setattr(di, "batch_size", 1000)
+    max_id = {"value": 3500}
+    monkeypatch.setattr(di, "_get_page", lambda params: [{"id": max_id["value"]}])
+
+    failing = {1001}
+
+    def download_batch(start, end):
+        if start in failing:
+            raise RuntimeError("interrumpido")
+        return _ids(start, end)
+
+    monkeypatch.setattr(di, "download_batch", download_batch)
+
+    # Primera ejecución: falla un lote intermedio y el último queda parcial
+    df = di.download_identifications()
+    assert len(df) == 3500 - 1000
+
+    # Segunda ejecución con ids nuevos: se rehacen el lote fallido y el último
+    failing.clear()
+    max_id["value"] = 4200
+    df = di.download_identifications()
+    assert df["id"].is_unique
+    assert df["id"].tolist() == list(range(1, 4201))
+    assert len(di.identifications_table().read()) == 4200
@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.counts import ENDPOINTS, counts_wide, get_counts
+
+
+def test_get_counts_without_jobs():
+    df = get_counts([])
+    assert df.empty
+    assert list(df.columns) == ["endpoint", "total_results"]
+
+
+def test_counts_wide_without_jobs():
+    df = counts_wide(get_counts([]), index="participant")
+    assert df.empty
+    assert list(df.columns) == ["participant", *ENDPOINTS]
+
+    df = counts_wide(get_counts([]), index=["city", "month"])
+    assert list(df.columns) == ["city", "month", *ENDPOINTS]
+
+
+def test_counts_wide_without_jobs_merges():
+    # Como en get_participation_df con un proyecto sin participantes
+    pt_users = pd.DataFrame({"participant": pd.Series(dtype=object)})
+    df_counts = counts_wide(get_counts([]), index="participant")
+    merged = pd.merge(pt_users, df_counts, on="participant", how="left")
+    assert merged[["participant", "identifiers", "species"]].empty